@@ -32,6 +32,8 @@ class TestPlatAdminSite(AdminSite):
             '用例接口': 9,
             '项目成员': 10,
             '部署环境': 11,
+            '用例执行统计': 12,
+            '用例接口执行统计': 13,
         }
         # Sort the models alphabetically within each app.
         for app in app_list:
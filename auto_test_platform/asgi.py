@@ -9,8 +9,26 @@ https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+from asgiref.sync import ThreadSensitiveContext
+from asgiref.wsgi import WsgiToAsgi
+from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'auto_test_platform.settings')
 
-application = get_asgi_application()
+# Django 4.0 的 ASGIHandler 在事件循环中同步迭代 StreamingHttpResponse，流式响应中的数据库查询
+# （批次导出等）会抛出 SynchronousOnlyOperation；因此除 SSE 端点外，其余请求仍按 WSGI 方式在线程中处理
+django_application = WsgiToAsgi(get_wsgi_application())
+
+# 需在 Django 初始化之后导入
+from test_plt.utils import events  # noqa: E402
+
+
+async def application(scope, receive, send):
+    """
+    批次实时事件的 SSE 端点直接由原生 ASGI 应用处理（长连接不占用 Django 的同步线程），其余请求交给 Django
+    """
+    if scope['type'] == 'http' and events.PATH_RE.match(scope['path']):
+        return await events.sse_app(scope, receive, send)
+    # 每个请求使用独立的线程（否则所有请求共用同一个线程，依次处理）
+    async with ThreadSensitiveContext():
+        return await django_application(scope, receive, send)
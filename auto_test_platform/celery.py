@@ -1,5 +1,7 @@
 import os
+import time
 from celery import Celery
+from celery.signals import before_task_publish, celeryd_init, worker_init, worker_process_shutdown
 
 # 设置Celery需要环境变量
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'auto_test_platform.settings')
@@ -14,6 +16,57 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 # 自动从已注册到Django的app中发现任务，通常在单独的tasks.py模块中定义所有任务
 app.autodiscover_tasks()
 
+
+@before_task_publish.connect
+def stamp_enqueued_at(headers=None, **kwargs):
+    """
+    为任务消息打上入队时间戳，worker 通过 task.request.enqueued_at 计算排队耗时
+    """
+    if headers is not None:
+        headers.setdefault('enqueued_at', time.time())
+
+
+@celeryd_init.connect
+def configure_lane_concurrency(conf=None, options=None, **kwargs):
+    """
+    worker 只消费单个任务通道（-Q interactive）时，按 TEST_PLT_WORKER_LANES 设置该通道的并发数
+    """
+    from django.conf import settings
+    queues = options.get('queues') or []
+    if isinstance(queues, str):
+        queues = queues.split(',')
+    if len(queues) != 1 or options.get('concurrency'):
+        return
+    concurrency = settings.TEST_PLT_WORKER_LANES.get(queues[0])
+    if concurrency:
+        conf.worker_concurrency = concurrency
+
+
+@worker_init.connect
+def start_metrics_server(**kwargs):
+    """
+    worker 启动时开启 Prometheus 指标端口，聚合所有子进程写入 PROMETHEUS_MULTIPROC_DIR 的指标
+    """
+    from django.conf import settings
+    from prometheus_client import REGISTRY, CollectorRegistry, multiprocess, start_http_server
+    if not settings.TEST_PLT_METRICS_WORKER_PORT:
+        return
+    registry = REGISTRY
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    start_http_server(settings.TEST_PLT_METRICS_WORKER_PORT, registry=registry)
+
+
+@worker_process_shutdown.connect
+def mark_metrics_process_dead(pid=None, **kwargs):
+    """
+    子进程退出时清理其 gauge 数据，避免 livesum 指标残留
+    """
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(pid or os.getpid())
+
 #
 # # 一个测试任务
 # @app.task(bind=True)
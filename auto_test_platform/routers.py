@@ -0,0 +1,26 @@
+from django.db import DEFAULT_DB_ALIAS
+
+from test_plt.utils import replica
+
+
+class ReplicaRouter:
+    """
+    在 replica.reads() 范围内（且从库延迟在阈值内）从从库读取，其余读取和所有写入使用主库
+    """
+    def db_for_read(self, model, **hints):
+        if replica.active():
+            return replica.ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        # 从从库读出的对象保存时也要写主库（不返回时 Django 会沿用对象读取时的数据库）
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # 主从数据相同
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == replica.ALIAS:
+            return False
+        return None
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/3.2/ref/settings/
 
 from pathlib import Path
 import environ
+from kombu import Queue
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -64,6 +65,8 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'test_plt.middlewares.EnsureProjectIdMiddleware',
+    # 放在最后：会话、登录用户已在前面的中间件中从主库读取
+    'test_plt.middlewares.ReplicaReadMiddleware',
 ]
 
 ROOT_URLCONF = 'auto_test_platform.urls'
@@ -93,6 +96,23 @@ WSGI_APPLICATION = 'auto_test_platform.wsgi.application'
 DATABASES = {
     'default': env.db()
 }
+# 只读副本（从库），配置后报表、执行履历浏览等只读请求从从库读取（见 test_plt/utils/replica.py）
+if env.str('DATABASE_REPLICA_URL', default=''):
+    DATABASES['replica'] = env.db('DATABASE_REPLICA_URL')
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+DATABASE_ROUTERS = ['auto_test_platform.routers.ReplicaRouter']
+# 从库复制延迟超过该秒数时读取回退到主库；延迟的检查间隔（秒）
+TEST_PLT_REPLICA_MAX_LAG = env.int('TEST_PLT_REPLICA_MAX_LAG', default=10)
+TEST_PLT_REPLICA_LAG_CHECK_INTERVAL = env.int('TEST_PLT_REPLICA_LAG_CHECK_INTERVAL', default=5)
+# 从从库读取的只读页面（GET 请求的路径前缀）
+TEST_PLT_REPLICA_PATHS = env.list('TEST_PLT_REPLICA_PATHS', default=[
+    '/admin/test_plt/apirunlog/',
+    '/admin/test_plt/caserunlog/',
+    '/admin/test_plt/casesuiterunlog/',
+    '/admin/test_plt/testbatch/',
+    '/admin/test_plt/casestat/',
+    '/admin/test_plt/caseapidefstat/',
+])
 
 
 # Password validation
@@ -161,6 +181,11 @@ if not LOG_DIR.exists():
 ERROR_LOG_FILE = LOG_DIR / env.str('ERROR_LOG_FILE', default='error.log')
 INFO_LOG_FILE = LOG_DIR / env.str('INFO_LOG_FILE', default='info.log')
 
+# 链路追踪导出方式：none（不导出）、file（JSON Lines文件）、otlp（OTLP/HTTP JSON）
+TEST_PLT_TRACE_EXPORTER = env.str('TEST_PLT_TRACE_EXPORTER', default='none')
+TEST_PLT_TRACE_FILE = LOG_DIR / env.str('TEST_PLT_TRACE_FILE', default='trace.jsonl')
+TEST_PLT_TRACE_OTLP_ENDPOINT = env.str('TEST_PLT_TRACE_OTLP_ENDPOINT', default='http://localhost:4318/v1/traces')
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -227,6 +252,8 @@ CELERY_RESULT_BACKEND = 'django-db'
 
 # 为任务设置超时时间，单位秒，即超时中止，执行下个任务
 CELERY_TASK_TIME_LIMIT = env.int('CELERY_TASK_TIME_LIMIT', default=600)  # 千万注意根据项目时间情况计算！！
+# 软时限：先于硬时限抛出 SoftTimeLimitExceeded，使批次能保存已执行部分的结果后退出
+CELERY_TASK_SOFT_TIME_LIMIT = env.int('CELERY_TASK_SOFT_TIME_LIMIT', default=CELERY_TASK_TIME_LIMIT - 30)
 
 # 为存储结果设置过期日期，默认你为1天。设置为0，存储结果不会过期
 # 如果beat开启，celery每天会自动清除过期记录
@@ -236,6 +263,124 @@ CELERY_RESULT_EXPIRES = env.int('CELERY_RESULT_EXPIRES', default=259200)
 # CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
 CELERY_BEAT_SCHEDULER = 'auto_test_platform.schedulers:TestPltDatabaseScheduler'
 
+# 任务通道：页面上手动执行（interactive）、计划任务（periodic）、压测（loadtest）分别使用独立队列，
+# 互不排队。可为每个通道部署专用worker，例如：
+#   celery -A auto_test_platform worker -Q interactive -n interactive@%h
+#   celery -A auto_test_platform worker -Q periodic -n periodic@%h
+#   celery -A auto_test_platform worker -Q loadtest -n loadtest@%h
+#   celery -A auto_test_platform worker -Q celery -n default@%h   # 其他后台任务
+# 只消费单个通道的worker，并发数取 TEST_PLT_WORKER_LANES 中的配置（命令行 -c 优先）
+CELERY_TASK_DEFAULT_QUEUE = 'celery'
+CELERY_TASK_QUEUES = (
+    Queue('celery', routing_key='celery'),
+    Queue('interactive', routing_key='interactive', queue_arguments={'x-max-priority': 10}),
+    Queue('periodic', routing_key='periodic', queue_arguments={'x-max-priority': 10}),
+    Queue('loadtest', routing_key='loadtest', queue_arguments={'x-max-priority': 10}),
+)
+CELERY_TASK_ROUTES = {
+    'test_plt.tasks.run_cases_queue': {'queue': 'interactive', 'priority': 8},
+    'test_plt.tasks.run_suites_queue': {'queue': 'interactive', 'priority': 8},
+    'test_plt.tasks.run_case_periodic': {'queue': 'periodic', 'priority': 4},
+    'test_plt.tasks.run_suites_periodic': {'queue': 'periodic', 'priority': 4},
+    'test_plt.tasks.*_loadtest': {'queue': 'loadtest', 'priority': 2},
+}
+CELERY_TASK_QUEUE_MAX_PRIORITY = 10
+CELERY_TASK_DEFAULT_PRIORITY = 5
+# 每个worker进程只预取一个任务，避免长批次占住排在后面的任务
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+TEST_PLT_WORKER_LANES = {
+    'interactive': env.int('TEST_PLT_LANE_CONCURRENCY_INTERACTIVE', default=4),
+    'periodic': env.int('TEST_PLT_LANE_CONCURRENCY_PERIODIC', default=4),
+    'loadtest': env.int('TEST_PLT_LANE_CONCURRENCY_LOADTEST', default=2),
+}
+
+# 平台自身使用的Redis（公平调度、限流、熔断等多个worker之间共享的状态）
+TEST_PLT_REDIS_URL = env.str('TEST_PLT_REDIS_URL', default='redis://localhost:6379/0')
+
+# 按项目公平调度页面上提交的批次（需要平台Redis，Redis不可用时直接派发）；槽位数一般等于 interactive 通道的worker总并发数
+TEST_PLT_FAIR_SHARE = env.bool('TEST_PLT_FAIR_SHARE', default=False)
+TEST_PLT_DISPATCH_SLOTS = env.int('TEST_PLT_DISPATCH_SLOTS', default=TEST_PLT_WORKER_LANES['interactive'])
+
+# 等待部署环境执行许可（限流/并发上限）的最长时间（秒），超时则接口执行失败
+TEST_PLT_PERMIT_TIMEOUT = env.float('TEST_PLT_PERMIT_TIMEOUT', default=60)
+
+# 部署环境熔断：连续连接失败多少次后熔断（0表示不熔断），熔断多少秒后发送半开探测
+TEST_PLT_BREAKER_FAILURES = env.int('TEST_PLT_BREAKER_FAILURES', default=5)
+TEST_PLT_BREAKER_RESET_TIMEOUT = env.float('TEST_PLT_BREAKER_RESET_TIMEOUT', default=30)
+
+# 批次执行前的环境预检：并发探测批次用到的部署环境，有不可达的环境时批次直接失败
+TEST_PLT_PREFLIGHT = env.bool('TEST_PLT_PREFLIGHT', default=False)
+TEST_PLT_PREFLIGHT_TIMEOUT = env.float('TEST_PLT_PREFLIGHT_TIMEOUT', default=2)
+
+# 按接口自适应的读超时：最近成功执行耗时的 p99 × 系数，限制在上下限之间（秒）；样本不足时使用 TEST_PLT_API_TIMEOUT
+TEST_PLT_ADAPTIVE_TIMEOUT = env.bool('TEST_PLT_ADAPTIVE_TIMEOUT', default=True)
+TEST_PLT_TIMEOUT_FACTOR = env.float('TEST_PLT_TIMEOUT_FACTOR', default=3)
+TEST_PLT_TIMEOUT_FLOOR = env.float('TEST_PLT_TIMEOUT_FLOOR', default=2)
+TEST_PLT_TIMEOUT_CEILING = env.float('TEST_PLT_TIMEOUT_CEILING', default=60)
+# 统计窗口（天）、最多取多少条样本、至少需要多少条样本
+TEST_PLT_TIMEOUT_WINDOW_DAYS = env.int('TEST_PLT_TIMEOUT_WINDOW_DAYS', default=7)
+TEST_PLT_TIMEOUT_SAMPLES = env.int('TEST_PLT_TIMEOUT_SAMPLES', default=500)
+TEST_PLT_TIMEOUT_MIN_SAMPLES = env.int('TEST_PLT_TIMEOUT_MIN_SAMPLES', default=20)
+
+# 批次时限（秒，从worker开始执行算起，0表示不限）：每个接口执行前检查，请求超时时间不超过剩余时间；
+# 默认早于任务软时限，使批次能正常中止并保存结果
+TEST_PLT_BATCH_DEADLINE = env.int('TEST_PLT_BATCH_DEADLINE', default=CELERY_TASK_SOFT_TIME_LIMIT - 30)
+
+# 按历史耗时均衡分片：用例批次的用例数不少于 TEST_PLT_SHARD_MIN_CASES 时拆分为 TEST_PLT_SHARDS 个子任务并行执行
+# （1表示不分片）；没有历史耗时的用例按 TEST_PLT_SHARD_DEFAULT_MS 预估
+TEST_PLT_SHARDS = env.int('TEST_PLT_SHARDS', default=1)
+TEST_PLT_SHARD_MIN_CASES = env.int('TEST_PLT_SHARD_MIN_CASES', default=20)
+TEST_PLT_SHARD_DEFAULT_MS = env.int('TEST_PLT_SHARD_DEFAULT_MS', default=5000)
+
+# 失败优先排序使用的用例得分缓存时间（秒）
+TEST_PLT_ORDER_CACHE_TTL = env.int('TEST_PLT_ORDER_CACHE_TTL', default=600)
+
+# 增量执行：超过多少小时没有执行过的用例，即使没有变化也重新执行
+TEST_PLT_SELECT_FRESHNESS_HOURS = env.int('TEST_PLT_SELECT_FRESHNESS_HOURS', default=24)
+
+# 不稳定用例统计：指数加权系数（越大越偏重最近的执行结果），执行次数达到 TEST_PLT_FLAKY_MIN_RUNS 后不稳定度才完全可信；
+# 不稳定度（0~100）不低于 TEST_PLT_FLAKY_THRESHOLD 的用例视为不稳定
+TEST_PLT_FLAKY_ALPHA = env.float('TEST_PLT_FLAKY_ALPHA', default=0.1)
+TEST_PLT_FLAKY_MIN_RUNS = env.int('TEST_PLT_FLAKY_MIN_RUNS', default=10)
+TEST_PLT_FLAKY_THRESHOLD = env.float('TEST_PLT_FLAKY_THRESHOLD', default=20)
+
+# 耗时退化检测：基线（指数加权）的加权系数、最少样本数；耗时超过基线 Z 个标准差且不低于基线的 MIN_RATIO 倍时记为退化
+TEST_PLT_LATENCY_ALPHA = env.float('TEST_PLT_LATENCY_ALPHA', default=0.05)
+TEST_PLT_LATENCY_MIN_SAMPLES = env.int('TEST_PLT_LATENCY_MIN_SAMPLES', default=20)
+TEST_PLT_LATENCY_Z = env.float('TEST_PLT_LATENCY_Z', default=3)
+TEST_PLT_LATENCY_MIN_RATIO = env.float('TEST_PLT_LATENCY_MIN_RATIO', default=1.5)
+
+# 执行过程中向批次页面实时推送接口/用例的执行结果（Redis 发布订阅 + SSE）；
+# 需要以 ASGI 方式部署（如 Dockerfile 中的 gunicorn -k uvicorn.workers.UvicornWorker auto_test_platform.asgi:application），
+# 以 WSGI 方式部署时 SSE 端点不可用，应设置为 False
+TEST_PLT_LIVE_EVENTS = env.bool('TEST_PLT_LIVE_EVENTS', default=True)
+
+# 执行履历列式归档（离线分析用，见 test_plt/utils/archive.py）：是否定时归档、归档目录
+TEST_PLT_ARCHIVE = env.bool('TEST_PLT_ARCHIVE', default=False)
+TEST_PLT_ARCHIVE_DIR = Path(env.str('TEST_PLT_ARCHIVE_DIR', default='../archive'))
+
+# 固定的周期性后台任务（会被同步到 django_celery_beat 的计划任务表）
+CELERY_BEAT_SCHEDULE = {
+    # 兜底派发：回收异常退出的worker占用的槽位并继续派发
+    'test_plt_dispatch_pump': {
+        'task': 'test_plt.tasks.dispatch_pump',
+        'schedule': 30.0,
+    },
+    # 刷新各接口的自适应超时
+    'test_plt_refresh_timeouts': {
+        'task': 'test_plt.tasks.refresh_timeouts',
+        'schedule': 600.0,
+    },
+    # 增量归档执行履历
+    'test_plt_archive_run_logs': {
+        'task': 'test_plt.tasks.archive_run_logs',
+        'schedule': 3600.0,
+    },
+}
+
+# worker 的 Prometheus 指标端口（0表示不开启），多进程部署需同时设置环境变量 PROMETHEUS_MULTIPROC_DIR
+TEST_PLT_METRICS_WORKER_PORT = env.int('TEST_PLT_METRICS_WORKER_PORT', default=0)
+
 INTERNAL_IPS = [
     "127.0.0.1",
 ]
@@ -11,21 +11,23 @@ from django.contrib.contenttypes.models import ContentType
 from django.db import models
 from django.db.models import QuerySet
 from django.forms import TextInput, Textarea
-from django.http import HttpResponseRedirect
-from django.shortcuts import render, redirect
-from django.urls import reverse
+from django.http import Http404, HttpResponseRedirect, StreamingHttpResponse
+from django.shortcuts import get_object_or_404, render, redirect
+from django.urls import path, reverse
 from django.utils import timezone
+from django.utils.html import format_html, format_html_join
 from django.utils.safestring import mark_safe
 from nested_admin.nested import NestedModelAdmin, NestedTabularInline, NestedStackedInline
 
 from auto_test_platform import settings
 from forms import RunApiForm, FONT_MONO
 from . import tasks
-from .models import DeployEnv, TestBatch
+from .models import DeployEnv, TestBatch, TestBatchShard, CaseStat, CaseApiDefStat
 from .models import Project, ApiDef, QueryParam, RequestHeader, RequestBody, ApiRunLog, Case, CaseRunLog, CaseSuite, \
     CaseSuiteRunLog, CaseApiDef, CaseApiDefQueryParam, CaseApiDefRequestHeader, CaseApiDefRequestBody
 from .models import ProjectMember
-from .utils import common, http, redis_, mysql_
+from .utils import common, compare, dispatch, export, flaky, http, latency, planner, redis_, repeat, report, \
+    snapshot, mysql_
 from .utils.common import trunc_text
 
 
@@ -111,7 +113,8 @@ class CaseApiDefInline(NestedStackedInline):
     fields = (
         ('api', 'reorder', 'abort_when_fail'), ('auth_username', 'auth_password'),
         'bearer_token', 'redis_key', 'mysql_key', 'pre_proc', 'post_proc',
-        ('verify', 'status_code', 'response_time'),
+        ('verify', 'status_code', 'response_time', 'timeout'),
+        ('repeat', 'warmup', 'repeat_concurrency', 'latency_percentile'),
         'header_verify', 'json_verify', 'regex_verify', 'python_verify'
     )
     inlines = [CaseApiDefQueryParamInline, CaseApiDefRequestHeaderInline, CaseApiDefRequestBodyInline]
@@ -187,6 +190,33 @@ class CaseRunLogNestedInline(InlineIdLinkMixin, NestedTabularInline):
     readonly_fields = ('id_link',)
 
 
+class TestBatchShardNestedInline(NestedTabularInline):
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    model = TestBatchShard
+    extra = 0
+    fields = ('seq', 'status', 'case_count', 'predicted_ms', 'actual_ms', 'deviation', 'start_at', 'worker_hostname',
+              'error_msg')
+    readonly_fields = ('case_count', 'deviation')
+
+    @admin.display(description='用例数')
+    def case_count(self, obj: TestBatchShard):
+        return len(obj.case_ids)
+
+    @admin.display(description='实际/预计')
+    def deviation(self, obj: TestBatchShard):
+        if obj.actual_ms is None or not obj.predicted_ms:
+            return '-'
+        return f"{obj.actual_ms / obj.predicted_ms * 100:.0f}%"
+
+
 class CaseSuiteRunLogNestedInline(InlineIdLinkMixin, NestedTabularInline):
     def has_delete_permission(self, request, obj=None):
         return False
@@ -232,6 +262,12 @@ class ProjectAdmin(ModelAdmin):
             'classes': ('collapse',),
             'fields': ('description',)
         }),
+        ('调度', {
+            'fields': (('max_concurrency', 'fair_share_weight'),)
+        }),
+        ('错误预算', {
+            'fields': (('budget_window', 'budget_fail_ratio', 'budget_max_consecutive'),)
+        }),
     )
 
     actions = ['select_project']
@@ -311,7 +347,7 @@ class ProjectMemberAdmin(ModelAdmin):
 class DeployEnvAdmin(ModelAdmin):
     """环境部署管理列表类
     """
-    list_display = ["id", "project", "name", "hostname", "port", "status"]  # 我们可以再这里直接使用model里定义的函数
+    list_display = ["id", "project", "name", "hostname", "port", "rate_limit", "max_concurrency", "status"]  # 我们可以再这里直接使用model里定义的函数
     list_display_links = ["name"]
     list_filter = ["status"]
     search_fields = ["name", "hostname", "memo"]
@@ -370,7 +406,7 @@ class ApiDefAdmin(ModelAdmin):
                 'project',
                 'protocol',
                 ('name', 'status'),
-                'deploy_env',
+                ('deploy_env', 'timeout'),
                 'created_by',)
         }),
         ('HTTP信息', {
@@ -515,14 +551,24 @@ class ApiRunLogAdmin(admin.ModelAdmin):
     def cost_time(self, obj: ApiRunLog):
         start = common.fmt_local_datetime(obj.start_at)
         finish = common.fmt_local_datetime(obj.finish_at)
-        return f"{start} ~ {finish} (耗时：{obj.duration}ms)"
+        wait = f"，等待许可：{obj.wait_duration}ms" if obj.wait_duration else ''
+        return f"{start} ~ {finish} (耗时：{obj.duration}ms{wait})"
 
     cost_time.short_description = '执行时间'
 
+    @admin.display(description='重复执行')
+    def repeat_summary(self, obj: ApiRunLog):
+        values = obj.sample_values()
+        if not values:
+            return '-'
+        pct = {p: round(repeat.percentile(values, p), 1) for p in (50, 95, 99)}
+        return f"{len(values)}次（失败{obj.sample_failures or 0}次），最小{min(values):.1f}ms，" \
+               f"P50 {pct[50]}ms，P95 {pct[95]}ms，P99 {pct[99]}ms，最大{max(values):.1f}ms"
+
     fieldsets = (
         # 基础信息模块
         ('基础信息', {
-            'fields': (('id', 'success'), 'api', 'cost_time', 'error_msg', 'created_by')
+            'fields': (('id', 'success', 'error_kind'), 'api', 'cost_time', 'repeat_summary', 'error_msg', 'created_by')
         }),
         ('请求信息', {
             'fields': (
@@ -541,17 +587,27 @@ class ApiRunLogAdmin(admin.ModelAdmin):
 
 @admin.register(Case)
 class CaseAdmin(NestedModelAdmin):
-    list_display = ["id", "project", "name", "reorder", 'abort_when_fail', 'created_by', 'status']
+    list_display = ["id", "project", "name", "reorder", 'abort_when_fail', 'created_by', 'status', 'flakiness',
+                    'quarantined']
     list_display_links = ["name"]
-    list_filter = ["created_at", "status", "abort_when_fail"]
+    list_filter = ["created_at", "status", "abort_when_fail", "quarantined"]
+    list_select_related = ['project', 'created_by', 'run_stat']
     search_fields = ["name", "description"]
     inlines = [CaseApiDefInline]
     fieldsets = (
         # 基础信息模块
         ('基础信息', {
-            'fields': (('project', 'status'), ('name', 'reorder', 'abort_when_fail'), 'created_by', 'description')
+            'fields': (('project', 'status'), ('name', 'reorder', 'abort_when_fail', 'time_limit'),
+                       ('independent', 'quarantined'), 'created_by', 'description')
         }),
     )
+
+    @admin.display(description='不稳定度', ordering='run_stat__flakiness')
+    def flakiness(self, obj: Case):
+        stat = getattr(obj, 'run_stat', None)
+        if stat is None:
+            return '-'
+        return f"{stat.flakiness}（不稳定）" if flaky.is_flaky(stat) else stat.flakiness
     formfield_overrides = {
         models.TextField: {'widget': Textarea(attrs={'rows': 3, 'cols': 80, 'style': FONT_MONO})},
     }
@@ -581,7 +637,19 @@ class CaseAdmin(NestedModelAdmin):
 
         return form
 
-    actions = ['run_cases_q']
+    actions = ['run_cases_q', 'run_cases_q_failure_first', 'quarantine_cases', 'release_cases']
+
+    def quarantine_cases(self, request, queryset):
+        cnt = queryset.update(quarantined=True)
+        self.message_user(request, f"已隔离{cnt}个用例：照常执行，但不计入批次的用例通过率和错误预算")
+
+    quarantine_cases.short_description = '隔离所选的用例'
+
+    def release_cases(self, request, queryset):
+        cnt = queryset.update(quarantined=False)
+        self.message_user(request, f"已解除{cnt}个用例的隔离")
+
+    release_cases.short_description = '解除所选用例的隔离'
 
     # def run_cases(self, request, queryset):
     #     logger = logging.getLogger('test_plt')
@@ -599,7 +667,7 @@ class CaseAdmin(NestedModelAdmin):
     #
     # run_cases.short_description = '执行选择的用例'
 
-    def run_cases_q(self, request, queryset):
+    def run_cases_q(self, request, queryset, order_mode=TestBatch.ORDER_REORDER):
 
         # 自定义权限
         global bat
@@ -612,22 +680,43 @@ class CaseAdmin(NestedModelAdmin):
             # 获取所选的用例
             cases = queryset.order_by('reorder').all()
             case_ids = [case.id for case in cases]
+            project = cases[0].project
+            # 先展示预估耗时，确认分片数后再提交
+            if 'apply' not in request.POST:
+                est = planner.estimate(case_ids, project)
+                context = dict(self.admin_site.each_context(request), title='确认执行用例', opts=self.model._meta,
+                               est=est, options=planner.options(case_ids, project),
+                               wait=planner.fmt_ms(est['wait_ms']), run=planner.fmt_ms(est['run_ms']),
+                               total=planner.fmt_ms(est['total_ms']), finish_at=common.fmt_local_datetime(est['finish_at']),
+                               case_ids=case_ids, action=request.POST.get('action'))
+                return render(request, 'admin/test_plt/case/run_cases_confirm.html', context)
+            est = planner.estimate(case_ids, project, int(request.POST.get('shard_count') or 0) or None)
             bat = TestBatch.objects.create(
-                project=cases[0].project,
+                project=project,
                 created_by=request.user,
                 start_at=timezone.now(),
                 run_type=TestBatch.RUN_TYPE_QUEUE,
                 obj_type=TestBatch.OBJ_TYPE_CASE,
                 status=TestBatch.STATUS_PENDING,
+                order_mode=order_mode,
+                shard_count=est['shards'],
+                estimated_wait_ms=est['wait_ms'],
+                estimated_ms=est['run_ms'],
             )
             for case in cases:
                 bat.cases.create(case=case, test_batch=bat)
-            tasks.run_cases_queue.delay(case_ids, request.user.id, bat.id)
-            self.message_user(request, f"用例执行任务已排队，批次ID：{bat.id}")
+            dispatch.submit(bat, tasks.run_cases_queue.name, [case_ids, request.user.id, bat.id])
+            self.message_user(request, f"用例执行任务已排队，批次ID：{bat.id}，"
+                                       f"预计排队{planner.fmt_ms(est['wait_ms'])}，执行{planner.fmt_ms(est['run_ms'])}")
             return HttpResponseRedirect(f"/admin/test_plt/testbatch/{bat.id}/")
 
     run_cases_q.short_description = '执行选择的用例(异步)'
 
+    def run_cases_q_failure_first(self, request, queryset):
+        return self.run_cases_q(request, queryset, order_mode=TestBatch.ORDER_FAILURE_FIRST)
+
+    run_cases_q_failure_first.short_description = '执行选择的用例(异步，失败优先)'
+
 
 @admin.register(CaseRunLog)
 class CaseRunLogAdmin(admin.ModelAdmin):
@@ -714,7 +803,7 @@ class CaseSuiteAdmin(admin.ModelAdmin):
             kwargs['queryset'] = Case.objects.filter(project__id=proj_id)
         return super().formfield_for_manytomany(db_field, request, **kwargs)
 
-    actions = ['run_suites_q']
+    actions = ['run_suites_q', 'run_suites_q_failure_first']
 
     # def run_suites(self, request, queryset):
     #     logger = logging.getLogger('test_plt')
@@ -740,7 +829,7 @@ class CaseSuiteAdmin(admin.ModelAdmin):
     #
     # run_suites.short_description = '执行选择的 用例套件'
 
-    def run_suites_q(self, request, queryset):
+    def run_suites_q(self, request, queryset, order_mode=TestBatch.ORDER_REORDER):
         # 自定义权限
         global bat
         has_perm = request.user.has_perm('test_plt.run_case_suites')
@@ -751,6 +840,8 @@ class CaseSuiteAdmin(admin.ModelAdmin):
         else:
             suites = queryset.all()
             suite_ids = [suite.id for suite in suites]
+            # 套件按顺序执行，不分片
+            est = planner.estimate(planner.suite_case_ids(suite_ids), suites[0].project, shards=1)
             bat = TestBatch.objects.create(
                 project=suites[0].project,
                 created_by=request.user,
@@ -758,15 +849,24 @@ class CaseSuiteAdmin(admin.ModelAdmin):
                 run_type=TestBatch.RUN_TYPE_QUEUE,
                 obj_type=TestBatch.OBJ_TYPE_SUITE,
                 status=TestBatch.STATUS_PENDING,
+                order_mode=order_mode,
+                estimated_wait_ms=est['wait_ms'],
+                estimated_ms=est['run_ms'],
             )
             for suite in suites:
                 bat.suites.create(case_suite=suite, test_batch=bat)
-            tasks.run_suites_queue.delay(suite_ids, request.user.id, bat.id)
-            self.message_user(request, f"用例执行任务已排队，批次ID：{bat.id}")
+            dispatch.submit(bat, tasks.run_suites_queue.name, [suite_ids, request.user.id, bat.id])
+            self.message_user(request, f"用例执行任务已排队，批次ID：{bat.id}，"
+                                       f"预计排队{planner.fmt_ms(est['wait_ms'])}，执行{planner.fmt_ms(est['run_ms'])}")
             return HttpResponseRedirect(f"/admin/test_plt/testbatch/{bat.id}")
 
     run_suites_q.short_description = '执行选择的 用例套件(排队)'
 
+    def run_suites_q_failure_first(self, request, queryset):
+        return self.run_suites_q(request, queryset, order_mode=TestBatch.ORDER_FAILURE_FIRST)
+
+    run_suites_q_failure_first.short_description = '执行选择的 用例套件(排队，失败优先)'
+
 
 @admin.register(CaseSuiteRunLog)
 class CaseSuiteRunLogAdmin(admin.ModelAdmin):
@@ -837,20 +937,42 @@ class TestBatchAdmin(NestedModelAdmin):
     list_per_page = 20
 
     inlines = [CaseSuiteRunLogNestedInline, CaseRunLogNestedInline]
+    actions = ['cancel_batches', 'rerun_failed_cases', 'compare_batches']
 
     fieldsets = (
         ('基础信息', {
             'fields': (('id', 'project'), ('status', 'created_by'), ('obj_type', 'run_type', 'periodic_task'),
-                       'cost_time', 'error_msg')
+                       ('order_mode', 'select_mode'),
+                       'cost_time', 'error_msg', 'trace_id')
+        }),
+        ('排队与执行', {
+            'fields': ('queue_position', ('enqueued_at', 'picked_at', 'first_step_at'),
+                       ('queue_wait', 'startup_time', 'run_time'), 'estimate',
+                       ('worker_hostname', 'worker_pid'), 'task_id')
         }),
         ('统计信息', {
             'fields': (
                 ('stat_suite_plan', 'stat_suite_run', 'stat_suite_success', 'stat_suite_success_rto'),
                 ('stat_case_plan', 'stat_case_run', 'stat_case_success', 'stat_case_success_rto'),
-                ('stat_api_plan', 'stat_api_run', 'stat_api_success', 'stat_api_success_rto'))
-        })
+                ('stat_case_skipped', 'stat_case_quarantined'),
+                ('stat_api_plan', 'stat_api_run', 'stat_api_success', 'stat_api_success_rto'),
+                ('summary_link', 'export_links', 'compare_link'))
+        }),
+        ('性能退化', {
+            'fields': ('latency_regressions',)
+        }),
     )
 
+    @admin.display(description='耗时明显高于基线的接口')
+    def latency_regressions(self, obj: TestBatch):
+        total, rows = latency.regressions(obj)
+        if not total:
+            return '-'
+        items = format_html_join('', '<li>[{}] {}：{}ms（基线{}ms，+{}%）</li>',
+                                 ((r['case'], r['api'], r['duration'], r['baseline'], r['ratio']) for r in rows))
+        more = f"<li>……共{total}个</li>" if total > len(rows) else ''
+        return format_html('<ul>{}{}</ul>', items, mark_safe(more))
+
     def cost_time(self, obj):
         if obj.finish_at:
             return common.fmt_cost_time(obj.start_at, obj.finish_at, cal=True)
@@ -858,9 +980,217 @@ class TestBatchAdmin(NestedModelAdmin):
             return common.fmt_local_datetime(obj.start_at)
     cost_time.short_description = "执行时间"
 
+    @admin.display(description='排队位置')
+    def queue_position(self, obj: TestBatch):
+        try:
+            pos, eta = dispatch.queue_position(obj)
+        except Exception as e:
+            return f"无法获取排队信息：{e}"
+        if pos is None:
+            return '-'
+        return f"项目队列第{pos}位，预计开始时间：{common.fmt_local_datetime(eta)}"
+
+    @admin.display(description='排队耗时')
+    def queue_wait(self, obj: TestBatch):
+        return f"{obj.queue_wait_ms}ms" if obj.queue_wait_ms is not None else '-'
+
+    @admin.display(description='启动耗时')
+    def startup_time(self, obj: TestBatch):
+        return f"{obj.startup_ms}ms" if obj.startup_ms is not None else '-'
+
+    @admin.display(description='执行耗时')
+    def run_time(self, obj: TestBatch):
+        return f"{obj.run_ms}ms" if obj.run_ms is not None else '-'
+
+    @admin.display(description='预估耗时')
+    def estimate(self, obj: TestBatch):
+        if obj.estimated_ms is None:
+            return '-'
+        text = f"排队{obj.estimated_wait_ms if obj.estimated_wait_ms is not None else '-'}ms，执行{obj.estimated_ms}ms"
+        if obj.shard_count and obj.shard_count > 1:
+            text += f"（{obj.shard_count}个分片）"
+        dev = planner.deviation(obj)
+        if dev is not None:
+            text += f"；实际执行偏差{dev:+}%"
+        return text
+
+    def cancel_batches(self, request, queryset):
+        if not (request.user.has_perm('test_plt.run_case') or request.user.has_perm('test_plt.run_case_suites')):
+            self.message_user(request, '您没有权限取消批次，请管理员为用户添加相应权限！', level=messages.WARNING)
+            return
+        cancelled, notified = [], []
+        for bat in queryset.filter(status=TestBatch.STATUS_PENDING):
+            reason = f"{request.user.username} 手动取消"
+            (cancelled if tasks.cancel_batch(bat, reason) else notified).append(str(bat.id))
+        if not cancelled and not notified:
+            self.message_user(request, '所选批次都已结束，无需取消', level=messages.WARNING)
+            return
+        msg = []
+        if cancelled:
+            msg.append(f"已取消排队中的批次：{'、'.join(cancelled)}")
+        if notified:
+            msg.append(f"已通知执行中的批次在当前接口结束后中止：{'、'.join(notified)}")
+        self.message_user(request, '；'.join(msg))
+
+    cancel_batches.short_description = '取消所选的批次'
+
+    def rerun_failed_cases(self, request, queryset):
+        if not request.user.has_perm('test_plt.run_case'):
+            self.message_user(request, '您没有权限运行用例，请管理员为用户添加相应权限！', level=messages.WARNING)
+            return
+        if queryset.count() != 1:
+            self.message_user(request, '请只选择一个批次', level=messages.WARNING)
+            return
+        src: TestBatch = queryset.first()
+        failed_ids = set(src.case_run_logs.filter(passed=False).values_list('case_id', flat=True))
+        if not failed_ids:
+            self.message_user(request, f"批次[{src.id}]没有失败的用例", level=messages.WARNING)
+            return
+        cases = Case.objects.filter(id__in=failed_ids).order_by('reorder')
+        case_ids = [case.id for case in cases]
+        bat = TestBatch.objects.create(
+            project=src.project,
+            created_by=request.user,
+            start_at=timezone.now(),
+            run_type=TestBatch.RUN_TYPE_QUEUE,
+            obj_type=TestBatch.OBJ_TYPE_CASE,
+            status=TestBatch.STATUS_PENDING,
+            order_mode=src.order_mode,
+        )
+        for case in cases:
+            bat.cases.create(case=case, test_batch=bat)
+        dispatch.submit(bat, tasks.run_cases_queue.name, [case_ids, request.user.id, bat.id])
+        self.message_user(request, f"已重新执行批次[{src.id}]中失败的{len(case_ids)}个用例，批次ID：{bat.id}")
+        return HttpResponseRedirect(f"/admin/test_plt/testbatch/{bat.id}/")
+
+    rerun_failed_cases.short_description = '重新执行所选批次中失败的用例'
+
+    def compare_batches(self, request, queryset):
+        if queryset.count() != 2:
+            self.message_user(request, '请选择两个批次', level=messages.WARNING)
+            return
+        base, bat = queryset.order_by('id')
+        return redirect('admin:test_plt_testbatch_compare', base.id, bat.id)
+
+    compare_batches.short_description = '对比所选的两个批次'
+
+    def get_urls(self):
+        urls = [
+            path('queue-latency/', self.admin_site.admin_view(self.queue_latency_view),
+                 name='test_plt_testbatch_queue_latency'),
+            path('<int:bat_id>/summary/', self.admin_site.admin_view(self.summary_view),
+                 name='test_plt_testbatch_summary'),
+            path('<int:bat_id>/export/<str:fmt>/', self.admin_site.admin_view(self.export_view),
+                 name='test_plt_testbatch_export'),
+            path('compare/<int:base_id>/<int:bat_id>/', self.admin_site.admin_view(self.compare_view),
+                 name='test_plt_testbatch_compare'),
+        ]
+        return urls + super().get_urls()
+
+    def queue_latency_view(self, request):
+        """
+        各项目的排队耗时/执行耗时报表
+        """
+        days = int(request.GET.get('days', 7))
+        rows = common.queue_latency_report(timezone.now() - timedelta(days=days))
+        context = dict(self.admin_site.each_context(request), title='排队耗时报表', rows=rows, days=days,
+                       opts=self.model._meta)
+        return render(request, 'admin/test_plt/testbatch/queue_latency.html', context)
+
+    def summary_view(self, request, bat_id):
+        """
+        批次的接口执行统计：各接口耗时百分位、错误率、状态码分布、最慢的接口执行
+        """
+        bat = get_object_or_404(self.get_queryset(request), id=bat_id)
+        t = time.time()
+        snap = self.get_snapshot(bat)
+        summary = snap.data['summary'] if snap else report.batch_summary(bat)
+        context = dict(self.admin_site.each_context(request), title=f'批次[{bat.id}]接口执行统计', bat=bat,
+                       summary=summary, percentiles=report.PERCENTILES, elapsed=int((time.time() - t) * 1000),
+                       opts=self.model._meta)
+        return render(request, 'admin/test_plt/testbatch/summary.html', context)
+
+    @admin.display(description='接口执行统计')
+    def summary_link(self, obj: TestBatch):
+        return format_html('<a href="{}">查看各接口耗时百分位、错误率、状态码分布</a>',
+                           reverse('admin:test_plt_testbatch_summary', args=[obj.id]))
+
+    def export_view(self, request, bat_id, fmt):
+        """
+        以 JUnit XML / JSON Lines / HTML 格式导出批次结果（流式输出）
+        """
+        if fmt not in export.FORMATS:
+            raise Http404(f"不支持的导出格式：{fmt}")
+        bat = get_object_or_404(self.get_queryset(request), id=bat_id)
+        content_type, ext = export.FORMATS[fmt]
+        response = StreamingHttpResponse(export.stream(bat, fmt), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="batch-{bat.id}.{ext}"'
+        return response
+
+    @admin.display(description='导出')
+    def export_links(self, obj: TestBatch):
+        return format_html_join(' | ', '<a href="{}">{}</a>', (
+            (reverse('admin:test_plt_testbatch_export', args=[obj.id, fmt]), label)
+            for fmt, label in (('junit', 'JUnit XML'), ('jsonl', 'JSON Lines'), ('html', 'HTML'))))
+
+    def compare_view(self, request, base_id, bat_id):
+        """
+        两个批次的对比：新增失败、已修复的用例，各接口的耗时变化
+        """
+        qs = self.get_queryset(request)
+        base = get_object_or_404(qs, id=base_id)
+        bat = get_object_or_404(qs, id=bat_id)
+        t = time.time()
+        result = compare.compare(base, bat)
+        context = dict(self.admin_site.each_context(request), title=f'批次[{base.id}]与批次[{bat.id}]对比',
+                       base=base, bat=bat, result=result, elapsed=int((time.time() - t) * 1000),
+                       case_tables=[('新增失败的用例', result['new_failures']), ('已修复的用例', result['fixed']),
+                                    ('持续失败的用例', result['still_failing'])],
+                       latency_tables=[('变慢的接口', result['slower']), ('变快的接口', result['faster'])],
+                       opts=self.model._meta)
+        return render(request, 'admin/test_plt/testbatch/compare.html', context)
+
+    @admin.display(description='批次对比')
+    def compare_link(self, obj: TestBatch):
+        base = compare.previous(obj)
+        if not base:
+            return '-'
+        return format_html('<a href="{}">与上一批次[{}]对比</a>',
+                           reverse('admin:test_plt_testbatch_compare', args=[base.id, obj.id]), base.id)
+
+    def get_snapshot(self, obj: TestBatch):
+        """
+        已结束批次的报告快照（同一请求内只查询一次）
+        """
+        if not hasattr(obj, '_report_snapshot'):
+            obj._report_snapshot = snapshot.get(obj)
+        return obj._report_snapshot
+
+    @admin.display(description='执行报告')
+    def report_snapshot(self, obj: TestBatch):
+        return mark_safe(self.get_snapshot(obj).html)
+
+    def render_change_form(self, request, context, obj: TestBatch = None, **kwargs):
+        # 执行中的批次实时展示执行结果（change_form.html）
+        context['live_events'] = settings.TEST_PLT_LIVE_EVENTS and obj is not None and \
+            obj.status == TestBatch.STATUS_PENDING
+        return super().render_change_form(request, context, obj=obj, **kwargs)
+
+    def get_fieldsets(self, request, obj: TestBatch = None):
+        fieldsets = super().get_fieldsets(request, obj)
+        if obj and self.get_snapshot(obj):
+            # 快照中已包含性能退化的接口
+            fieldsets = [fs for fs in fieldsets if fs[0] != '性能退化'] + [('执行报告', {'fields': ('report_snapshot',)})]
+        return fieldsets
+
     def get_inline_instances(self, request, obj: TestBatch = None):
-        if obj.obj_type == TestBatch.OBJ_TYPE_CASE:
+        if self.get_snapshot(obj):
+            # 已结束的批次展示报告快照，不再逐层展示执行履历
+            self.inlines = [TestBatchShardNestedInline] if obj.shards.exists() else []
+        elif obj.obj_type == TestBatch.OBJ_TYPE_CASE:
             self.inlines = [CaseRunLogNestedInline]
+            if obj.shards.exists():
+                self.inlines = [TestBatchShardNestedInline, CaseRunLogNestedInline]
         else:
             self.inlines = [CaseSuiteRunLogNestedInline]
         return super(TestBatchAdmin, self).get_inline_instances(request, obj)
@@ -876,3 +1206,84 @@ admin.site.register(Permission)
 # admin.site.register(ContentType)
 admin.site.site_header = "自动化测试平台后台管理"
 admin.site.site_title = "测试平台后台"
+
+
+class RunStatAdmin(admin.ModelAdmin):
+    """
+    执行统计（只读），按不稳定度从高到低展示；统计随每次执行增量更新，列表只读取统计表
+    """
+    def has_add_permission(self, request):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    ordering = ['-flakiness']
+    list_per_page = settings.LIST_PER_PAGE
+    # 不统计全表总数
+    show_full_result_count = False
+
+    @admin.display(description='通过率(%)', ordering='pass_rate')
+    def pass_rate_pct(self, obj):
+        return round(obj.pass_rate * 100, 1)
+
+    @admin.display(description='翻转率(%)', ordering='flip_rate')
+    def flip_rate_pct(self, obj):
+        return round(obj.flip_rate * 100, 1)
+
+    @admin.display(description='耗时(ms)', ordering='duration_mean')
+    def duration(self, obj):
+        if obj.duration_mean is None:
+            return '-'
+        return f"{obj.duration_mean:.0f} ± {obj.duration_std:.0f}"
+
+    @admin.display(description='不稳定', boolean=True)
+    def flaky(self, obj):
+        return flaky.is_flaky(obj)
+
+
+@admin.register(CaseStat)
+class CaseStatAdmin(RunStatAdmin):
+    list_display = ['case', 'runs', 'passes', 'last_passed', 'pass_rate_pct', 'flip_rate_pct', 'duration',
+                    'flakiness', 'flaky', 'quarantined', 'updated_at']
+    list_select_related = ['case']
+    list_filter = ['case__quarantined']
+    search_fields = ['case__name']
+    actions = ['quarantine_cases', 'release_cases']
+
+    @admin.display(description='隔离', boolean=True, ordering='case__quarantined')
+    def quarantined(self, obj: CaseStat):
+        return obj.case.quarantined
+
+    def quarantine_cases(self, request, queryset):
+        cnt = Case.objects.filter(id__in=queryset.values('case_id')).update(quarantined=True)
+        self.message_user(request, f"已隔离{cnt}个用例：照常执行，但不计入批次的用例通过率和错误预算")
+
+    quarantine_cases.short_description = '隔离所选的用例'
+
+    def release_cases(self, request, queryset):
+        cnt = Case.objects.filter(id__in=queryset.values('case_id')).update(quarantined=False)
+        self.message_user(request, f"已解除{cnt}个用例的隔离")
+
+    release_cases.short_description = '解除所选用例的隔离'
+
+    def get_queryset(self, request):
+        qs: QuerySet = super().get_queryset(request)
+        proj_id = request.session.get('default_project_id', default=None)
+        return qs.filter(case__project__id=proj_id) if proj_id else qs
+
+
+@admin.register(CaseApiDefStat)
+class CaseApiDefStatAdmin(RunStatAdmin):
+    list_display = ['case_api', 'runs', 'passes', 'last_passed', 'pass_rate_pct', 'flip_rate_pct', 'duration',
+                    'flakiness', 'flaky', 'updated_at']
+    list_select_related = ['case_api__case', 'case_api__api']
+    search_fields = ['case_api__case__name', 'case_api__api__name']
+
+    def get_queryset(self, request):
+        qs: QuerySet = super().get_queryset(request)
+        proj_id = request.session.get('default_project_id', default=None)
+        return qs.filter(case_api__case__project__id=proj_id) if proj_id else qs
@@ -0,0 +1,39 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from test_plt.utils import archive
+
+
+class Command(BaseCommand):
+    help = '把执行履历增量归档为按项目、按天分区的列式文件（NumPy .npy），或查看归档中的接口耗时趋势'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', default=str(settings.TEST_PLT_ARCHIVE_DIR), help='归档目录')
+        parser.add_argument('--trend', type=int, metavar='PROJECT_ID', help='不归档，输出项目的接口耗时趋势')
+        parser.add_argument('--api', type=int, help='耗时趋势只统计该接口')
+        parser.add_argument('--case-api', type=int, help='耗时趋势只统计该用例接口')
+        parser.add_argument('--start', help='耗时趋势的开始日期（YYYY-MM-DD）')
+        parser.add_argument('--end', help='耗时趋势的结束日期（YYYY-MM-DD）')
+
+    def handle(self, *args, **options):
+        if options['trend'] is not None:
+            return self.trend(options)
+        t = time.time()
+        counts = archive.export_all(options['dir'])
+        state = archive.load_state(options['dir'])
+        for table, count in counts.items():
+            self.stdout.write(f"{table}: 归档 {count} 行，已归档到ID {state.get(table, 0)}")
+        self.stdout.write(f"耗时 {time.time() - t:.1f}s")
+
+    def trend(self, options):
+        rows = archive.latency_trend(options['trend'], api_id=options['api'], case_api_id=options['case_api'],
+                                     start=options['start'], end=options['end'], root=options['dir'])
+        if not rows:
+            self.stdout.write('没有归档数据')
+            return
+        for row in rows:
+            pcts = ' '.join(f"P{p}={v}" for p, v in row['percentiles'].items())
+            self.stdout.write(f"{row['date']}  次数 {row['count']:>8}  错误率 {row['error_rate']:>6}%  "
+                              f"平均 {row['mean']}ms  {pcts}")
@@ -0,0 +1,40 @@
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+
+from test_plt.models import ApiRunLog, TestBatch
+from test_plt.utils import export
+
+
+class Command(BaseCommand):
+    help = '测试批次结果导出的性能测试：输出各格式的耗时、大小、内存峰值以及每1万条接口执行的导出耗时'
+
+    def add_arguments(self, parser):
+        parser.add_argument('bat_id', type=int, help='测试批次ID')
+        parser.add_argument('--format', choices=list(export.FORMATS), action='append', dest='formats',
+                            help='导出格式，可重复指定，默认全部')
+        parser.add_argument('--repeat', type=int, default=3, help='每种格式执行的次数（取最快的一次）')
+
+    def handle(self, *args, **options):
+        bat = TestBatch.objects.filter(id=options['bat_id']).first()
+        if not bat:
+            raise CommandError(f"测试批次[{options['bat_id']}]不存在")
+        steps = ApiRunLog.objects.filter(case_run_log__test_batch=bat).count()
+        self.stdout.write(f"批次[{bat.id}] 接口执行 {steps} 条")
+        for fmt in options['formats'] or export.FORMATS:
+            best, size = None, 0
+            for _ in range(max(options['repeat'], 1)):
+                t = time.perf_counter()
+                size = sum(len(chunk) for chunk in export.stream(bat, fmt))
+                elapsed = time.perf_counter() - t
+                best = elapsed if best is None else min(best, elapsed)
+            # tracemalloc 会明显拖慢执行，内存峰值单独测一次
+            tracemalloc.start()
+            for _ in export.stream(bat, fmt):
+                pass
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            per_10k = best * 1000 / steps * 10000 if steps else 0
+            self.stdout.write(f"{fmt:<6} {best * 1000:>9.1f}ms  {size / 1024 / 1024:>8.2f}MB  "
+                              f"内存峰值 {peak / 1024 / 1024:>6.2f}MB  每1万条 {per_10k:.1f}ms")
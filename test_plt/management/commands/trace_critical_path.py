@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from test_plt.models import TestBatch
+from test_plt.utils import trace
+
+
+class Command(BaseCommand):
+    help = '对测试批次的链路追踪数据做关键路径分析（需要 TEST_PLT_TRACE_EXPORTER=file）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('bat_id', type=int, help='测试批次ID')
+        parser.add_argument('--file', default=str(settings.TEST_PLT_TRACE_FILE), help='追踪文件路径')
+        parser.add_argument('--top', type=int, default=20, help='输出自身耗时最长的前N个span')
+
+    def handle(self, *args, **options):
+        bat = TestBatch.objects.filter(id=options['bat_id']).first()
+        if not bat or not bat.trace_id:
+            raise CommandError(f"测试批次[{options['bat_id']}]不存在或没有链路追踪ID")
+        spans = trace.load_spans(options['file'], bat.trace_id)
+        path = trace.critical_path(spans)
+        if not path:
+            raise CommandError(f"追踪文件中没有找到链路[{bat.trace_id}]的根span")
+        root = next(s for s, _ in path if not s.get('parent_id'))
+        total = root['end_ns'] - root['start_ns']
+        self.stdout.write(f"链路[{bat.trace_id}] 关键路径共 {len(path)} 个span，总耗时 {total / 1e6:.1f}ms")
+        for s, own in sorted(path, key=lambda x: x[1], reverse=True)[:options['top']]:
+            attrs = ', '.join(f"{k}={v}" for k, v in s['attributes'].items())
+            self.stdout.write(f"{own / 1e6:>10.1f}ms  {s['name']:<12} {attrs}")
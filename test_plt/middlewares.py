@@ -2,6 +2,9 @@ from django.http import HttpRequest
 from django.shortcuts import redirect
 from django.contrib import messages
 from django.utils.http import urlencode
+from django.conf import settings
+
+from test_plt.utils import replica
 
 
 class EnsureProjectIdMiddleware:
@@ -28,4 +31,23 @@ class EnsureProjectIdMiddleware:
             return redirect('/admin/test_plt/project/')
 
         response = self.get_response(request)
-        return response
\ No newline at end of file
+        return response
+
+
+class ReplicaReadMiddleware:
+    """
+    settings.TEST_PLT_REPLICA_PATHS 下的 GET/HEAD 请求从从库读取（未配置从库时不生效）
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request: HttpRequest):
+        if request.method not in ('GET', 'HEAD') or not replica.configured() or \
+                not request.path_info.startswith(tuple(settings.TEST_PLT_REPLICA_PATHS)):
+            return self.get_response(request)
+        with replica.reads():
+            response = self.get_response(request)
+        if response.streaming:
+            # 导出等流式响应在这里返回之后才查询数据库
+            response.streaming_content = replica.wrap(response.streaming_content)
+        return response
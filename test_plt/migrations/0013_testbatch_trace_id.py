@@ -0,0 +1,18 @@
+# Generated by Django 4.0.4 on 2026-10-19 13:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('test_plt', '0012_alter_deployenv_project'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='testbatch',
+            name='trace_id',
+            field=models.CharField(blank=True, max_length=32, null=True, verbose_name='链路追踪ID'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.0.4 on 2026-10-19 13:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('test_plt', '0013_testbatch_trace_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='testbatch',
+            name='enqueued_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='入队时间'),
+        ),
+        migrations.AddField(
+            model_name='testbatch',
+            name='picked_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='领取时间'),
+        ),
+        migrations.AddField(
+            model_name='testbatch',
+            name='worker_hostname',
+            field=models.CharField(blank=True, max_length=128, null=True, verbose_name='Worker主机'),
+        ),
+        migrations.AddField(
+            model_name='testbatch',
+            name='worker_pid',
+            field=models.IntegerField(blank=True, null=True, verbose_name='Worker进程'),
+        ),
+    ]
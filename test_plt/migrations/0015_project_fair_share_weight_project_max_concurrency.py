@@ -0,0 +1,23 @@
+# Generated by Django 4.0.4 on 2026-10-19 13:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('test_plt', '0014_testbatch_enqueued_at_testbatch_picked_at_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='fair_share_weight',
+            field=models.PositiveIntegerField(default=1, verbose_name='调度权重'),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='max_concurrency',
+            field=models.PositiveIntegerField(default=0, help_text='同时执行的批次数上限，0表示不限', verbose_name='并发配额'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.0.4 on 2026-10-19 13:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('test_plt', '0015_project_fair_share_weight_project_max_concurrency'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='apirunlog',
+            name='wait_duration',
+            field=models.IntegerField(blank=True, null=True, verbose_name='等待许可耗时(ms)'),
+        ),
+        migrations.AddField(
+            model_name='deployenv',
+            name='max_concurrency',
+            field=models.PositiveIntegerField(default=0, help_text='所有worker合计，0表示不限', verbose_name='并发上限'),
+        ),
+        migrations.AddField(
+            model_name='deployenv',
+            name='rate_burst',
+            field=models.PositiveIntegerField(default=0, help_text='0表示与限流值相同', verbose_name='突发上限'),
+        ),
+        migrations.AddField(
+            model_name='deployenv',
+            name='rate_limit',
+            field=models.FloatField(default=0, help_text='所有worker合计，0表示不限', verbose_name='限流(次/秒)'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.0.4 on 2026-10-19 13:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('test_plt', '0016_apirunlog_wait_duration_deployenv_max_concurrency_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deployenv',
+            name='health_url',
+            field=models.CharField(blank=True, help_text='批次执行前的环境预检使用，不填则检查主机端口的TCP连接', max_length=200, null=True, verbose_name='健康检查地址'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.0.4 on 2026-10-19 13:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('test_plt', '0017_deployenv_health_url'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='apidef',
+            name='timeout',
+            field=models.FloatField(blank=True, help_text='不填则按最近的执行耗时自适应', null=True, verbose_name='超时时间(秒)'),
+        ),
+        migrations.AddField(
+            model_name='caseapidef',
+            name='timeout',
+            field=models.FloatField(blank=True, help_text='不填则使用接口定义的超时时间', null=True, verbose_name='超时时间(秒)'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.0.4 on 2026-10-19 13:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('test_plt', '0018_apidef_timeout_caseapidef_timeout'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='case',
+            name='time_limit',
+            field=models.PositiveIntegerField(blank=True, help_text='不填表示不限', null=True, verbose_name='用例时限(秒)'),
+        ),
+        migrations.AddField(
+            model_name='testbatch',
+            name='task_id',
+            field=models.CharField(blank=True, max_length=64, null=True, verbose_name='任务ID'),
+        ),
+        migrations.AlterField(
+            model_name='testbatch',
+            name='status',
+            field=models.IntegerField(choices=[(1, '排队中'), (2, '执行完毕'), (3, '执行失败'), (4, '已取消')], default=1, verbose_name='运行状态'),
+        ),
+    ]
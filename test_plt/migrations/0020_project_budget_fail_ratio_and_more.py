@@ -0,0 +1,28 @@
+# Generated by Django 4.0.4 on 2026-10-19 13:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('test_plt', '0019_case_time_limit_testbatch_task_id_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='budget_fail_ratio',
+            field=models.PositiveIntegerField(default=0, help_text='前N个用例中失败比例超过该值时中止批次', verbose_name='失败比例上限(%)'),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='budget_max_consecutive',
+            field=models.PositiveIntegerField(default=0, help_text='连续失败的用例数达到该值时中止批次，0表示不启用', verbose_name='连续失败上限'),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='budget_window',
+            field=models.PositiveIntegerField(default=0, help_text='统计前N个用例的失败比例，0表示不启用', verbose_name='预算窗口(用例数)'),
+        ),
+    ]
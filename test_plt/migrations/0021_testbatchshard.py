@@ -0,0 +1,35 @@
+# Generated by Django 4.0.4 on 2026-10-19 13:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('test_plt', '0020_project_budget_fail_ratio_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TestBatchShard',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('seq', models.IntegerField(verbose_name='分片序号')),
+                ('case_ids', models.JSONField(verbose_name='用例ID')),
+                ('status', models.IntegerField(choices=[(1, '排队中'), (2, '执行完毕'), (3, '执行失败'), (4, '已取消')], default=1, verbose_name='运行状态')),
+                ('predicted_ms', models.IntegerField(verbose_name='预计耗时(ms)')),
+                ('actual_ms', models.IntegerField(blank=True, null=True, verbose_name='实际耗时(ms)')),
+                ('start_at', models.DateTimeField(blank=True, null=True, verbose_name='开始时间')),
+                ('finish_at', models.DateTimeField(blank=True, null=True, verbose_name='结束时间')),
+                ('worker_hostname', models.CharField(blank=True, max_length=128, null=True, verbose_name='Worker主机')),
+                ('error_msg', models.TextField(blank=True, null=True, verbose_name='错误消息')),
+                ('test_batch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shards', to='test_plt.testbatch', verbose_name='测试批次')),
+            ],
+            options={
+                'verbose_name': '测试批次分片',
+                'verbose_name_plural': '测试批次分片',
+                'db_table': 'test_plt_testbatch_shard',
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.0.4 on 2026-10-19 13:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('test_plt', '0021_testbatchshard'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='case',
+            name='independent',
+            field=models.BooleanField(default=False, help_text='不依赖其他用例的执行结果，允许调整执行顺序', verbose_name='可独立执行'),
+        ),
+        migrations.AddField(
+            model_name='testbatch',
+            name='order_mode',
+            field=models.IntegerField(choices=[(1, '按执行顺序'), (2, '失败优先')], default=1, verbose_name='排序方式'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.0.4 on 2026-10-19 13:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('test_plt', '0022_case_independent_testbatch_order_mode'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='caserunlog',
+            name='fingerprint',
+            field=models.CharField(blank=True, max_length=64, null=True, verbose_name='用例指纹'),
+        ),
+        migrations.AddField(
+            model_name='testbatch',
+            name='select_mode',
+            field=models.IntegerField(choices=[(1, '全部执行'), (2, '增量执行')], default=1, verbose_name='选择方式'),
+        ),
+        migrations.AddField(
+            model_name='testbatch',
+            name='stat_case_skipped',
+            field=models.IntegerField(blank=True, null=True, verbose_name='用例数(增量跳过)'),
+        ),
+    ]
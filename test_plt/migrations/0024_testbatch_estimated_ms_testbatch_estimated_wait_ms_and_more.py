@@ -0,0 +1,28 @@
+# Generated by Django 4.0.4 on 2026-10-19 13:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('test_plt', '0023_caserunlog_fingerprint_testbatch_select_mode_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='testbatch',
+            name='estimated_ms',
+            field=models.IntegerField(blank=True, null=True, verbose_name='预计执行耗时(ms)'),
+        ),
+        migrations.AddField(
+            model_name='testbatch',
+            name='estimated_wait_ms',
+            field=models.IntegerField(blank=True, null=True, verbose_name='预计排队耗时(ms)'),
+        ),
+        migrations.AddField(
+            model_name='testbatch',
+            name='shard_count',
+            field=models.PositiveSmallIntegerField(blank=True, null=True, verbose_name='分片数'),
+        ),
+    ]
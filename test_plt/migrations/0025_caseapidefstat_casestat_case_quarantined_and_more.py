@@ -0,0 +1,64 @@
+# Generated by Django 4.0.4 on 2026-10-19 13:49
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('test_plt', '0024_testbatch_estimated_ms_testbatch_estimated_wait_ms_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CaseApiDefStat',
+            fields=[
+                ('runs', models.IntegerField(default=0, verbose_name='执行次数')),
+                ('passes', models.IntegerField(default=0, verbose_name='通过次数')),
+                ('last_passed', models.BooleanField(blank=True, null=True, verbose_name='最近一次通过')),
+                ('pass_rate', models.FloatField(default=0, verbose_name='通过率')),
+                ('flip_rate', models.FloatField(default=0, verbose_name='翻转率')),
+                ('duration_mean', models.FloatField(blank=True, null=True, verbose_name='耗时均值(ms)')),
+                ('duration_var', models.FloatField(default=0, verbose_name='耗时方差')),
+                ('flakiness', models.FloatField(db_index=True, default=0, verbose_name='不稳定度')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='最近更新时间')),
+                ('case_api', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='run_stat', serialize=False, to='test_plt.caseapidef', verbose_name='用例接口')),
+            ],
+            options={
+                'verbose_name': '用例接口执行统计',
+                'verbose_name_plural': '用例接口执行统计',
+                'db_table': 'test_plt_case_apidef_stat',
+            },
+        ),
+        migrations.CreateModel(
+            name='CaseStat',
+            fields=[
+                ('runs', models.IntegerField(default=0, verbose_name='执行次数')),
+                ('passes', models.IntegerField(default=0, verbose_name='通过次数')),
+                ('last_passed', models.BooleanField(blank=True, null=True, verbose_name='最近一次通过')),
+                ('pass_rate', models.FloatField(default=0, verbose_name='通过率')),
+                ('flip_rate', models.FloatField(default=0, verbose_name='翻转率')),
+                ('duration_mean', models.FloatField(blank=True, null=True, verbose_name='耗时均值(ms)')),
+                ('duration_var', models.FloatField(default=0, verbose_name='耗时方差')),
+                ('flakiness', models.FloatField(db_index=True, default=0, verbose_name='不稳定度')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='最近更新时间')),
+                ('case', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='run_stat', serialize=False, to='test_plt.case', verbose_name='用例')),
+            ],
+            options={
+                'verbose_name': '用例执行统计',
+                'verbose_name_plural': '用例执行统计',
+                'db_table': 'test_plt_case_stat',
+            },
+        ),
+        migrations.AddField(
+            model_name='case',
+            name='quarantined',
+            field=models.BooleanField(default=False, help_text='照常执行，但不计入批次的用例通过率和错误预算', verbose_name='隔离'),
+        ),
+        migrations.AddField(
+            model_name='testbatch',
+            name='stat_case_quarantined',
+            field=models.IntegerField(blank=True, null=True, verbose_name='用例数(已隔离)'),
+        ),
+    ]
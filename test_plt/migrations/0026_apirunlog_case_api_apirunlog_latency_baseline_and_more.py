@@ -0,0 +1,47 @@
+# Generated by Django 4.0.4 on 2026-10-19 13:51
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('test_plt', '0025_caseapidefstat_casestat_case_quarantined_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='apirunlog',
+            name='case_api',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='run_logs', to='test_plt.caseapidef', verbose_name='用例接口'),
+        ),
+        migrations.AddField(
+            model_name='apirunlog',
+            name='latency_baseline',
+            field=models.FloatField(blank=True, null=True, verbose_name='耗时基线(ms)'),
+        ),
+        migrations.AddField(
+            model_name='apirunlog',
+            name='latency_regressed',
+            field=models.BooleanField(default=False, verbose_name='性能退化'),
+        ),
+        migrations.CreateModel(
+            name='LatencyBaseline',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('samples', models.IntegerField(default=0, verbose_name='样本数')),
+                ('mean', models.FloatField(default=0, verbose_name='耗时均值(ms)')),
+                ('var', models.FloatField(default=0, verbose_name='耗时方差')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='最近更新时间')),
+                ('case_api', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='latency_baselines', to='test_plt.caseapidef', verbose_name='用例接口')),
+                ('deploy_env', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='test_plt.deployenv', verbose_name='部署环境')),
+            ],
+            options={
+                'verbose_name': '耗时基线',
+                'verbose_name_plural': '耗时基线',
+                'db_table': 'test_plt_latency_baseline',
+                'unique_together': {('case_api', 'deploy_env')},
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.0.4 on 2026-10-19 13:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('test_plt', '0026_apirunlog_case_api_apirunlog_latency_baseline_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='apirunlog',
+            name='sample_failures',
+            field=models.IntegerField(blank=True, null=True, verbose_name='重复执行失败次数'),
+        ),
+        migrations.AddField(
+            model_name='apirunlog',
+            name='samples',
+            field=models.BinaryField(blank=True, null=True, verbose_name='重复执行耗时'),
+        ),
+        migrations.AddField(
+            model_name='caseapidef',
+            name='latency_percentile',
+            field=models.PositiveSmallIntegerField(choices=[(50, 'P50'), (95, 'P95'), (99, 'P99')], default=95, help_text='重复执行时，响应时间校验使用的耗时百分位', verbose_name='耗时百分位'),
+        ),
+        migrations.AddField(
+            model_name='caseapidef',
+            name='repeat',
+            field=models.PositiveSmallIntegerField(default=1, verbose_name='重复次数'),
+        ),
+        migrations.AddField(
+            model_name='caseapidef',
+            name='repeat_concurrency',
+            field=models.PositiveSmallIntegerField(default=1, help_text='重复执行时的并发数', verbose_name='并发数'),
+        ),
+        migrations.AddField(
+            model_name='caseapidef',
+            name='warmup',
+            field=models.PositiveSmallIntegerField(default=0, help_text='预热执行的结果不计入', verbose_name='预热次数'),
+        ),
+    ]
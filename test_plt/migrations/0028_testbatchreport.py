@@ -0,0 +1,28 @@
+# Generated by Django 4.0.4 on 2026-10-19 13:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('test_plt', '0027_apirunlog_sample_failures_apirunlog_samples_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TestBatchReport',
+            fields=[
+                ('test_batch', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='snapshot', serialize=False, to='test_plt.testbatch', verbose_name='测试批次')),
+                ('data', models.JSONField(verbose_name='报告数据')),
+                ('html', models.TextField(verbose_name='报告HTML')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='生成时间')),
+            ],
+            options={
+                'verbose_name': '测试批次报告快照',
+                'verbose_name_plural': '测试批次报告快照',
+                'db_table': 'test_plt_testbatch_report',
+            },
+        ),
+    ]
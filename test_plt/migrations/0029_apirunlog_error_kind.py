@@ -0,0 +1,18 @@
+# Generated by Django 4.0.4 on 2026-10-19 14:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('test_plt', '0028_testbatchreport'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='apirunlog',
+            name='error_kind',
+            field=models.IntegerField(blank=True, choices=[(1, '连接失败'), (2, '已熔断')], null=True, verbose_name='失败类型'),
+        ),
+    ]
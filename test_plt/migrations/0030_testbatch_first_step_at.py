@@ -0,0 +1,18 @@
+# Generated by Django 4.0.4 on 2026-10-19 14:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('test_plt', '0029_apirunlog_error_kind'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='testbatch',
+            name='first_step_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='首个接口开始时间'),
+        ),
+    ]
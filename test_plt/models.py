@@ -1,12 +1,16 @@
+import array
 import logging
+import sys
+import threading
 from django.contrib.auth.models import User, Group
 from django.core.exceptions import ValidationError
 from django.db import models
-from django.db.models.signals import m2m_changed
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
 from django.dispatch import receiver
 from django.utils.translation import gettext_lazy as _
 from django_celery_beat.models import PeriodicTask
 import test_plt.utils as u
+from test_plt.utils import replica
 
 
 # 注意：只在value非空时才会触发这种validator!!!
@@ -53,6 +57,18 @@ class Project(models.Model):
     members = models.ManyToManyField(User, related_name="projects",
                                      through="ProjectMember",
                                      through_fields=('project', 'user'))
+    # 并发配额：同时执行的批次数上限（0表示不限）
+    max_concurrency = models.PositiveIntegerField(default=0, verbose_name="并发配额",
+                                                  help_text="同时执行的批次数上限，0表示不限")
+    # 公平调度权重：权重越大，分到的执行槽位越多
+    fair_share_weight = models.PositiveIntegerField(default=1, verbose_name="调度权重")
+    # 错误预算：前N个用例中失败比例超过阈值，或连续失败的用例数达到阈值时，中止整个批次（0表示不启用）
+    budget_window = models.PositiveIntegerField(default=0, verbose_name="预算窗口(用例数)",
+                                                help_text="统计前N个用例的失败比例，0表示不启用")
+    budget_fail_ratio = models.PositiveIntegerField(default=0, verbose_name="失败比例上限(%)",
+                                                    help_text="前N个用例中失败比例超过该值时中止批次")
+    budget_max_consecutive = models.PositiveIntegerField(default=0, verbose_name="连续失败上限",
+                                                         help_text="连续失败的用例数达到该值时中止批次，0表示不启用")
 
     # 默认显示
     def __str__(self):
@@ -150,7 +166,15 @@ class DeployEnv(models.Model):
     dingtalk_web_hook = models.CharField(max_length=200, verbose_name="钉钉群通知", blank=True, null=True)
     # 钉钉加签
     dingtalk_web_hook_sign = models.CharField(max_length=200, verbose_name="钉钉加签", blank=True, null=True)
-
+    # 限流：每秒请求数（所有worker合计，0表示不限）
+    rate_limit = models.FloatField(default=0, verbose_name="限流(次/秒)", help_text="所有worker合计，0表示不限")
+    # 限流：令牌桶容量（允许的突发请求数，0表示与限流值相同）
+    rate_burst = models.PositiveIntegerField(default=0, verbose_name="突发上限", help_text="0表示与限流值相同")
+    # 并发上限：同时在途的请求数（所有worker合计，0表示不限）
+    max_concurrency = models.PositiveIntegerField(default=0, verbose_name="并发上限", help_text="所有worker合计，0表示不限")
+    # 健康检查地址：批次执行前的环境预检请求该地址，不填则检查主机端口能否建立 TCP 连接
+    health_url = models.CharField(max_length=200, verbose_name="健康检查地址", blank=True, null=True,
+                                  help_text="批次执行前的环境预检使用，不填则检查主机端口的TCP连接")
 
     def __str__(self):
         return self.name
@@ -196,6 +220,8 @@ class ApiDef(models.Model):
     http_schema = models.CharField("HTTP模式", blank=True, null=True, max_length=5, choices=HTTP_SCHEMA_CHOICE)
     # 部署环境（外键）
     deploy_env = models.ForeignKey(DeployEnv, on_delete=models.RESTRICT, verbose_name='部署环境')
+    # 读超时（秒），不填则按最近的执行耗时自适应
+    timeout = models.FloatField(blank=True, null=True, verbose_name='超时时间(秒)', help_text='不填则按最近的执行耗时自适应')
     # HTTP方法 fixme 要根据协议判断是否必须
     http_method = models.CharField('HTTP方法', blank=True, null=True, max_length=8, choices=HTTP_METHOD_CHOICE)
     # URI fixme 要根据协议判断是否必须
@@ -358,6 +384,14 @@ class Case(models.Model):
     reorder = models.IntegerField(verbose_name="执行顺序")
     # 失败时终止
     abort_when_fail = models.BooleanField(default=True, verbose_name="失败时终止")
+    # 用例时限（秒）：超时后不再执行后续接口，用例记为失败
+    time_limit = models.PositiveIntegerField(blank=True, null=True, verbose_name="用例时限(秒)", help_text="不填表示不限")
+    # 可独立执行：不依赖其他用例设置的上下文变量，失败优先等排序方式可以调整它的执行顺序
+    independent = models.BooleanField(default=False, verbose_name="可独立执行",
+                                      help_text="不依赖其他用例的执行结果，允许调整执行顺序")
+    # 隔离：不稳定的用例照常执行，但不计入批次的用例通过率和错误预算
+    quarantined = models.BooleanField(default=False, verbose_name="隔离",
+                                      help_text="照常执行，但不计入批次的用例通过率和错误预算")
 
     def __str__(self):
         return self.name
@@ -396,6 +430,15 @@ class CaseApiDef(models.Model):
     status_code = models.IntegerField(null=True, blank=True, verbose_name='状态码校验')
     # 响应时间校验
     response_time = models.IntegerField(null=True, blank=True, verbose_name='响应时间校验（s）')
+    # 读超时（秒），优先于接口定义上的超时时间
+    timeout = models.FloatField(null=True, blank=True, verbose_name='超时时间(秒)', help_text='不填则使用接口定义的超时时间')
+    # 重复执行：执行 预热次数 + 重复次数 次，预热的结果不计入；响应时间校验使用各次耗时的百分位
+    repeat = models.PositiveSmallIntegerField(default=1, verbose_name='重复次数')
+    warmup = models.PositiveSmallIntegerField(default=0, verbose_name='预热次数', help_text='预热执行的结果不计入')
+    repeat_concurrency = models.PositiveSmallIntegerField(default=1, verbose_name='并发数', help_text='重复执行时的并发数')
+    latency_percentile = models.PositiveSmallIntegerField(choices=[(50, 'P50'), (95, 'P95'), (99, 'P99')], default=95,
+                                                          verbose_name='耗时百分位',
+                                                          help_text='重复执行时，响应时间校验使用的耗时百分位')
     # HTTP响应头校验
     header_verify = models.TextField(null=True, blank=True, verbose_name='HTTP响应头校验')
     # 应答体JSON schema校验
@@ -548,10 +591,26 @@ class TestBatch(models.Model):
     STATUS_PENDING = 1
     STATUS_FINISHED = 2
     STATUS_FAILED = 3
+    STATUS_CANCELLED = 4
     BATCH_STATUS = [
         (STATUS_PENDING, '排队中'),
         (STATUS_FINISHED, '执行完毕'),
-        (STATUS_FAILED, '执行失败')
+        (STATUS_FAILED, '执行失败'),
+        (STATUS_CANCELLED, '已取消')
+    ]
+
+    ORDER_REORDER = 1
+    ORDER_FAILURE_FIRST = 2
+    ORDER_MODE = [
+        (ORDER_REORDER, '按执行顺序'),
+        (ORDER_FAILURE_FIRST, '失败优先')
+    ]
+
+    SELECT_ALL = 1
+    SELECT_CHANGED = 2
+    SELECT_MODE = [
+        (SELECT_ALL, '全部执行'),
+        (SELECT_CHANGED, '增量执行')
     ]
     id = models.AutoField(primary_key=True)
     # 测试项目
@@ -564,16 +623,40 @@ class TestBatch(models.Model):
     obj_type = models.IntegerField(choices=OBJ_TYPE, verbose_name='任务类型')
     # 运行方式（在页面上选择（排队）计划任务）
     run_type = models.IntegerField(choices=RUN_TYPE, verbose_name='运行方式')
-    # 运行状态 （排队中、执行完毕 、执行失败）
+    # 运行状态 （排队中、执行完毕 、执行失败、已取消）
     status = models.IntegerField(choices=BATCH_STATUS, default=1, verbose_name='运行状态')
     # 错误消息
     error_msg = models.TextField(blank=True, null=True, verbose_name='错误消息')
+    # 用例排序方式（按执行顺序、失败优先）
+    order_mode = models.IntegerField(choices=ORDER_MODE, default=ORDER_REORDER, verbose_name='排序方式')
+    # 用例选择方式（全部执行、只执行有变化/上次失败/太久没执行的用例）
+    select_mode = models.IntegerField(choices=SELECT_MODE, default=SELECT_ALL, verbose_name='选择方式')
     # 计划任务（PeriodicTask ID）
     periodic_task = models.ForeignKey(PeriodicTask, blank=True, null=True, on_delete=models.SET_NULL,
                                       verbose_name='计划任务')
     # 创建人（统一用admin）
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, db_column='created_by',
                                    null=True, verbose_name='创建人')
+    # 链路追踪ID（可在追踪文件/OTLP后端中按此ID查看执行时间线）
+    trace_id = models.CharField(max_length=32, blank=True, null=True, verbose_name='链路追踪ID')
+    # 入队时间（任务消息发送到broker的时间）
+    enqueued_at = models.DateTimeField(blank=True, null=True, verbose_name='入队时间')
+    # worker领取时间（任务真正开始执行的时间）
+    picked_at = models.DateTimeField(blank=True, null=True, verbose_name='领取时间')
+    # 批次的第一个接口开始执行的时间（分片执行时为最早开始的分片）
+    first_step_at = models.DateTimeField(blank=True, null=True, verbose_name='首个接口开始时间')
+    # 执行该批次的worker主机名
+    worker_hostname = models.CharField(max_length=128, blank=True, null=True, verbose_name='Worker主机')
+    # 执行该批次的worker进程号
+    worker_pid = models.IntegerField(blank=True, null=True, verbose_name='Worker进程')
+    # celery 任务ID（取消尚未被领取的批次时用于撤销任务）
+    task_id = models.CharField(max_length=64, blank=True, null=True, verbose_name='任务ID')
+    # 分片数（提交时选择，为空时按配置的默认分片数）
+    shard_count = models.PositiveSmallIntegerField(blank=True, null=True, verbose_name='分片数')
+    # 提交时预估的排队耗时（ms）
+    estimated_wait_ms = models.IntegerField(blank=True, null=True, verbose_name='预计排队耗时(ms)')
+    # 提交时预估的执行耗时（ms）
+    estimated_ms = models.IntegerField(blank=True, null=True, verbose_name='预计执行耗时(ms)')
 
     # 统计信息 接口 计划数量
     stat_api_plan = models.IntegerField(blank=True, null=True, verbose_name='接口数(计划)')
@@ -590,6 +673,10 @@ class TestBatch(models.Model):
     stat_case_run = models.IntegerField(blank=True, null=True, verbose_name='用例数(实际执行)')
     # 统计信息 用例 实际成功
     stat_case_success = models.IntegerField(blank=True, null=True, verbose_name='用例数(实际执行成功)')
+    # 统计信息 用例 增量执行时跳过的数量
+    stat_case_skipped = models.IntegerField(blank=True, null=True, verbose_name='用例数(增量跳过)')
+    # 统计信息 用例 已隔离的数量（不计入用例数和通过率）
+    stat_case_quarantined = models.IntegerField(blank=True, null=True, verbose_name='用例数(已隔离)')
     # 统计信息 用例 通过率
     stat_case_success_rto = models.DecimalField(max_digits=5, decimal_places=2,
                                                 blank=True, null=True, verbose_name='用例执行通过率(%)')
@@ -604,6 +691,8 @@ class TestBatch(models.Model):
     stat_suite_success_rto = models.DecimalField(max_digits=5, decimal_places=2,
                                                  blank=True, null=True, verbose_name='用例套件执行通过率(%)')
 
+    # 批次执行过程中统计，必须读主库
+    @replica.reads(False)
     def stat(self):
         logger = logging.getLogger('test_plt')
         # 测试套件
@@ -611,32 +700,37 @@ class TestBatch(models.Model):
             self.stat_suite_plan = self.suites.count()  # 计划的套件数量
             self.stat_suite_run = self.suite_run_logs.count()
             self.stat_suite_success = self.suite_run_logs.filter(passed=True).count()
-            self.stat_suite_success_rto = self.stat_suite_success / self.stat_suite_plan * 100
+            self.stat_suite_success_rto = self.stat_suite_success / self.stat_suite_plan * 100 if self.stat_suite_plan else 0
         # 用例
+        # 已隔离的用例照常执行，但不计入用例数和通过率
         if self.obj_type == TestBatch.OBJ_TYPE_CASE:  # 以 执行测试用例 的方式开展时，统计用例数据
-            self.stat_case_plan = self.cases.count()
-            self.stat_case_run = self.case_run_logs.count()
+            self.stat_case_quarantined = self.cases.filter(case__quarantined=True).count()
+            self.stat_case_plan = self.cases.filter(case__quarantined=False).count()
+            self.stat_case_run = self.case_run_logs.filter(case__quarantined=False).count()
             logger.info(f'用例执行数量是{self.stat_case_run}')
-            self.stat_case_success = self.case_run_logs.filter(passed=True).count()
-            self.stat_case_success_rto = self.stat_case_success / self.stat_case_plan * 100
+            self.stat_case_success = self.case_run_logs.filter(case__quarantined=False, passed=True).count()
+            self.stat_case_success_rto = self.stat_case_success / self.stat_case_plan * 100 if self.stat_case_plan else 0
         else:  # 以执行测试套件的方式开展时，统计用例数据
             # 用例的计划数量
             cnt = 0
+            quarantined = 0
             for tb_suite in self.suites.all():
-                cnt += tb_suite.case_suite.cases.count()
+                cnt += tb_suite.case_suite.cases.filter(quarantined=False).count()
+                quarantined += tb_suite.case_suite.cases.filter(quarantined=True).count()
             self.stat_case_plan = cnt
+            self.stat_case_quarantined = quarantined
             # 用例运行数量
             cnt = 0
             for slog in self.suite_run_logs.all():
-                cnt += slog.case_run_logs.count()
+                cnt += slog.case_run_logs.filter(case__quarantined=False).count()
             self.stat_case_run = cnt
             # 用例通过数量
             cnt = 0
             for slog in self.suite_run_logs.all():
-                cnt += slog.case_run_logs.filter(passed=True).count()
+                cnt += slog.case_run_logs.filter(case__quarantined=False, passed=True).count()
             self.stat_case_success = cnt
             # 接口通过率
-            self.stat_case_success_rto = self.stat_case_success / self.stat_case_plan * 100
+            self.stat_case_success_rto = self.stat_case_success / self.stat_case_plan * 100 if self.stat_case_plan else 0
 
         # 接口
         if self.obj_type == TestBatch.OBJ_TYPE_CASE:
@@ -658,7 +752,7 @@ class TestBatch(models.Model):
                 cnt += clog.case_api_logs.filter(success=True).count()  # #####
             self.stat_api_success = cnt
             # 接口成功率
-            self.stat_api_success_rto = self.stat_api_success / self.stat_api_plan * 100
+            self.stat_api_success_rto = self.stat_api_success / self.stat_api_plan * 100 if self.stat_api_plan else 0
 
         else:  # 关联在套件里执行
             cnt = 0
@@ -680,13 +774,41 @@ class TestBatch(models.Model):
                     cnt += clog.case_api_logs.filter(success=True).count()
             self.stat_api_success = cnt
             # 接口的运行成功率
-            self.stat_api_success_rto = self.stat_api_success / self.stat_api_plan * 100
+            self.stat_api_success_rto = self.stat_api_success / self.stat_api_plan * 100 if self.stat_api_plan else 0
+
+    @property
+    def queue_wait_ms(self):
+        """
+        排队耗时（ms）：入队到被worker领取
+        """
+        if not self.enqueued_at or not self.picked_at:
+            return None
+        return int((self.picked_at - self.enqueued_at).total_seconds() * 1000)
+
+    @property
+    def startup_ms(self):
+        """
+        启动耗时（ms）：被worker领取到第一个接口开始执行（预检等准备工作）
+        """
+        if not self.picked_at or not self.first_step_at:
+            return None
+        return max(int((self.first_step_at - self.picked_at).total_seconds() * 1000), 0)
+
+    @property
+    def run_ms(self):
+        """
+        执行耗时（ms）：被worker领取到执行结束
+        """
+        if not self.picked_at or not self.finish_at:
+            return None
+        return int((self.finish_at - self.picked_at).total_seconds() * 1000)
 
     def __repr__(self):
         # Django的魔术方法：get_xxx_display
         return f"测试批次(报告)：ID[{self.id}]: \n"\
                f"项目：{self.project}: \n"\
                f"开始结束时间：{u.common.fmt_cost_time(self.start_at, self.finish_at, cal=True)}； \n" \
+               f"排队耗时：{self.queue_wait_ms}ms | 执行耗时：{self.run_ms}ms | Worker：{self.worker_hostname}[{self.worker_pid}]； \n" \
                f"任务类型：{self.get_obj_type_display()}: 运行方式：{self.get_run_type_display()}； \n" \
                f"套件数：计划[{self.stat_suite_plan}] | 实际[{self.stat_suite_run}] | 通过[{self.stat_suite_success}] | 通过率[{self.stat_suite_success_rto}]； \n" \
                f"用例数：计划[{self.stat_case_plan}] | 实际[{self.stat_case_run}] | 通过[{self.stat_case_success}] | 通过率[{self.stat_case_success_rto}]； \n" \
@@ -729,6 +851,59 @@ class TestBatchCaseSuite(models.Model):
         db_table = 'test_plt_testbatch_casesuite'
 
 
+class TestBatchShard(models.Model):
+    """
+    测试批次的分片：大批量用例拆分为多个子任务并行执行
+    """
+    id = models.AutoField(primary_key=True)
+    test_batch = models.ForeignKey(TestBatch, on_delete=models.CASCADE, related_name='shards', verbose_name='测试批次')
+    # 分片序号（从1开始）
+    seq = models.IntegerField(verbose_name='分片序号')
+    # 分片包含的用例ID（执行顺序）
+    case_ids = models.JSONField(verbose_name='用例ID')
+    # 运行状态（同测试批次）
+    status = models.IntegerField(choices=TestBatch.BATCH_STATUS, default=TestBatch.STATUS_PENDING, verbose_name='运行状态')
+    # 按历史耗时预计的执行耗时
+    predicted_ms = models.IntegerField(verbose_name='预计耗时(ms)')
+    # 实际执行耗时
+    actual_ms = models.IntegerField(blank=True, null=True, verbose_name='实际耗时(ms)')
+    start_at = models.DateTimeField(blank=True, null=True, verbose_name='开始时间')
+    finish_at = models.DateTimeField(blank=True, null=True, verbose_name='结束时间')
+    # 执行该分片的worker主机名
+    worker_hostname = models.CharField(max_length=128, blank=True, null=True, verbose_name='Worker主机')
+    error_msg = models.TextField(blank=True, null=True, verbose_name='错误消息')
+
+    def __str__(self):
+        return f"{self.test_batch} #{self.seq}"
+
+    class Meta:
+        verbose_name = '测试批次分片'
+        verbose_name_plural = verbose_name
+        db_table = 'test_plt_testbatch_shard'
+
+
+class TestBatchReport(models.Model):
+    """
+    测试批次的报告快照：批次结束（执行完毕/执行失败）后生成一次，之后直接展示，不再逐层查询执行履历；
+    执行履历被清理时作废（见 invalidate_batch_report），下次查看时按剩余的履历重新生成
+    """
+    test_batch = models.OneToOneField(TestBatch, on_delete=models.CASCADE, primary_key=True, related_name='snapshot',
+                                      verbose_name='测试批次')
+    # 报告数据（见 utils.snapshot.collect）
+    data = models.JSONField(verbose_name='报告数据')
+    # 渲染好的报告 HTML
+    html = models.TextField(verbose_name='报告HTML')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='生成时间')
+
+    def __str__(self):
+        return str(self.test_batch)
+
+    class Meta:
+        verbose_name = '测试批次报告快照'
+        verbose_name_plural = verbose_name
+        db_table = 'test_plt_testbatch_report'
+
+
 class CaseSuiteRunLog(models.Model):
     id = models.AutoField(primary_key=True)
     # 用例套件 Fk
@@ -792,6 +967,8 @@ class CaseRunLog(models.Model):
     # 测试批次
     test_batch = models.ForeignKey(TestBatch, on_delete=models.CASCADE, related_name='case_run_logs',
                                    blank=True, null=True, verbose_name='测试批次')
+    # 执行时的用例内容指纹（增量选择用例时判断用例是否有变化）
+    fingerprint = models.CharField(max_length=64, blank=True, null=True, verbose_name='用例指纹')
 
     def __str__(self):
         start = u.common.fmt_local_datetime(self.start_at)
@@ -854,6 +1031,43 @@ class ApiRunLog(models.Model):
     # mysql的执行语句
     mysql_key = models.CharField(blank=True, null=True, max_length=128, verbose_name='Mysql 执行语句')
 
+    # 等待部署环境执行许可（限流/并发上限）的耗时，不计入 duration
+    wait_duration = models.IntegerField("等待许可耗时(ms)", blank=True, null=True)
+
+    # 用例接口（在用例中执行时）
+    case_api = models.ForeignKey(CaseApiDef, on_delete=models.SET_NULL, blank=True, null=True, related_name='run_logs',
+                                 verbose_name='用例接口')
+    # 执行前该用例接口在部署环境上的耗时基线（ms）
+    latency_baseline = models.FloatField("耗时基线(ms)", blank=True, null=True)
+    # 耗时明显高于基线（性能退化）
+    latency_regressed = models.BooleanField("性能退化", default=False)
+
+    # 执行失败的类型：部署环境不可达（连接失败/超时）或已熔断，用于判断批次是否因环境故障失败
+    ERROR_CONNECTION = 1
+    ERROR_CIRCUIT_OPEN = 2
+    ERROR_KIND = (
+        (ERROR_CONNECTION, '连接失败'),
+        (ERROR_CIRCUIT_OPEN, '已熔断'),
+    )
+    error_kind = models.IntegerField("失败类型", choices=ERROR_KIND, blank=True, null=True)
+
+    # 重复执行时各次的耗时（ms，float32 小端序依次排列，见 sample_values），不单独保存执行履历
+    samples = models.BinaryField("重复执行耗时", blank=True, null=True)
+    # 重复执行时失败的次数
+    sample_failures = models.IntegerField("重复执行失败次数", blank=True, null=True)
+
+    def sample_values(self):
+        """
+        重复执行时各次的耗时（ms）
+        """
+        if not self.samples:
+            return []
+        values = array.array('f')
+        values.frombytes(bytes(self.samples))
+        if sys.byteorder != 'little':
+            values.byteswap()
+        return values.tolist()
+
     def __str__(self):
         start = u.common.fmt_local_datetime(self.start_at)
         return f"{self.api} at {start}"
@@ -864,6 +1078,198 @@ class ApiRunLog(models.Model):
         db_table = 'test_plt_api_run_log'
 
 
+# 正在删除的执行履历所属的批次、用例执行履历：pre_delete 中收集，post_delete 中一次性作废报告快照，
+# 一次删除（包括级联删除）多条履历时不再逐条作废
+_deleting = threading.local()
+
+
+def _pending(name):
+    if not hasattr(_deleting, name):
+        setattr(_deleting, name, set())
+    return getattr(_deleting, name)
+
+
+def invalidate_reports(batch_ids):
+    """
+    作废批次的报告快照，下次查看时按剩余的履历重新生成
+    :param batch_ids: 测试批次ID
+    """
+    TestBatchReport.objects.filter(test_batch_id__in=batch_ids).delete()
+
+
+@receiver(pre_delete, sender=CaseRunLog)
+@receiver(pre_delete, sender=CaseSuiteRunLog)
+def collect_deleting_batch(sender, instance, **kwargs):
+    if instance.test_batch_id:
+        _pending('batches').add(instance.test_batch_id)
+
+
+@receiver(post_delete, sender=CaseRunLog)
+@receiver(post_delete, sender=CaseSuiteRunLog)
+def invalidate_batch_report(sender, instance, **kwargs):
+    """
+    执行履历被删除（清理）时，作废所属批次的报告快照（每次删除只作废一次）
+    """
+    batches = _pending('batches')
+    if instance.test_batch_id in batches:
+        invalidate_reports(list(batches))
+        batches.clear()
+
+
+@receiver(pre_delete, sender=ApiRunLog)
+def collect_deleting_step(sender, instance, **kwargs):
+    if instance.case_run_log_id:
+        _pending('case_logs').add(instance.case_run_log_id)
+
+
+@receiver(post_delete, sender=ApiRunLog)
+def invalidate_step_report(sender, instance, **kwargs):
+    """
+    接口执行履历被删除时，作废所属批次的报告快照（每次删除只查询、作废一次）
+    """
+    case_logs = _pending('case_logs')
+    if instance.case_run_log_id not in case_logs:
+        return
+    # 级联删除时接口执行履历先于用例执行履历删除，此时仍能查到所属批次
+    batch_ids = set(CaseRunLog.objects.filter(id__in=case_logs, test_batch__isnull=False)
+                    .values_list('test_batch_id', flat=True))
+    case_logs.clear()
+    invalidate_reports(batch_ids)
+    # 所属的用例执行履历随后被删除时不再重复作废
+    _pending('batches').difference_update(batch_ids)
+
+
+@receiver(post_save, sender=ApiRunLog)
+def invalidate_changed_step_report(sender, instance, created, raw=False, **kwargs):
+    """
+    接口执行履历被修改时，作废所属批次的报告快照（执行时新建的履历不影响已生成的快照）
+    """
+    if created or raw or not instance.case_run_log_id:
+        return
+    TestBatchReport.objects.filter(
+        test_batch_id__in=CaseRunLog.objects.filter(id=instance.case_run_log_id).values('test_batch_id')).delete()
+
+
+class LatencyBaseline(models.Model):
+    """
+    用例接口在各部署环境上的耗时基线（指数加权均值与方差），每次执行成功后增量更新（见 utils.latency）
+    """
+    id = models.AutoField(primary_key=True)
+    case_api = models.ForeignKey(CaseApiDef, on_delete=models.CASCADE, related_name='latency_baselines',
+                                 verbose_name='用例接口')
+    deploy_env = models.ForeignKey(DeployEnv, on_delete=models.CASCADE, verbose_name='部署环境')
+    # 计入基线的样本数
+    samples = models.IntegerField(default=0, verbose_name='样本数')
+    # 耗时均值（ms）
+    mean = models.FloatField(default=0, verbose_name='耗时均值(ms)')
+    # 耗时方差（ms²）
+    var = models.FloatField(default=0, verbose_name='耗时方差')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='最近更新时间')
+
+    @property
+    def std(self):
+        return self.var ** 0.5
+
+    def __str__(self):
+        return f"{self.case_api} @ {self.deploy_env}"
+
+    class Meta:
+        verbose_name = '耗时基线'
+        verbose_name_plural = verbose_name
+        db_table = 'test_plt_latency_baseline'
+        unique_together = [('case_api', 'deploy_env')]
+
+
+class RunStat(models.Model):
+    """
+    执行结果的滚动统计（指数加权，越近的执行权重越大），每次执行结束时增量更新（见 utils.flaky）
+    """
+    # 累计执行次数
+    runs = models.IntegerField(default=0, verbose_name='执行次数')
+    # 累计通过次数
+    passes = models.IntegerField(default=0, verbose_name='通过次数')
+    # 最近一次是否通过
+    last_passed = models.BooleanField(blank=True, null=True, verbose_name='最近一次通过')
+    # 通过率（0~1，指数加权）
+    pass_rate = models.FloatField(default=0, verbose_name='通过率')
+    # 结果翻转率：相邻两次执行结果不同的比例（0~1，指数加权）
+    flip_rate = models.FloatField(default=0, verbose_name='翻转率')
+    # 耗时均值（ms，指数加权）
+    duration_mean = models.FloatField(blank=True, null=True, verbose_name='耗时均值(ms)')
+    # 耗时方差（ms²，指数加权）
+    duration_var = models.FloatField(default=0, verbose_name='耗时方差')
+    # 不稳定度（0~100）：翻转率按执行次数折算可信度，执行次数不足时偏低
+    flakiness = models.FloatField(default=0, db_index=True, verbose_name='不稳定度')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='最近更新时间')
+
+    @property
+    def duration_std(self):
+        return self.duration_var ** 0.5
+
+    def add(self, passed, duration, alpha, min_runs):
+        """
+        计入一次执行结果
+        :param passed: 是否通过
+        :param duration: 耗时（ms），为空时不计入耗时统计
+        :param alpha: 指数加权系数（0~1，越大越偏重最近的结果）
+        :param min_runs: 不稳定度完全可信所需的执行次数
+        """
+        x = 1.0 if passed else 0.0
+        if self.runs == 0:
+            self.pass_rate = x
+        else:
+            self.pass_rate += alpha * (x - self.pass_rate)
+            self.flip_rate += alpha * ((passed != self.last_passed) - self.flip_rate)
+        if duration is not None:
+            if self.duration_mean is None:
+                self.duration_mean = float(duration)
+                self.duration_var = 0
+            else:
+                diff = duration - self.duration_mean
+                incr = alpha * diff
+                self.duration_mean += incr
+                self.duration_var = (1 - alpha) * (self.duration_var + diff * incr)
+        self.runs += 1
+        self.passes += bool(passed)
+        self.last_passed = bool(passed)
+        self.flakiness = round(100 * self.flip_rate * min(self.runs / max(min_runs, 1), 1), 2)
+
+    class Meta:
+        abstract = True
+
+
+class CaseStat(RunStat):
+    """
+    用例执行统计
+    """
+    case = models.OneToOneField(Case, on_delete=models.CASCADE, primary_key=True, related_name='run_stat',
+                                verbose_name='用例')
+
+    def __str__(self):
+        return str(self.case)
+
+    class Meta:
+        verbose_name = '用例执行统计'
+        verbose_name_plural = verbose_name
+        db_table = 'test_plt_case_stat'
+
+
+class CaseApiDefStat(RunStat):
+    """
+    用例接口执行统计
+    """
+    case_api = models.OneToOneField(CaseApiDef, on_delete=models.CASCADE, primary_key=True, related_name='run_stat',
+                                    verbose_name='用例接口')
+
+    def __str__(self):
+        return str(self.case_api)
+
+    class Meta:
+        verbose_name = '用例接口执行统计'
+        verbose_name_plural = verbose_name
+        db_table = 'test_plt_case_apidef_stat'
+
+
 
 
 
@@ -1,10 +1,15 @@
 # 一个测试任务
 import logging
-from celery import shared_task
+import os
+from datetime import datetime
+from celery import chord, current_app, shared_task
+from celery.exceptions import SoftTimeLimitExceeded
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.utils import timezone
-from test_plt.models import Case, CaseSuite, TestBatch
-from test_plt.utils import common, dingtalk
+from test_plt.models import Case, CaseSuite, TestBatch, TestBatchShard
+from test_plt.utils import archive, breaker, common, deadline, dingtalk, dispatch, events, latency, metrics, \
+    ordering, planner, preflight, replica, sharding, selection, snapshot, timeouts, trace
 
 
 # @shared_task()
@@ -12,34 +17,174 @@ from test_plt.utils import common, dingtalk
 #     return a+b
 
 
-def run_cases(case_ids, user_id, bat_id):
+def run_cases(case_ids, user_id, bat_id, fingerprints=None):
     logger = logging.getLogger('test_plt')
     logger.info(f"run_cases task start: case_ids={case_ids}; bat_id={bat_id}; user_id={user_id}")
-    suite_ctx = {}
     task_flag = False
     # 获取所选的用例
     # 实例化一个用例执行履历
     bat: TestBatch = TestBatch.objects.get(id=bat_id)
-    try:
-        for case_id in case_ids:  # type:Case
-            case = Case.objects.get(id=case_id)
-            user = User.objects.get(id=user_id)
-            case_flag = common.perform_case(case, user, suite_ctx=suite_ctx, test_batch=bat)
-            if not case_flag and case.abort_when_fail:
-                logger.info(f"【{case.name}】执行失败，原因：有用例接口执行失败且要求用例执行终止.")
-                break
-        bat.status = TestBatch.STATUS_FINISHED
-        bat.stat()
-    except Exception as e:
-        bat.status = TestBatch.STATUS_FAILED
-        bat.error_msg = str(e)
-        task_flag = False
-    bat.finish_at = timezone.now()
-    bat.save()
+    with trace.span('test_batch', bat_id=bat.id, obj_type='case', project_id=bat.project_id) as sp, \
+            deadline.batch(bat.id, settings.TEST_PLT_BATCH_DEADLINE):
+        bat.trace_id = sp.trace_id
+        try:
+            preflight.ensure(case_ids=case_ids)
+            run_case_list(bat, case_ids, user_id, fingerprints)
+            finish_batch(bat)
+        except deadline.BatchCancelled as e:
+            bat.status = TestBatch.STATUS_CANCELLED
+            bat.error_msg = str(e)
+            sp.set_error(e)
+        except Exception as e:
+            fail_batch(bat, e)
+            sp.set_error(bat.error_msg)
+            task_flag = False
+        stat_batch(bat)
+        bat.finish_at = timezone.now()
+        bat.save()
+    close_batch(bat)
     logger.info(f"run_cases task finished.")
-    dingtalk.send_text(repr(bat), tmpl=dingtalk.DINGTALK_TEXT_TMPL_API_TASK)
     return task_flag
 
+
+def run_case_list(bat: TestBatch, case_ids, user_id, fingerprints=None):
+    """
+    依次执行用例（整个批次，或批次的一个分片）
+    :param fingerprints: 已计算的用例指纹 {用例ID: 指纹}，为空时在开始执行前一次性计算
+    :return: 是否全部执行（有用例失败且要求终止时返回 False）
+    """
+    logger = logging.getLogger('test_plt')
+    suite_ctx = {}
+    user = User.objects.get(id=user_id)
+    if fingerprints is None:
+        fingerprints = selection.fingerprints(case_ids)
+    for case_id in case_ids:  # type:Case
+        deadline.check()
+        case = Case.objects.get(id=case_id)
+        case_flag = common.perform_case(case, user, suite_ctx=suite_ctx, test_batch=bat,
+                                        fingerprint=fingerprints.get(case_id))
+        if not case_flag and case.abort_when_fail:
+            logger.info(f"【{case.name}】执行失败，原因：有用例接口执行失败且要求用例执行终止.")
+            return False
+    return True
+
+
+def start_shards(bat_id, case_ids, user_id):
+    """
+    用例较多时，按历史耗时把批次拆分为多个分片子任务并行执行，全部结束后由 finish_shards 汇总
+    :return: 是否已按分片执行（False 表示不需要分片，由调用方直接执行）
+    """
+    bat: TestBatch = TestBatch.objects.get(id=bat_id)
+    plan = sharding.plan(case_ids, bat.shard_count)
+    if not plan:
+        return False
+    try:
+        preflight.ensure(case_ids=case_ids)
+    except preflight.PreflightFailed:
+        # 不分片，由 run_cases 再次预检并按常规流程记录失败
+        return False
+    # 批次的根 span 由 finish_shards / abort_shards 结束，各分片的 span 是它的子 span
+    root = trace.start('test_batch', bat_id=bat.id, obj_type='case', project_id=bat.project_id, shards=len(plan))
+    bat.trace_id = root.trace_id
+    bat.save(update_fields=['trace_id'])
+    # 分片与批次在同一个任务通道中执行
+    route = 'test_plt.tasks.run_case_periodic' if bat.run_type == TestBatch.RUN_TYPE_PERIODIC \
+        else 'test_plt.tasks.run_cases_queue'
+    options = settings.CELERY_TASK_ROUTES[route]
+    header = []
+    for seq, (ids, predicted_ms) in enumerate(plan, start=1):
+        shard = TestBatchShard.objects.create(test_batch=bat, seq=seq, case_ids=ids, predicted_ms=predicted_ms)
+        header.append(run_case_shard.s(shard.id, user_id, root.context()).set(**options))
+    callback = finish_shards.s(bat_id, root.context()).set(**options) \
+        .on_error(abort_shards.s(bat_id, root.context()))
+    chord(header)(callback)
+    logging.getLogger('test_plt').info(f"批次[{bat_id}]拆分为{len(plan)}个分片执行，"
+                                       f"预计耗时：{[int(ms) for _, ms in plan]}ms")
+    return True
+
+
+@shared_task(bind=True)
+def run_case_shard(self, shard_id, user_id, trace_ctx=None):
+    """
+    执行批次的一个分片，结果记录在 TestBatchShard 上，由 finish_shards 汇总到批次
+    :param trace_ctx: 批次根 span 的上下文，见 trace.Span.context
+    """
+    shard = TestBatchShard.objects.select_related('test_batch').get(id=shard_id)
+    bat = shard.test_batch
+    shard.start_at = timezone.now()
+    shard.worker_hostname = self.request.hostname
+    shard.save(update_fields=['start_at', 'worker_hostname'])
+    with trace.span('shard', trace_id=bat.trace_id, parent=trace_ctx, bat_id=bat.id, seq=shard.seq,
+                    case_count=len(shard.case_ids)) as sp, deadline.batch(bat.id, settings.TEST_PLT_BATCH_DEADLINE):
+        try:
+            run_case_list(bat, shard.case_ids, user_id)
+            shard.status = TestBatch.STATUS_FINISHED
+        except deadline.BatchCancelled as e:
+            shard.status = TestBatch.STATUS_CANCELLED
+            shard.error_msg = str(e)
+        except Exception as e:
+            shard.status = TestBatch.STATUS_FAILED
+            shard.error_msg = error_text(e)
+            sp.set_error(shard.error_msg)
+    shard.finish_at = timezone.now()
+    shard.actual_ms = (shard.finish_at - shard.start_at).total_seconds() * 1000
+    shard.save()
+    return shard.status
+
+
+@shared_task()
+def finish_shards(statuses, bat_id, trace_ctx=None):
+    """
+    所有分片结束后汇总批次结果
+    :param statuses: 各分片的运行状态
+    :param bat_id: 测试批次ID
+    :param trace_ctx: 批次根 span 的上下文，汇总完成后结束该 span
+    """
+    bat: TestBatch = TestBatch.objects.get(id=bat_id)
+    try:
+        failed = bat.shards.filter(status=TestBatch.STATUS_FAILED).order_by('seq')
+        interrupted = deadline.signal(bat.id)
+        if isinstance(interrupted, deadline.BatchAborted):
+            # 批次被中止（如错误预算耗尽），各分片的错误消息相同，只记录一次
+            bat.status = TestBatch.STATUS_FAILED
+            bat.error_msg = str(interrupted)
+        elif TestBatch.STATUS_CANCELLED in statuses:
+            bat.status = TestBatch.STATUS_CANCELLED
+            bat.error_msg = str(deadline.BatchCancelled(deadline.cancel_reason(bat.id)))
+        elif failed:
+            bat.status = TestBatch.STATUS_FAILED
+            bat.error_msg = '；'.join(f"分片{shard.seq}：{shard.error_msg}" for shard in failed)
+        else:
+            finish_batch(bat)
+        stat_batch(bat)
+        bat.finish_at = timezone.now()
+        bat.save()
+        close_batch(bat)
+    finally:
+        if trace_ctx:
+            trace.close(trace_ctx, bat.error_msg)
+        dispatch.release(bat_id)
+
+
+@shared_task()
+def abort_shards(request, exc, traceback, bat_id, trace_ctx=None):
+    """
+    分片任务异常退出（如被强制终止）时，批次记为失败
+    """
+    bat: TestBatch = TestBatch.objects.get(id=bat_id)
+    try:
+        if bat.status == TestBatch.STATUS_PENDING:
+            bat.status = TestBatch.STATUS_FAILED
+            bat.error_msg = f"分片任务异常：{exc!r}"
+            stat_batch(bat)
+            bat.finish_at = timezone.now()
+            bat.save()
+            close_batch(bat)
+    finally:
+        if trace_ctx:
+            trace.close(trace_ctx, bat.error_msg)
+        dispatch.release(bat_id)
+
 # def run_cases(case_ids, user_id, bat_id):
 #     logger = logging.getLogger('test_plt')
 #     logger.info(f"run_cases task start: case_ids={case_ids}; bat_id={bat_id}; user_id={user_id}")
@@ -71,22 +216,123 @@ def run_cases(case_ids, user_id, bat_id):
 #     return task_flag
 
 
-@shared_task()
-def run_cases_queue(case_ids, user_id, bat_id):
-    return run_cases(case_ids, user_id, bat_id)
+def finish_batch(bat: TestBatch):
+    """
+    批次正常执行完毕；执行过程中有部署环境熔断时，批次记为失败并说明故障环境
+    """
+    outage = breaker.outage_msg(bat)
+    bat.status = TestBatch.STATUS_FAILED if outage else TestBatch.STATUS_FINISHED
+    bat.error_msg = outage
 
 
-@shared_task()
-def run_case_periodic(case_ids, user_id, periodic_task_id=None):
+def fail_batch(bat: TestBatch, e):
+    """
+    批次执行失败（包括超过批次时限、超过 celery 任务的软时限）
+    """
+    bat.status = TestBatch.STATUS_FAILED
+    bat.error_msg = error_text(e)
+
+
+def error_text(e):
+    if isinstance(e, SoftTimeLimitExceeded):
+        return f"超过任务时限（{settings.CELERY_TASK_SOFT_TIME_LIMIT}秒），执行中止"
+    return str(e)
+
+
+def close_batch(bat: TestBatch):
+    """
+    批次结束后的收尾：记录指标、生成报告快照、通知批次页面、发送钉钉通知
+    """
+    metrics.observe_batch_finish(bat)
+    snapshot.build_quietly(bat)
+    events.batch(bat)
+    dingtalk.send_text(repr(bat) + latency.report_text(bat), tmpl=dingtalk.DINGTALK_TEXT_TMPL_API_TASK)
+
+
+def stat_batch(bat: TestBatch):
+    """
+    统计批次结果：无论批次正常结束、失败还是被取消，都保存已执行部分的统计数据
+    """
+    try:
+        bat.stat()
+    except Exception as e:
+        logging.getLogger('test_plt').warning(f"批次[{bat.id}]统计失败：{e}")
+
+
+def cancel_batch(bat: TestBatch, reason=None):
+    """
+    取消批次：尚未被 worker 领取的批次从调度队列撤回（或撤销 celery 任务）并直接记为已取消；
+    执行中的批次设置取消标记，由 worker 在下一个接口执行前中止
+    :param bat: 测试批次（排队中）
+    :param reason: 取消原因
+    :return: True 表示已直接取消，False 表示已通知执行中的 worker
+    """
+    deadline.cancel(bat.id, reason)
+    if bat.picked_at is not None:
+        return False
+    if not dispatch.withdraw(bat) and bat.task_id:
+        current_app.control.revoke(bat.task_id)
+        dispatch.release(bat.id)
+    bat.status = TestBatch.STATUS_CANCELLED
+    bat.error_msg = str(deadline.BatchCancelled(reason))
+    bat.finish_at = timezone.now()
+    stat_batch(bat)
+    bat.save()
+    events.batch(bat)
+    return True
+
+
+def mark_picked(bat_id, request):
+    """
+    记录批次被 worker 领取的时间和 worker 信息，入队时间取自任务消息头（见 celery.stamp_enqueued_at）
+    :param bat_id: 测试批次ID
+    :param request: celery 任务的 request 上下文
+    """
+    fields = {
+        'task_id': request.id,
+        'picked_at': timezone.now(),
+        'worker_hostname': request.hostname,
+        'worker_pid': os.getpid(),
+    }
+    enqueued_at = request.get('enqueued_at')
+    if enqueued_at:
+        fields['enqueued_at'] = timezone.make_aware(datetime.fromtimestamp(enqueued_at))
+    TestBatch.objects.filter(id=bat_id).update(**fields)
+
+
+@shared_task(bind=True)
+def run_cases_queue(self, case_ids, user_id, bat_id):
+    mark_picked(bat_id, self.request)
+    case_ids = ordering.arrange(case_ids, TestBatch.objects.values_list('order_mode', flat=True).get(id=bat_id))
+    if start_shards(bat_id, case_ids, user_id):
+        # 调度槽位在所有分片结束后由 finish_shards 释放
+        return True
+    try:
+        return run_cases(case_ids, user_id, bat_id)
+    finally:
+        dispatch.release(bat_id)
+
+
+@shared_task(bind=True)
+def run_case_periodic(self, case_ids, user_id, periodic_task_id=None, order_mode=TestBatch.ORDER_REORDER,
+                      select_mode=TestBatch.SELECT_ALL):
     """
     异步执行 计划任务 的函数
     :param case_ids: 测试用例的id值
     :param user_id: 用例执行者的id值
     :param periodic_task_id: 计划任务的 id 值
+    :param order_mode: 用例排序方式（可在计划任务的关键字参数中指定）
+    :param select_mode: 用例选择方式（可在计划任务的关键字参数中指定）
     :return:
     """
     # cases = [Case.objects.get(id=cid) for cid in case_ids]  # 思考题：效率？太低了
     case = Case.objects.get(id=case_ids[0])
+    planned = len(case_ids)
+    fingerprints = None
+    if select_mode == TestBatch.SELECT_CHANGED:
+        # 不可独立执行的用例可能依赖前面用例设置的上下文，只跳过可独立执行的用例
+        fingerprints = selection.fingerprints(case_ids)
+        case_ids = selection.select_changed(case_ids, only_independent=True, current=fingerprints)
     bat = TestBatch.objects.create(
         project=case.project,
         created_by_id=user_id,
@@ -94,11 +340,19 @@ def run_case_periodic(case_ids, user_id, periodic_task_id=None):
         run_type=TestBatch.RUN_TYPE_PERIODIC,
         obj_type=TestBatch.OBJ_TYPE_CASE,
         status=TestBatch.STATUS_PENDING,
-        periodic_task_id=periodic_task_id
+        periodic_task_id=periodic_task_id,
+        order_mode=order_mode,
+        select_mode=select_mode,
+        stat_case_skipped=planned - len(case_ids),
+        estimated_ms=planner.estimate(case_ids, case.project)['run_ms'],
     )
     for cid in case_ids:
         bat.cases.create(case_id=cid, test_batch=bat)
-    return run_cases(case_ids, user_id, bat.id)
+    mark_picked(bat.id, self.request)
+    case_ids = ordering.arrange(case_ids, order_mode)
+    if start_shards(bat.id, case_ids, user_id):
+        return True
+    return run_cases(case_ids, user_id, bat.id, fingerprints)
 
 
 def run_suites(suites_id, user_id, bat_id):
@@ -106,49 +360,81 @@ def run_suites(suites_id, user_id, bat_id):
     proj_ctx = {}
     task_flag = True
     bat: TestBatch = TestBatch.objects.get(id=bat_id)
-    try:
-        for suite_id in suites_id:
-            suit_flag = True
-            suite_ctx = {}
-            suite = CaseSuite.objects.get(id=suite_id)
-            user = User.objects.get(id=user_id)
-            logger.info(f'[{suite.name}] 执行开始')
-            suite_log = common.push_case_suite_run_log(suite, user=user, test_batch=bat)
-            for case in suite.cases.order_by("reorder"):  # type: Case
-                case_flag = common.perform_case(case, user, case_suite=suite, case_suite_log=suite_log,
-                                                suite_ctx=suite_ctx, proj_ctx=proj_ctx, test_batch=bat)
-                if not case_flag and case.abort_when_fail:
-                    # 用例失败后，返回具体失败的用例名字
-                    errmsg = f"[{case.name}] 执行失败，有用例接口执行失败且要求用例执行中止"
-                    logger.info(errmsg)
-                    common.push_case_suite_run_log(suite, suite_log=suite_log, passed=False, err_msg=errmsg)
-                    suit_flag = False
-                    break
-            if suit_flag:
-                common.push_case_suite_run_log(suite, suite_log=suite_log, passed=True)
-            logger.info(f'[{suite.name}] 执行结束')
-
-        bat.status = TestBatch.STATUS_FINISHED
-        bat.stat()
-    except Exception as e:
-        bat.status = TestBatch.STATUS_FAILED
-        bat.error_msg = str(e)
-        task_flag = False
+    with trace.span('test_batch', bat_id=bat.id, obj_type='suite', project_id=bat.project_id) as sp, \
+            deadline.batch(bat.id, settings.TEST_PLT_BATCH_DEADLINE):
+        bat.trace_id = sp.trace_id
+        try:
+            preflight.ensure(suite_ids=suites_id)
+            for suite_id in suites_id:
+                deadline.check()
+                suit_flag = True
+                suite_ctx = {}
+                suite = CaseSuite.objects.get(id=suite_id)
+                user = User.objects.get(id=user_id)
+                logger.info(f'[{suite.name}] 执行开始')
+                with trace.span('suite', suite_id=suite.id, suite_name=suite.name) as suite_sp:
+                    suite_log = common.push_case_suite_run_log(suite, user=user, test_batch=bat)
+                    cases = {case.id: case for case in suite.cases.order_by("reorder")}
+                    case_ids = list(cases)
+                    fingerprints = selection.fingerprints(case_ids)
+                    if bat.select_mode == TestBatch.SELECT_CHANGED:
+                        # 套件中的用例可能依赖前面用例设置的上下文，只跳过可独立执行的用例
+                        case_ids = selection.select_changed(case_ids, only_independent=True, current=fingerprints)
+                        bat.stat_case_skipped = (bat.stat_case_skipped or 0) + len(cases) - len(case_ids)
+                    for case_id in ordering.arrange(case_ids, bat.order_mode):
+                        case: Case = cases[case_id]
+                        try:
+                            case_flag = common.perform_case(case, user, case_suite=suite, case_suite_log=suite_log,
+                                                            suite_ctx=suite_ctx, proj_ctx=proj_ctx, test_batch=bat,
+                                                            fingerprint=fingerprints.get(case_id))
+                        except deadline.Interrupted as e:
+                            # 批次中止：当前套件记为失败后中止整个批次
+                            common.push_case_suite_run_log(suite, suite_log=suite_log, passed=False, err_msg=str(e))
+                            suite_sp.set_error(e)
+                            raise
+                        if not case_flag and case.abort_when_fail:
+                            # 用例失败后，返回具体失败的用例名字
+                            errmsg = f"[{case.name}] 执行失败，有用例接口执行失败且要求用例执行中止"
+                            logger.info(errmsg)
+                            common.push_case_suite_run_log(suite, suite_log=suite_log, passed=False, err_msg=errmsg)
+                            suite_sp.set_error(errmsg)
+                            suit_flag = False
+                            break
+                    if suit_flag:
+                        common.push_case_suite_run_log(suite, suite_log=suite_log, passed=True)
+                logger.info(f'[{suite.name}] 执行结束')
 
-    bat.finish_at = timezone.now()
-    bat.save()
+            finish_batch(bat)
+        except deadline.BatchCancelled as e:
+            bat.status = TestBatch.STATUS_CANCELLED
+            bat.error_msg = str(e)
+            sp.set_error(e)
+            task_flag = False
+        except Exception as e:
+            fail_batch(bat, e)
+            sp.set_error(bat.error_msg)
+            task_flag = False
+
+        stat_batch(bat)
+        bat.finish_at = timezone.now()
+        bat.save()
+    close_batch(bat)
     logger.info(f"run_suites task finished.")
-    dingtalk.send_text(repr(bat), tmpl=dingtalk.DINGTALK_TEXT_TMPL_API_TASK)
     return task_flag
 
 
-@shared_task()
-def run_suites_queue(suite_ids, user_id, bat_id):
-    return run_suites(suite_ids, user_id, bat_id)
+@shared_task(bind=True)
+def run_suites_queue(self, suite_ids, user_id, bat_id):
+    mark_picked(bat_id, self.request)
+    try:
+        return run_suites(suite_ids, user_id, bat_id)
+    finally:
+        dispatch.release(bat_id)
 
 
-@shared_task()
-def run_suites_periodic(suite_ids, user_id, periodic_task_id=None):
+@shared_task(bind=True)
+def run_suites_periodic(self, suite_ids, user_id, periodic_task_id=None, order_mode=TestBatch.ORDER_REORDER,
+                        select_mode=TestBatch.SELECT_ALL):
     logger = logging.getLogger('test_plt')
     suite = CaseSuite.objects.get(id=suite_ids[0])
     bat = TestBatch.objects.create(
@@ -158,8 +444,41 @@ def run_suites_periodic(suite_ids, user_id, periodic_task_id=None):
         run_type=TestBatch.RUN_TYPE_PERIODIC,
         obj_type=TestBatch.OBJ_TYPE_SUITE,
         status=TestBatch.STATUS_PENDING,
-        periodic_task_id=periodic_task_id
+        periodic_task_id=periodic_task_id,
+        order_mode=order_mode,
+        select_mode=select_mode,
+        # 套件按顺序执行，不分片
+        estimated_ms=planner.estimate(planner.suite_case_ids(suite_ids), suite.project, shards=1)['run_ms'],
     )
     for sid in suite_ids:
         bat.suites.create(case_suite_id=sid, test_batch=bat)
+    mark_picked(bat.id, self.request)
     return run_suites(suite_ids, user_id, bat.id)
+
+
+@shared_task()
+def dispatch_pump():
+    """
+    定时兜底派发公平调度队列中的批次
+    """
+    if settings.TEST_PLT_FAIR_SHARE:
+        dispatch.pump()
+
+
+@shared_task()
+def refresh_timeouts():
+    """
+    定时刷新各接口的自适应超时
+    """
+    if settings.TEST_PLT_ADAPTIVE_TIMEOUT:
+        return timeouts.refresh()
+
+
+@shared_task()
+def archive_run_logs():
+    """
+    定时增量归档执行履历（列式文件，供离线分析）
+    """
+    if settings.TEST_PLT_ARCHIVE:
+        with replica.reads():
+            return archive.export_all()
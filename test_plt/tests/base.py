@@ -0,0 +1,72 @@
+"""
+测试公用的数据构造与平台 Redis 替身（fakeredis）
+"""
+from datetime import timedelta
+
+import fakeredis
+from django.contrib.auth.models import User
+from django.utils import timezone
+
+from test_plt.models import ApiDef, ApiRunLog, Case, CaseApiDef, CaseRunLog, DeployEnv, Project, TestBatch
+from test_plt.utils import store
+
+
+class FakeRedisMixin:
+    """
+    平台 Redis 使用 fakeredis（每个测试一份独立的数据）
+    """
+    def setUp(self):
+        super().setUp()
+        self.redis = fakeredis.FakeRedis(decode_responses=True)
+        self._store_client = store._client
+        store._client = self.redis
+
+    def tearDown(self):
+        store._client = self._store_client
+        super().tearDown()
+
+
+def make_user(username='admin'):
+    return User.objects.create_superuser(username, f'{username}@example.com', username)
+
+
+def make_project(user, name='P1', **kwargs):
+    return Project.objects.create(name=name, version='1', type=1, created_by=user, **kwargs)
+
+
+def make_api(project, user, name='api1', **kwargs):
+    env = DeployEnv.objects.create(project=project, name=f'{name}-env', hostname='127.0.0.1', port=9)
+    fields = dict(protocol='http', http_schema='http', deploy_env=env, http_method='get', uri='/x', auth_type='none',
+                  body_type='none', project=project, name=name, created_by=user)
+    fields.update(kwargs)
+    return ApiDef.objects.create(**fields)
+
+
+def make_case(project, user, api, name='case', reorder=1, **kwargs):
+    fields = dict(project=project, name=name, reorder=reorder, created_by=user, abort_when_fail=False)
+    fields.update(kwargs)
+    case = Case.objects.create(**fields)
+    CaseApiDef.objects.create(case=case, api=api, reorder=1, abort_when_fail=False)
+    return case
+
+
+def make_batch(project, **kwargs):
+    now = timezone.now()
+    fields = dict(project=project, start_at=now, obj_type=TestBatch.OBJ_TYPE_CASE, run_type=TestBatch.RUN_TYPE_QUEUE,
+                  status=TestBatch.STATUS_FINISHED)
+    fields.update(kwargs)
+    return TestBatch.objects.create(**fields)
+
+
+def make_case_log(bat, case, passed=True, steps=(), start_at=None):
+    """
+    批次中一个用例的执行履历
+    :param steps: 各接口执行的 (接口, 是否成功, 耗时ms)
+    """
+    start_at = start_at or timezone.now()
+    log = CaseRunLog.objects.create(case=case, test_batch=bat, start_at=start_at, passed=passed,
+                                    duration=sum(d for _, _, d in steps))
+    for i, (api, success, duration) in enumerate(steps):
+        ApiRunLog.objects.create(api=api, case_run_log=log, success=success, duration=duration,
+                                 status_code=200 if success else 500, start_at=start_at + timedelta(milliseconds=i))
+    return log
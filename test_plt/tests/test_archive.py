@@ -0,0 +1,74 @@
+import shutil
+import tempfile
+
+from django.test import TestCase
+from django.utils import timezone
+
+from test_plt.models import ApiRunLog, TestBatch
+from test_plt.tests.base import make_api, make_batch, make_case, make_case_log, make_project, make_user
+from test_plt.utils import archive
+
+
+class ArchiveExportTests(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        user = make_user()
+        self.project = make_project(user)
+        self.api = make_api(self.project, user)
+        self.case = make_case(self.project, user, self.api)
+        # 固定在同一天，避免跨零点时分到两天
+        self.start_at = timezone.localtime().replace(hour=12, minute=0, second=0, microsecond=0)
+
+    def run_batch(self, status=TestBatch.STATUS_FINISHED, steps=((True, 10), (False, 20))):
+        bat = make_batch(self.project, status=status)
+        make_case_log(bat, self.case, steps=[(self.api, success, duration) for success, duration in steps],
+                      start_at=self.start_at)
+        return bat
+
+    def archived_ids(self, table='api_run_log'):
+        ids = []
+        for _, parts in archive.partitions(table, self.project.id, root=self.root):
+            ids.extend(archive.load_day(parts, ('id',))['id'].tolist())
+        return sorted(ids)
+
+    def part_dirs(self):
+        return sorted(p for _, parts in archive.partitions('api_run_log', self.project.id, root=self.root)
+                      for p in parts)
+
+    def test_exports_only_new_rows(self):
+        self.run_batch()
+        self.assertEqual(archive.export_table('api_run_log', self.root), 2)
+        first_parts = self.part_dirs()
+        self.assertEqual(archive.export_table('api_run_log', self.root), 0)
+        self.assertEqual(self.part_dirs(), first_parts)
+
+        self.run_batch(steps=((True, 30),))
+        self.assertEqual(archive.export_table('api_run_log', self.root), 1)
+        # 新增一个 part，已写入的 part 不变
+        self.assertEqual(len(self.part_dirs()), 2)
+        self.assertEqual(self.part_dirs()[0], first_parts[0])
+        self.assertEqual(self.archived_ids(), sorted(ApiRunLog.objects.values_list('id', flat=True)))
+        self.assertEqual(archive.load_state(self.root)['api_run_log'], ApiRunLog.objects.latest('id').id)
+
+    def test_running_batch_holds_back_later_rows(self):
+        self.run_batch()
+        running = self.run_batch(status=TestBatch.STATUS_PENDING)
+        self.run_batch()
+        self.assertEqual(archive.export_table('api_run_log', self.root), 2)
+        self.assertEqual(archive.export_table('case_run_log', self.root), 1)
+
+        running.status = TestBatch.STATUS_FINISHED
+        running.save()
+        self.assertEqual(archive.export_table('api_run_log', self.root), 4)
+        self.assertEqual(archive.export_table('case_run_log', self.root), 2)
+        self.assertEqual(self.archived_ids(), sorted(ApiRunLog.objects.values_list('id', flat=True)))
+
+    def test_chunked_export_and_trend(self):
+        for _ in range(3):
+            self.run_batch()
+        self.assertEqual(archive.export_table('api_run_log', self.root, chunk_size=4), 6)
+        self.assertEqual(len(self.part_dirs()), 2)
+        [day] = archive.latency_trend(self.project.id, api_id=self.api.id, percentiles=(50,), root=self.root)
+        self.assertEqual((day['count'], day['failed'], day['mean']), (6, 3, 10.0))
+        self.assertEqual(day['percentiles'], {50: 10})
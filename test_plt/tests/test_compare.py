@@ -0,0 +1,50 @@
+from django.test import TestCase
+
+from test_plt.models import TestBatch
+from test_plt.tests.base import make_api, make_batch, make_case, make_case_log, make_project, make_user
+from test_plt.utils import compare
+
+
+class CompareTests(TestCase):
+    def setUp(self):
+        user = make_user()
+        self.project = make_project(user)
+        self.api = make_api(self.project, user)
+        self.cases = [make_case(self.project, user, self.api, name=f'case{i}', reorder=i) for i in range(5)]
+        c = self.cases
+        self.base = make_batch(self.project)
+        make_case_log(self.base, c[0], True, [(self.api, True, 10)])
+        make_case_log(self.base, c[1], False, [(self.api, False, 10)])
+        make_case_log(self.base, c[2], True, [(self.api, True, 10)])
+        make_case_log(self.base, c[3], True, [(self.api, True, 10)])
+        self.bat = make_batch(self.project)
+        make_case_log(self.bat, c[0], False, [(self.api, False, 10)])
+        make_case_log(self.bat, c[1], True, [(self.api, True, 10)])
+        make_case_log(self.bat, c[2], True, [(self.api, True, 30)])
+        make_case_log(self.bat, c[4], True, [(self.api, True, 10)])
+
+    def test_compare_cases_and_steps(self):
+        # 两个批次各汇总用例、接口一次
+        with self.assertNumQueries(4):
+            result = compare.compare(self.base, self.bat)
+        c = self.cases
+        self.assertEqual([r['case_id'] for r in result['new_failures']], [c[0].id])
+        self.assertEqual([r['case_id'] for r in result['fixed']], [c[1].id])
+        self.assertEqual(result['still_failing'], [])
+        self.assertEqual([r['case_id'] for r in result['added']], [c[4].id])
+        self.assertEqual([r['case_id'] for r in result['removed']], [c[3].id])
+        self.assertEqual([(r['case'], r['failed']) for r in result['step_failures']], [('case0', 1)])
+        self.assertEqual([(r['case'], r['base'], r['avg'], r['ratio']) for r in result['slower']],
+                         [('case2', 10, 30, 200)])
+        self.assertEqual(result['faster'], [])
+
+    def test_same_case_in_several_suites_is_merged(self):
+        make_case_log(self.bat, self.cases[1], False, [(self.api, False, 10)])
+        digest = compare.case_digest(self.bat)[self.cases[1].id]
+        self.assertEqual((digest['runs'], digest['failed'], digest['passed']), (2, 1, False))
+
+    def test_previous_skips_unfinished_batches(self):
+        make_batch(self.project, status=TestBatch.STATUS_PENDING)
+        latest = make_batch(self.project)
+        self.assertEqual(compare.previous(latest), self.bat)
+        self.assertIsNone(compare.previous(self.base))
@@ -0,0 +1,99 @@
+from types import SimpleNamespace
+from unittest import mock
+
+import redis
+from django.test import TestCase, override_settings
+
+from test_plt.models import TestBatch
+from test_plt.tests.base import FakeRedisMixin, make_batch, make_project, make_user
+from test_plt.utils import dispatch
+
+TASK = 'test_plt.tasks.run_cases_queue'
+
+
+@override_settings(TEST_PLT_FAIR_SHARE=True, TEST_PLT_DISPATCH_SLOTS=1)
+class FairShareDispatchTests(FakeRedisMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        user = make_user()
+        self.proj_a = make_project(user, name='A')
+        self.proj_b = make_project(user, name='B')
+        patcher = mock.patch.object(dispatch.current_app, 'send_task',
+                                    side_effect=lambda name, args, headers=None: SimpleNamespace(id=f'task-{args[0]}'))
+        self.send_task = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def submit(self, project, count):
+        bats = [make_batch(project, status=TestBatch.STATUS_PENDING) for _ in range(count)]
+        for bat in bats:
+            dispatch.submit(bat, TASK, [bat.id])
+        return bats
+
+    def sent(self):
+        return [c.kwargs['args'][0] for c in self.send_task.call_args_list]
+
+    def drain(self):
+        """
+        依次结束已派发的批次，直到没有等待中的任务
+        """
+        done = 0
+        while done < len(self.sent()):
+            dispatch.release(self.sent()[done])
+            done += 1
+        return self.sent()
+
+    def test_projects_take_turns_once_both_are_active(self):
+        a = self.submit(self.proj_a, 4)
+        b = self.submit(self.proj_b, 2)
+        self.assertEqual(self.sent(), [a[0].id])
+        # B 的虚拟时间追平到 A，之后两个项目轮流派发，而不是等 A 的全部批次执行完
+        self.assertEqual(self.drain(), [a[0].id, a[1].id, b[0].id, a[2].id, b[1].id, a[3].id])
+        self.assertEqual(TestBatch.objects.get(id=b[0].id).task_id, f'task-{b[0].id}')
+
+    def test_weight_gives_larger_share(self):
+        self.proj_b.fair_share_weight = 2
+        self.proj_b.save()
+        a = self.submit(self.proj_a, 3)
+        b = self.submit(self.proj_b, 4)
+        # 两个项目都活跃后，B 每派发2个批次 A 才派发1个
+        self.assertEqual(self.drain(), [a[0].id, a[1].id, b[0].id, b[1].id, a[2].id, b[2].id, b[3].id])
+
+    @override_settings(TEST_PLT_DISPATCH_SLOTS=3)
+    def test_project_concurrency_limit(self):
+        self.proj_a.max_concurrency = 1
+        self.proj_a.save()
+        a = self.submit(self.proj_a, 2)
+        b = self.submit(self.proj_b, 1)
+        self.assertEqual(self.sent(), [a[0].id, b[0].id])
+        dispatch.release(a[0].id)
+        self.assertEqual(self.sent(), [a[0].id, b[0].id, a[1].id])
+
+    def test_failed_send_is_requeued_at_head(self):
+        self.send_task.side_effect = RuntimeError('broker down')
+        a = self.submit(self.proj_a, 2)
+        self.assertEqual(dispatch.queue_position(a[0])[0], 1)
+        self.assertEqual(self.redis.zcard(dispatch.KEY_RUNNING % self.proj_a.id), 0)
+        self.assertEqual(float(self.redis.hget(dispatch.KEY_VTIME, self.proj_a.id)), 0)
+
+        self.send_task.side_effect = lambda name, args, headers=None: SimpleNamespace(id='t')
+        dispatch.pump()
+        self.assertEqual(self.sent()[-1], a[0].id)
+        self.assertIn('enqueued_at', self.send_task.call_args.kwargs['headers'])
+
+    def test_withdraw_pending_batch(self):
+        a = self.submit(self.proj_a, 2)
+        self.assertTrue(dispatch.withdraw(a[1]))
+        self.assertFalse(dispatch.withdraw(a[1]))
+        dispatch.release(a[0].id)
+        self.assertEqual(self.sent(), [a[0].id])
+
+    def test_sends_directly_when_redis_unavailable(self):
+        with mock.patch.object(self.redis, 'lock', side_effect=redis.ConnectionError('down')):
+            a = self.submit(self.proj_a, 2)
+        self.assertEqual(self.sent(), [a[0].id, a[1].id])
+
+    @override_settings(TEST_PLT_FAIR_SHARE=False)
+    def test_sends_directly_when_disabled(self):
+        a = self.submit(self.proj_a, 2)
+        self.assertEqual(self.sent(), [a[0].id, a[1].id])
+        self.assertFalse(self.redis.keys('test_plt:fs:*'))
@@ -0,0 +1,93 @@
+import json
+
+from asgiref.sync import async_to_sync
+from asgiref.testing import ApplicationCommunicator
+from django.conf import settings
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+
+from test_plt.tests.base import make_api, make_batch, make_case, make_case_log, make_project, make_user
+from test_plt.utils import export
+
+
+class ExportDataMixin:
+    def setUp(self):
+        super().setUp()
+        self.user = make_user()
+        self.project = make_project(self.user)
+        self.api = make_api(self.project, self.user)
+        self.bat = make_batch(self.project)
+        self.cases = [make_case(self.project, self.user, self.api, name=f'case{i}', reorder=i) for i in range(5)]
+        for i, case in enumerate(self.cases):
+            make_case_log(self.bat, case, passed=i != 2, steps=[(self.api, i != 2, 10 + i), (self.api, True, 5)])
+
+    def login(self):
+        self.client.force_login(self.user)
+        session = self.client.session
+        session['default_project_id'] = self.project.id
+        session.save()
+
+
+class ExportStreamTests(ExportDataMixin, TestCase):
+    def test_jsonl_merges_steps_under_their_case(self):
+        lines = [json.loads(line) for line in b''.join(export.stream(self.bat, 'jsonl')).decode().splitlines()]
+        self.assertEqual(lines[0]['type'], 'batch')
+        self.assertEqual([r['type'] for r in lines[1:]], ['case', 'step', 'step'] * 5)
+        for i in range(1, len(lines), 3):
+            self.assertEqual({lines[i + 1]['case_run_log_id'], lines[i + 2]['case_run_log_id']}, {lines[i]['id']})
+
+    def test_paging_does_not_lose_rows(self):
+        chunk_size = export.CHUNK_SIZE
+        export.CHUNK_SIZE = 2
+        try:
+            lines = b''.join(export.stream(self.bat, 'jsonl')).decode().splitlines()
+        finally:
+            export.CHUNK_SIZE = chunk_size
+        self.assertEqual(len(lines), 1 + 5 * 3)
+
+    def test_junit_reports_failures(self):
+        xml = b''.join(export.stream(self.bat, 'junit')).decode()
+        self.assertIn('tests="5" failures="1"', xml)
+        self.assertEqual(xml.count('<testcase '), 5)
+
+    def test_export_view_over_wsgi(self):
+        self.login()
+        response = self.client.get(reverse('admin:test_plt_testbatch_export', args=[self.bat.id, 'junit']))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertIn(b'name="case4"', b''.join(response.streaming_content))
+
+
+class ExportOverAsgiTests(ExportDataMixin, TransactionTestCase):
+    """
+    通过 ASGI 应用（Dockerfile 中的部署方式）流式导出：流式响应中的数据库查询不能在事件循环中执行
+    """
+    def test_export_view_over_asgi(self):
+        from auto_test_platform.asgi import application
+
+        self.login()
+        cookie = f"{settings.SESSION_COOKIE_NAME}={self.client.session.session_key}".encode()
+        path = reverse('admin:test_plt_testbatch_export', args=[self.bat.id, 'jsonl'])
+        scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+                 'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+                 'headers': [(b'host', b'testserver'), (b'cookie', cookie)],
+                 'client': ('127.0.0.1', 12345), 'server': ('testserver', 80)}
+
+        async def run():
+            communicator = ApplicationCommunicator(application, scope)
+            await communicator.send_input({'type': 'http.request', 'body': b''})
+            start = await communicator.receive_output(10)
+            body = b''
+            while True:
+                message = await communicator.receive_output(10)
+                body += message.get('body', b'')
+                if not message.get('more_body'):
+                    break
+            await communicator.wait(10)
+            return start, body
+
+        start, body = async_to_sync(run)()
+        self.assertEqual(start['status'], 200)
+        lines = body.decode().splitlines()
+        self.assertEqual(len(lines), 1 + 5 * 3)
+        self.assertEqual(json.loads(lines[-1])['type'], 'step')
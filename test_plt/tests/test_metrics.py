@@ -0,0 +1,31 @@
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+from prometheus_client import REGISTRY
+
+from test_plt.models import TestBatch
+from test_plt.tests.base import make_batch, make_project, make_user
+from test_plt.utils import common
+
+
+def queue_wait_count():
+    return REGISTRY.get_sample_value('test_plt_batch_queue_wait_seconds_count', {'run_type': 'queue'}) or 0
+
+
+class QueueWaitMetricTests(TestCase):
+    def setUp(self):
+        self.project = make_project(make_user())
+
+    def test_queue_wait_measured_from_submit_to_first_step(self):
+        bat = make_batch(self.project, status=TestBatch.STATUS_PENDING, start_at=timezone.now() - timedelta(seconds=90))
+        before_count = queue_wait_count()
+        before_sum = REGISTRY.get_sample_value('test_plt_batch_queue_wait_seconds_sum', {'run_type': 'queue'}) or 0
+        common.mark_first_step(bat)
+        # 同一批次的其他分片（另一个批次对象）不再重复记录
+        common.mark_first_step(TestBatch.objects.get(id=bat.id))
+        common.mark_first_step(bat)
+        self.assertEqual(queue_wait_count(), before_count + 1)
+        waited = REGISTRY.get_sample_value('test_plt_batch_queue_wait_seconds_sum', {'run_type': 'queue'}) - before_sum
+        self.assertGreaterEqual(waited, 90)
+        self.assertIsNotNone(TestBatch.objects.get(id=bat.id).first_step_at)
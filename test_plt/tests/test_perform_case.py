@@ -0,0 +1,85 @@
+from unittest import mock
+
+from celery.exceptions import SoftTimeLimitExceeded
+from django.test import TestCase
+
+from test_plt import tasks
+from test_plt.models import ApiRunLog, CaseApiDef, CaseRunLog, TestBatch
+from test_plt.tests.base import FakeRedisMixin, make_api, make_batch, make_case, make_project, make_user
+from test_plt.utils import common, deadline, repeat
+
+
+class PerformCaseInterruptTests(FakeRedisMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user()
+        self.project = make_project(self.user)
+        self.api = make_api(self.project, self.user)
+        self.case = make_case(self.project, self.user, self.api)
+        self.bat = make_batch(self.project, status=TestBatch.STATUS_PENDING)
+
+    def perform(self):
+        with deadline.batch(self.bat.id, None):
+            return common.perform_case(self.case, self.user, test_batch=self.bat)
+
+    def test_soft_time_limit_in_request_aborts_batch(self):
+        with mock.patch('test_plt.utils.http.requests.request', side_effect=SoftTimeLimitExceeded()):
+            with self.assertRaises(deadline.TaskTimeLimit):
+                self.perform()
+        # 接口执行履历照常保存，但不是普通的接口失败
+        runlog = ApiRunLog.objects.get()
+        self.assertFalse(runlog.success)
+        self.assertIn('超过任务时限', runlog.error_msg)
+        self.assertIsNone(runlog.error_kind)
+        case_log = CaseRunLog.objects.get()
+        self.assertFalse(case_log.passed)
+        self.assertIn('执行中止', case_log.error_msg)
+
+    def test_soft_time_limit_in_check_is_not_a_check_failure(self):
+        with mock.patch('test_plt.utils.http.perform_api', return_value={'success': True, 'duration': 1}), \
+                mock.patch('test_plt.utils.resp.check_case_apidef_http', side_effect=SoftTimeLimitExceeded()):
+            with self.assertRaises(deadline.TaskTimeLimit):
+                self.perform()
+        self.assertFalse(CaseRunLog.objects.get().passed)
+
+    def test_cancelled_batch_stops_before_next_step(self):
+        deadline.cancel(self.bat.id, '测试取消')
+        with mock.patch('test_plt.utils.http.perform_api') as perform_api:
+            with self.assertRaises(deadline.BatchCancelled):
+                self.perform()
+        perform_api.assert_not_called()
+        self.assertIn('测试取消', CaseRunLog.objects.get().error_msg)
+
+    def test_run_cases_fails_batch_on_soft_time_limit(self):
+        with mock.patch('test_plt.utils.http.requests.request', side_effect=SoftTimeLimitExceeded()), \
+                mock.patch('test_plt.tasks.dingtalk.send_text'):
+            tasks.run_cases([self.case.id], self.user.id, self.bat.id)
+        bat = TestBatch.objects.get(id=self.bat.id)
+        self.assertEqual(bat.status, TestBatch.STATUS_FAILED)
+        self.assertIn('超过任务时限', bat.error_msg)
+
+
+class RepeatDeadlineTests(FakeRedisMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        user = make_user()
+        project = make_project(user)
+        self.bat = make_batch(project, status=TestBatch.STATUS_PENDING)
+        case = make_case(project, user, make_api(project, user))
+        self.item = CaseApiDef.objects.get(case=case)
+
+    def test_concurrent_samples_stop_when_batch_cancelled(self):
+        self.item.repeat = 20
+        self.item.repeat_concurrency = 4
+        calls = []
+
+        def execute(save_log):
+            calls.append(save_log)
+            # 第一次（保存履历的那次）执行后批次被取消
+            deadline.cancel(self.bat.id)
+            return {'success': True, 'duration': 5}
+
+        with deadline.batch(self.bat.id, None):
+            result = repeat.run(self.item, execute)
+        self.assertEqual(calls, [True])
+        self.assertEqual(result['samples'], [5])
@@ -0,0 +1,34 @@
+from datetime import timedelta
+
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from test_plt.tests.base import make_batch, make_project, make_user
+from test_plt.utils import common
+
+
+class QueueLatencyReportTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.project = make_project(self.user)
+        now = timezone.now() - timedelta(hours=1)
+        # 排队2秒、启动1秒、执行10秒
+        self.bat = make_batch(self.project, start_at=now, enqueued_at=now, picked_at=now + timedelta(seconds=2),
+                              first_step_at=now + timedelta(seconds=3), finish_at=now + timedelta(seconds=12))
+        # 尚未被领取的批次不计入
+        make_batch(self.project, start_at=now, enqueued_at=now)
+
+    def test_report_aggregates_recorded_fields(self):
+        row, = common.queue_latency_report(timezone.now() - timedelta(days=1))
+        self.assertEqual(row['count'], 1)
+        self.assertEqual((row['wait_avg'], row['startup_avg'], row['run_avg']), (2000, 1000, 10000))
+        self.assertEqual((self.bat.queue_wait_ms, self.bat.startup_ms, self.bat.run_ms), (2000, 1000, 10000))
+
+    def test_report_page(self):
+        self.client.force_login(self.user)
+        session = self.client.session
+        session['default_project_id'] = self.project.id
+        session.save()
+        response = self.client.get(reverse('admin:test_plt_testbatch_queue_latency'))
+        self.assertContains(response, '<td>10000</td>')
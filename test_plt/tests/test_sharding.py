@@ -0,0 +1,63 @@
+from datetime import timedelta
+
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from test_plt.models import Case
+from test_plt.tests.base import make_api, make_batch, make_case, make_case_log, make_project, make_user
+from test_plt.utils import sharding
+
+
+class BalanceTests(SimpleTestCase):
+    def test_longest_first_to_least_loaded_shard(self):
+        estimates = {1: 70, 2: 50, 3: 40, 4: 30, 5: 10}
+        shards = sharding.balance([1, 2, 3, 4, 5], estimates, 2)
+        # 70 -> A；50 -> B；40 -> B(90)；30 -> A(100)；10 -> B(100)
+        self.assertEqual(shards, [([1, 4], 100), ([2, 3, 5], 100)])
+
+    def test_keeps_original_order_within_shard(self):
+        shards = sharding.balance([5, 4, 3, 2, 1], {1: 100, 2: 1, 3: 1, 4: 1, 5: 1}, 2)
+        self.assertEqual(shards, [([1], 100), ([5, 4, 3, 2], 4)])
+
+    def test_dependent_cases_stay_together_in_order(self):
+        estimates = {1: 10, 2: 10, 3: 10, 4: 10, 5: 10}
+        shards = sharding.balance([1, 2, 3, 4, 5], estimates, 3, dependent_ids={2, 4, 5})
+        self.assertIn(([2, 4, 5], 30), shards)
+        self.assertEqual(sorted(c for ids, _ in shards for c in ids), [1, 2, 3, 4, 5])
+
+    def test_skips_empty_shards(self):
+        self.assertEqual(sharding.balance([1, 2], {1: 5, 2: 5}, 4), [([1], 5), ([2], 5)])
+
+
+class PlanTests(TestCase):
+    def setUp(self):
+        user = make_user()
+        project = make_project(user)
+        api = make_api(project, user)
+        self.cases = [make_case(project, user, api, name=f'case{i}', reorder=i, independent=True) for i in range(4)]
+        self.ids = [case.id for case in self.cases]
+        bat = make_batch(project)
+        make_case_log(bat, self.cases[0], steps=[(api, True, 300)])
+        make_case_log(bat, self.cases[0], steps=[(api, True, 100)])
+        make_case_log(bat, self.cases[1], steps=[(api, True, 400)])
+        # 超出统计窗口的历史记录不计入
+        make_case_log(bat, self.cases[2], steps=[(api, True, 9000)],
+                      start_at=timezone.now() - timedelta(days=sharding.HISTORY_DAYS + 1))
+
+    def test_estimate_uses_recent_average_and_median_default(self):
+        estimates = sharding.estimate(self.ids)
+        self.assertEqual(estimates[self.ids[0]], 200)
+        self.assertEqual(estimates[self.ids[1]], 400)
+        self.assertEqual(estimates[self.ids[2]], 300)
+        self.assertEqual(estimates[self.ids[3]], 300)
+
+    @override_settings(TEST_PLT_SHARDS=3, TEST_PLT_SHARD_MIN_CASES=10)
+    def test_plan_respects_min_cases_unless_shards_given(self):
+        self.assertEqual(sharding.plan(self.ids), [])
+        shards = sharding.plan(self.ids, 2)
+        self.assertEqual(len(shards), 2)
+        self.assertEqual(sorted(c for ids, _ in shards for c in ids), sorted(self.ids))
+
+    def test_plan_does_not_split_dependent_cases(self):
+        Case.objects.filter(id__in=self.ids).update(independent=False)
+        self.assertEqual(sharding.plan(self.ids, 4), [])
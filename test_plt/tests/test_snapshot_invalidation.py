@@ -0,0 +1,56 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from test_plt.models import ApiRunLog, CaseRunLog, TestBatchReport
+from test_plt.tests.base import make_api, make_batch, make_case, make_case_log, make_project, make_user
+
+
+def report_deletes(ctx):
+    return [q['sql'] for q in ctx.captured_queries
+            if q['sql'].startswith('DELETE') and 'test_plt_testbatch_report' in q['sql']]
+
+
+class SnapshotInvalidationTests(TestCase):
+    def setUp(self):
+        user = make_user()
+        project = make_project(user)
+        self.api = make_api(project, user)
+        case = make_case(project, user, self.api)
+        self.bat = make_batch(project)
+        self.other = make_batch(project)
+        for bat in (self.bat, self.other):
+            for _ in range(3):
+                make_case_log(bat, case, steps=[(self.api, True, 10), (self.api, False, 20)])
+            TestBatchReport.objects.create(test_batch=bat, data={}, html='')
+
+    def assert_snapshot(self, bat, exists):
+        self.assertEqual(TestBatchReport.objects.filter(test_batch=bat).exists(), exists)
+
+    def test_deleting_case_logs_invalidates_once_per_delete(self):
+        with CaptureQueriesContext(connection) as ctx:
+            CaseRunLog.objects.filter(test_batch=self.bat).delete()
+        self.assertEqual(len(report_deletes(ctx)), 1)
+        self.assert_snapshot(self.bat, False)
+        self.assert_snapshot(self.other, True)
+
+    def test_deleting_step_logs_invalidates_owning_batch(self):
+        with CaptureQueriesContext(connection) as ctx:
+            ApiRunLog.objects.filter(case_run_log__test_batch=self.bat, success=False).delete()
+        self.assertEqual(len(report_deletes(ctx)), 1)
+        self.assert_snapshot(self.bat, False)
+        self.assert_snapshot(self.other, True)
+
+    def test_cascading_delete_across_batches_invalidates_once(self):
+        with CaptureQueriesContext(connection) as ctx:
+            CaseRunLog.objects.all().delete()
+        self.assertEqual(len(report_deletes(ctx)), 1)
+        self.assert_snapshot(self.bat, False)
+        self.assert_snapshot(self.other, False)
+
+    def test_editing_step_log_invalidates_owning_batch(self):
+        runlog = ApiRunLog.objects.filter(case_run_log__test_batch=self.other).first()
+        runlog.success = True
+        runlog.save()
+        self.assert_snapshot(self.other, False)
+        self.assert_snapshot(self.bat, True)
@@ -4,4 +4,5 @@ from test_plt import views
 
 urlpatterns = [
     path('', views.index, name='index'),
-]
\ No newline at end of file
+    path('metrics', views.metrics, name='metrics'),
+]
@@ -0,0 +1,215 @@
+"""
+执行履历列式归档：把接口执行履历（ApiRunLog）、用例执行履历（CaseRunLog）按项目、按天导出为 NumPy 列文件，
+供离线分析（notebook 等）直接读取，不再查询业务数据库。
+
+目录结构（根目录为 settings.TEST_PLT_ARCHIVE_DIR）：
+    <表名>/project=<项目ID>/date=<YYYY-MM-DD>/part-<首行ID>/<列名>.npy
+    _state.json    各表已归档到的最大ID
+
+每次只导出上次归档之后新增的履历（增量追加 part 目录，已写入的文件不再修改）；
+执行中的批次的履历要等批次结束后才归档（其后新增的履历也顺延），保证归档后不会再被更新。
+整数列的空值为 -1，start_at 为 UTC 毫秒时间戳；没有开始时间的履历不归档。
+
+读取时用 np.load(mmap_mode='r') 映射文件，按天处理，内存占用与归档总量无关。
+"""
+import json
+import os
+import shutil
+from datetime import timedelta
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from test_plt.models import ApiRunLog, CaseRunLog, TestBatch
+from test_plt.utils.report import PERCENTILES
+
+# 每次从数据库读取的行数
+CHUNK_SIZE = 50000
+# 超过该时长仍未结束的批次不再阻塞归档
+STALE_BATCH = timedelta(days=1)
+STATE_FILE = '_state.json'
+
+TABLES = {
+    # 表名: (模型, 项目字段, 批次字段, ((列名, 查询字段, 类型), ...))
+    'api_run_log': (ApiRunLog, 'api__project_id', 'case_run_log__test_batch', (
+        ('id', 'id', np.int64),
+        ('start_at', 'start_at', np.int64),
+        ('duration', 'duration', np.int32),
+        ('status_code', 'status_code', np.int16),
+        ('success', 'success', bool),
+        ('latency_regressed', 'latency_regressed', bool),
+        ('api_id', 'api_id', np.int32),
+        ('case_api_id', 'case_api_id', np.int32),
+        ('case_id', 'case_run_log__case_id', np.int32),
+        ('case_run_log_id', 'case_run_log_id', np.int32),
+        ('test_batch_id', 'case_run_log__test_batch_id', np.int32),
+    )),
+    'case_run_log': (CaseRunLog, 'case__project_id', 'test_batch', (
+        ('id', 'id', np.int64),
+        ('start_at', 'start_at', np.int64),
+        ('duration', 'duration', np.int32),
+        ('passed', 'passed', bool),
+        ('case_id', 'case_id', np.int32),
+        ('case_suite_run_log_id', 'case_suite_run_log_id', np.int32),
+        ('test_batch_id', 'test_batch_id', np.int32),
+    )),
+}
+
+
+def _root(root=None):
+    return Path(root or settings.TEST_PLT_ARCHIVE_DIR)
+
+
+def load_state(root=None):
+    path = _root(root) / STATE_FILE
+    return json.loads(path.read_text()) if path.exists() else {}
+
+
+def _save_state(root, state):
+    path = _root(root) / STATE_FILE
+    tmp = path.with_suffix('.tmp')
+    tmp.write_text(json.dumps(state))
+    os.replace(tmp, path)
+
+
+def _upper_id(table):
+    """
+    本次可以归档的ID上限（不含）：执行中批次的第一条履历，没有执行中的批次时为当前最大ID + 1
+    """
+    model, _, batch_field, _ = TABLES[table]
+    running = TestBatch.objects.filter(status=TestBatch.STATUS_PENDING, start_at__gte=timezone.now() - STALE_BATCH)
+    first = model.objects.filter(**{f'{batch_field}__in': running}).aggregate(v=Min('id'))['v']
+    if first is not None:
+        return first
+    return (model.objects.aggregate(v=Max('id'))['v'] or 0) + 1
+
+
+def _day(dt):
+    return (timezone.localtime(dt) if timezone.is_aware(dt) else dt).date().isoformat()
+
+
+def _column(name, values, dtype):
+    if name == 'start_at':
+        return np.fromiter((int(v.timestamp() * 1000) for v in values), dtype=dtype, count=len(values))
+    if dtype is bool:
+        return np.fromiter((bool(v) for v in values), dtype=bool, count=len(values))
+    return np.fromiter((-1 if v is None else v for v in values), dtype=dtype, count=len(values))
+
+
+def _write_part(path: Path, columns, rows):
+    """
+    写入一个 part 目录（先写临时目录再改名；同名 part 已存在时说明上次导出中断，直接覆盖）
+    """
+    tmp = path.with_name(f'.{path.name}.tmp')
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    for i, (name, _, dtype) in enumerate(columns):
+        np.save(tmp / f'{name}.npy', _column(name, [row[i] for row in rows], dtype))
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp, path)
+
+
+def export_table(table, root=None, chunk_size=CHUNK_SIZE):
+    """
+    增量归档一张表
+    :return: 本次归档的行数
+    """
+    model, project_field, _, columns = TABLES[table]
+    root = _root(root)
+    state = load_state(root)
+    last_id, upper = state.get(table, 0), _upper_id(table)
+    fields = [field for _, field, _ in columns] + [project_field]
+    qs = model.objects.filter(start_at__isnull=False).order_by('id').values_list(*fields)
+    total = 0
+    while last_id < upper - 1:
+        rows = list(qs.filter(id__gt=last_id, id__lt=upper)[:chunk_size])
+        if not rows:
+            break
+        partitions = {}
+        for row in rows:
+            # 最后一列为项目ID，第二列为开始时间
+            partitions.setdefault((row[-1], _day(row[1])), []).append(row)
+        for (project_id, day), part_rows in partitions.items():
+            path = root / table / f'project={project_id}' / f'date={day}' / f'part-{part_rows[0][0]:012d}'
+            _write_part(path, columns, part_rows)
+        last_id = rows[-1][0]
+        total += len(rows)
+        state[table] = last_id
+        _save_state(root, state)
+    # 上限以下的履历都已处理（没有开始时间的被跳过）
+    state[table] = max(last_id, upper - 1)
+    _save_state(root, state)
+    return total
+
+
+def export_all(root=None):
+    """
+    增量归档所有表
+    :return: {表名: 本次归档的行数}
+    """
+    _root(root).mkdir(parents=True, exist_ok=True)
+    return {table: export_table(table, root) for table in TABLES}
+
+
+def partitions(table, project_id, start=None, end=None, root=None):
+    """
+    项目在日期范围内的分区
+    :param start: 开始日期（含），date 或 'YYYY-MM-DD'
+    :param end: 结束日期（含）
+    :return: [(日期字符串, [part 目录...])]，按日期排序
+    """
+    base = _root(root) / table / f'project={project_id}'
+    if not base.exists():
+        return []
+    start, end = start and str(start), end and str(end)
+    result = []
+    for day_dir in sorted(base.glob('date=*')):
+        day = day_dir.name[len('date='):]
+        if (start and day < start) or (end and day > end):
+            continue
+        result.append((day, sorted(p for p in day_dir.glob('part-*') if p.is_dir())))
+    return result
+
+
+def load_day(parts, columns):
+    """
+    读取一天的若干列（内存映射，多个 part 时拼接）
+    :return: {列名: NumPy 数组}
+    """
+    arrays = {name: [np.load(part / f'{name}.npy', mmap_mode='r') for part in parts] for name in columns}
+    return {name: a[0] if len(a) == 1 else np.concatenate(a) for name, a in arrays.items()}
+
+
+def latency_trend(project_id, api_id=None, case_api_id=None, start=None, end=None, percentiles=PERCENTILES,
+                  root=None):
+    """
+    按天统计接口执行耗时趋势（耗时百分位只统计执行成功的接口）
+    :param api_id: 只统计该接口
+    :param case_api_id: 只统计该用例接口
+    :return: [{'date', 'count', 'failed', 'error_rate', 'mean', 'percentiles': {p: 耗时}}]，耗时单位ms
+    """
+    trend = []
+    for day, parts in partitions('api_run_log', project_id, start, end, root):
+        if not parts:
+            continue
+        cols = load_day(parts, ('duration', 'success', 'api_id', 'case_api_id'))
+        mask = np.ones(len(cols['duration']), dtype=bool)
+        if api_id is not None:
+            mask &= cols['api_id'] == api_id
+        if case_api_id is not None:
+            mask &= cols['case_api_id'] == case_api_id
+        count = int(mask.sum())
+        if not count:
+            continue
+        failed = count - int(cols['success'][mask].sum())
+        ok = cols['duration'][mask & cols['success'] & (cols['duration'] >= 0)]
+        trend.append({
+            'date': day, 'count': count, 'failed': failed, 'error_rate': round(failed * 100 / count, 2),
+            'mean': round(float(ok.mean()), 1) if len(ok) else None,
+            'percentiles': dict(zip(percentiles, (round(float(v)) for v in np.percentile(ok, percentiles))))
+            if len(ok) else {},
+        })
+    return trend
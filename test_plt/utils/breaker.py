@@ -0,0 +1,179 @@
+"""
+按部署环境熔断：多个 worker 共享状态，连续连接失败达到阈值后熔断，后续接口直接失败，不再等待超时
+
+状态（Redis）：
+    test_plt:breaker:fails:<环境ID>  连续连接失败次数，任一请求成功即清零
+    test_plt:breaker:open:<环境ID>   存在即为熔断（值为熔断时间戳），过期（settings.TEST_PLT_BREAKER_RESET_TIMEOUT）后进入半开
+    test_plt:breaker:probe:<环境ID>  半开状态下只放行一个探测请求：探测成功则恢复，失败则重新熔断
+"""
+import logging
+import socket
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import pymysql
+import redis
+import requests
+from django.conf import settings
+from django.db.models import Count, Q
+
+from test_plt.models import ApiRunLog, DeployEnv
+from test_plt.utils import store, timeouts
+
+KEY_FAILS = 'test_plt:breaker:fails:%s'
+KEY_OPEN = 'test_plt:breaker:open:%s'
+KEY_PROBE = 'test_plt:breaker:probe:%s'
+
+# 连续失败计数的有效期（秒），长时间没有请求的环境重新计数
+FAILS_TTL = 24 * 3600
+
+# 记录一次连接失败，达到阈值（或半开探测失败）时熔断，返回 1 表示已熔断
+FAILURE_LUA = """
+local n = redis.call('INCR', KEYS[1])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+if n >= tonumber(ARGV[1]) then
+    redis.call('SET', KEYS[2], ARGV[4], 'EX', ARGV[2])
+    redis.call('DEL', KEYS[3])
+    return 1
+end
+return 0
+"""
+
+# 视为"环境不可达"的异常；其余异常（如业务报错、SQL语法错误）说明环境是通的
+CONNECTION_ERRORS = (
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+    redis.exceptions.ConnectionError,
+    redis.exceptions.TimeoutError,
+    ConnectionError,
+    socket.timeout,
+)
+# pymysql 的连接类错误码：无法连接、连接断开、查询中连接丢失
+MYSQL_CONNECTION_ERRNOS = (2003, 2006, 2013)
+
+
+class CircuitOpen(Exception):
+    def __init__(self, deploy_env, opened_at=None):
+        self.deploy_env = deploy_env
+        self.opened_at = opened_at
+
+    def __str__(self):
+        since = f"（自 {datetime.fromtimestamp(self.opened_at):%H:%M:%S} 起）" if self.opened_at else ''
+        return f"部署环境[{self.deploy_env}]连续连接失败，已熔断{since}，跳过执行"
+
+
+def is_connection_error(e):
+    if isinstance(e, pymysql.err.OperationalError):
+        return bool(e.args) and e.args[0] in MYSQL_CONNECTION_ERRNOS
+    return isinstance(e, CONNECTION_ERRORS)
+
+
+def error_kind(e):
+    """
+    接口执行失败的类型（ApiRunLog.error_kind）：已熔断、连接失败，其他异常为 None
+    """
+    if isinstance(e, CircuitOpen):
+        return ApiRunLog.ERROR_CIRCUIT_OPEN
+    if is_connection_error(e):
+        return ApiRunLog.ERROR_CONNECTION
+    return None
+
+
+def enabled():
+    return settings.TEST_PLT_BREAKER_FAILURES > 0
+
+
+def allow(deploy_env: DeployEnv, timeout=None):
+    """
+    检查熔断状态
+    :param deploy_env: 部署环境
+    :param timeout: 本次请求的 (连接超时, 读超时)，决定半开探测的租约时长
+    :return: 是否为半开状态下的探测请求
+    :raise CircuitOpen: 已熔断（或半开状态下已有其他探测请求）
+    """
+    r = store.client()
+    opened_at = r.get(KEY_OPEN % deploy_env.id)
+    if opened_at:
+        raise CircuitOpen(deploy_env, float(opened_at))
+    fails = int(r.get(KEY_FAILS % deploy_env.id) or 0)
+    if fails < settings.TEST_PLT_BREAKER_FAILURES:
+        return False
+    # 半开：只放行一个探测请求，探测租约为一次请求的最长耗时
+    if r.set(KEY_PROBE % deploy_env.id, 1, nx=True, ex=int(timeouts.longest(timeout)) + 10):
+        logging.getLogger('test_plt').info(f"部署环境[{deploy_env}]熔断半开，发送探测请求")
+        return True
+    raise CircuitOpen(deploy_env)
+
+
+def record_success(deploy_env: DeployEnv, probe=False):
+    r = store.client()
+    r.delete(KEY_FAILS % deploy_env.id)
+    if probe:
+        r.delete(KEY_PROBE % deploy_env.id)
+        logging.getLogger('test_plt').info(f"部署环境[{deploy_env}]探测成功，熔断恢复")
+
+
+def record_failure(deploy_env: DeployEnv):
+    r = store.client()
+    opened = r.eval(FAILURE_LUA, 3, KEY_FAILS % deploy_env.id, KEY_OPEN % deploy_env.id, KEY_PROBE % deploy_env.id,
+                    settings.TEST_PLT_BREAKER_FAILURES, int(settings.TEST_PLT_BREAKER_RESET_TIMEOUT), FAILS_TTL,
+                    time.time())
+    if opened:
+        logging.getLogger('test_plt').warning(f"部署环境[{deploy_env}]连续连接失败，熔断")
+
+
+@contextmanager
+def guard(deploy_env: DeployEnv, timeout=None):
+    """
+    在熔断器保护下请求部署环境：已熔断时直接抛出 CircuitOpen；
+    连接类异常计为失败，正常返回计为成功，其他异常不影响熔断状态
+    平台 Redis 不可用时不做熔断，照常执行
+    :param timeout: 本次请求的 (连接超时, 读超时)
+    """
+    if not enabled():
+        yield
+        return
+    try:
+        probe = allow(deploy_env, timeout)
+    except redis.RedisError as e:
+        logging.getLogger('test_plt').warning(f"熔断器状态读取失败，忽略熔断：{e}")
+        yield
+        return
+    try:
+        yield
+    except Exception as e:
+        try:
+            if is_connection_error(e):
+                record_failure(deploy_env)
+            elif probe:
+                store.client().delete(KEY_PROBE % deploy_env.id)
+        except redis.RedisError as re_:
+            logging.getLogger('test_plt').warning(f"熔断器状态更新失败：{re_}")
+        raise
+    else:
+        try:
+            record_success(deploy_env, probe)
+        except redis.RedisError as e:
+            logging.getLogger('test_plt').warning(f"熔断器状态更新失败：{e}")
+
+
+def outage_msg(bat):
+    """
+    根据本批次自身的执行履历说明环境故障：本批次中有接口因熔断被跳过，
+    或连接失败的接口数达到熔断阈值的部署环境（不看其他批次/项目造成的全局熔断状态）
+    :param bat: 测试批次
+    :return: 说明文字；没有故障的环境时返回 None
+    """
+    if not enabled():
+        return None
+    rows = ApiRunLog.objects.filter(case_run_log__test_batch=bat, error_kind__isnull=False) \
+        .values('api__deploy_env') \
+        .annotate(circuit_open=Count('id', filter=Q(error_kind=ApiRunLog.ERROR_CIRCUIT_OPEN)),
+                  connection=Count('id', filter=Q(error_kind=ApiRunLog.ERROR_CONNECTION)))
+    env_ids = [row['api__deploy_env'] for row in rows
+               if row['circuit_open'] or row['connection'] >= settings.TEST_PLT_BREAKER_FAILURES]
+    if not env_ids:
+        return None
+    down = [f"{e}({e.hostname}:{e.port})" for e in DeployEnv.objects.filter(id__in=env_ids).order_by('id')]
+    return f"部署环境不可用（连接失败或已熔断）：{'、'.join(down)}"
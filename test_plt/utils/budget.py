@@ -0,0 +1,78 @@
+"""
+批次错误预算：按项目配置，失败用例过多时提前中止整个批次，不再把明显坏掉的构建跑完
+
+    - 前 N 个用例中失败比例超过阈值（Project.budget_window / Project.budget_fail_ratio）
+    - 连续失败的用例数达到阈值（Project.budget_max_consecutive）
+
+计数保存在 Redis 中并由 Lua 脚本原子更新，同一批次的多个执行单元（worker）共用一份预算；
+预算耗尽时设置批次的中止标记（见 deadline.abort），所有执行单元在下一个接口前中止，批次记为失败。
+平台 Redis 不可用时不做预算检查。
+"""
+import logging
+
+import redis
+
+from test_plt.models import Project, TestBatch
+from test_plt.utils import deadline, store
+
+KEY_BUDGET = 'test_plt:budget:%s'
+# 计数的有效期（秒）
+BUDGET_TTL = 24 * 3600
+
+# 记录一个用例的结果并判断预算是否耗尽，只在第一次耗尽时返回原因，之后返回空字符串
+RECORD_LUA = """
+local done = redis.call('HINCRBY', KEYS[1], 'done', 1)
+local failed, streak
+if ARGV[1] == '1' then
+    failed = redis.call('HINCRBY', KEYS[1], 'failed', 0)
+    streak = 0
+    redis.call('HSET', KEYS[1], 'streak', 0)
+else
+    failed = redis.call('HINCRBY', KEYS[1], 'failed', 1)
+    streak = redis.call('HINCRBY', KEYS[1], 'streak', 1)
+end
+redis.call('EXPIRE', KEYS[1], ARGV[5])
+local window = tonumber(ARGV[2])
+local ratio = tonumber(ARGV[3])
+local max_streak = tonumber(ARGV[4])
+local reason = ''
+if max_streak > 0 and streak >= max_streak then
+    reason = '连续' .. streak .. '个用例失败'
+elseif window > 0 and ratio > 0 and done <= window and failed * 100 > ratio * window then
+    reason = '前' .. window .. '个用例中已有' .. failed .. '个失败（超过' .. ARGV[3] .. '%）'
+end
+if reason ~= '' and redis.call('HSETNX', KEYS[1], 'exhausted', reason) == 1 then
+    return reason
+end
+return ''
+"""
+
+
+def enabled(project: Project):
+    return bool(project.budget_max_consecutive or (project.budget_window and project.budget_fail_ratio))
+
+
+def record(bat: TestBatch, passed):
+    """
+    记录批次中一个用例的执行结果，预算耗尽时中止批次
+    :param bat: 测试批次
+    :param passed: 用例是否通过
+    :return: 本次导致预算耗尽时返回原因，否则返回 None
+    """
+    project = bat.project
+    if not enabled(project):
+        return None
+    logger = logging.getLogger('test_plt')
+    try:
+        reason = store.client().eval(RECORD_LUA, 1, KEY_BUDGET % bat.id, '1' if passed else '0',
+                                     project.budget_window, project.budget_fail_ratio,
+                                     project.budget_max_consecutive, BUDGET_TTL)
+        if not reason:
+            return None
+        reason = f"错误预算耗尽：{reason}"
+        deadline.abort(bat.id, reason)
+    except redis.RedisError as e:
+        logger.warning(f"批次[{bat.id}]错误预算更新失败，忽略预算：{e}")
+        return None
+    logger.info(f"批次[{bat.id}]{reason}，中止执行")
+    return reason
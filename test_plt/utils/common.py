@@ -1,15 +1,18 @@
 import ast
 import json
 import logging
+import math
 import re
 import time
 import traceback
 from datetime import datetime
 from test_plt.utils import common
 
+from celery.exceptions import SoftTimeLimitExceeded
 from django.utils import formats, timezone
-from test_plt.models import Case, CaseRunLog, CaseSuiteRunLog, ApiDef, CaseApiDef
-from test_plt.utils import resp, http, redis_
+from test_plt.models import Case, CaseRunLog, CaseSuiteRunLog, ApiDef, CaseApiDef, TestBatch
+from test_plt.utils import budget, deadline, events, flaky, latency, repeat, resp, http, redis_, metrics, selection, \
+    timeouts, trace
 from test_plt.utils.resp import RespCheckException
 
 
@@ -19,7 +22,8 @@ def trunc_text(text, limit=100, padding='...'):
     return text[:limit-len(padding)] + padding
 
 
-def perform_case(case: Case, user, case_suite=None, case_suite_log=None, suite_ctx=None, proj_ctx=None, test_batch=None):
+def perform_case(case: Case, user, case_suite=None, case_suite_log=None, suite_ctx=None, proj_ctx=None, test_batch=None,
+                 fingerprint=None):
     """
     运行测试用例
     :param test_batch: 测试批次
@@ -29,6 +33,7 @@ def perform_case(case: Case, user, case_suite=None, case_suite_log=None, suite_c
     :param user: 从数据库获取的创建人，一般是 request.user
     :param proj_ctx: 项目变量
     :param suite_ctx: 测试套件变量
+    :param fingerprint: 批次开始时计算的用例指纹（见 selection.fingerprints），为空时单独计算
     :return: True/False
     """
     logger = logging.getLogger('test_plt')
@@ -36,69 +41,136 @@ def perform_case(case: Case, user, case_suite=None, case_suite_log=None, suite_c
     logger.info(f'[{case.name}] 执行开始')
     flag = True
     errmsg = None
+    interrupted = None
     # 用例上下文
     case_ctx = {}
-    case_log = push_case_run_log(case, case_suite, case_suite_log, user=user, test_batch=test_batch)
-    for item in case.case_apidefs.order_by('reorder').all():  # type: CaseApiDef
-        api: ApiDef = item.api
-        try:
-            # 前置处理
-            exec_py_script(item.pre_proc, None, case_ctx, suite_ctx, proj_ctx)
-            # 参数预处理(对用户名、密码、token、redis的输入做统一处理，让输入框最终只有 uuid 的值)
-            proc_apidef_params(item, case_ctx, suite_ctx, proj_ctx)
-            # 第一段：执行
-            # 判断协议类型 http\redis\mysql?
-            if api.protocol == 'http':
-                query_params = item.get_query_params(case_ctx, suite_ctx, proj_ctx)
-                http_headers = item.get_http_headers(case_ctx, suite_ctx, proj_ctx)
-                request_body = item.get_request_body(case_ctx, suite_ctx, proj_ctx)
-                result = http.perform_api(api, query_params, http_headers, request_body,
-                                          item.auth_username, item.auth_password, item.bearer_token,
-                                          user, case_log=case_log)
-            elif api.protocol == 'redis':
-                result = redis_.perform_api(api, item.redis_key, user, case_log=case_log)
-            if not result.get('success') and item.abort_when_fail:  # 如果接口执行失败 且 用例勾选了'失败时终止'
-                flag = False
-                break
-        except Exception as e:
-            errmsg = str(e)
-            logger.info(f'{e}\n {traceback.format_exc()}')
-            if item.abort_when_fail:
-                flag = False
-                break
-        # 第二段：始做校验
-        try:
-            # 判断协议类型 http\redis\mysql?
-            if api.protocol == 'http':
-                resp.check_case_apidef_http(item, result)
-            elif api.protocol == 'redis':
-                resp.check_case_apidef_redis(item, result)
-            logger.info(f"[{api}] 校验成功")
-
-            # 后置处理？？？todo
-            exec_py_script(item.post_proc, result, case_ctx, suite_ctx, proj_ctx)
-            logger.info(f"case_ctx=【{case_ctx}】\nsuite_ctx=【{suite_ctx}】\nproj_ctx=【{proj_ctx}】\n")
-        except Exception as e:
-            if isinstance(e, RespCheckException):
-                error_msg = f"接口[{api}] 校验失败，原因{e}"
-            else:
-                error_msg = traceback.format_exc()
-            logger.info(error_msg)
-            if item.abort_when_fail:
+    # 各用例接口的执行结果 {用例接口: [是否通过, 耗时(ms)]}，用于不稳定用例统计
+    steps = {}
+    with trace.span('case', case_id=case.id, case_name=case.name) as case_sp, \
+            deadline.scope(deadline.SCOPE_CASE, case.time_limit):
+        case_log = push_case_run_log(case, case_suite, case_suite_log, user=user, test_batch=test_batch)
+        case_log.fingerprint = fingerprint or selection.fingerprints([case.id])[case.id]
+        for item in case.case_apidefs.order_by('reorder').all():  # type: CaseApiDef
+            api: ApiDef = item.api
+            # 批次已取消或超过时限时，不再执行后续接口
+            interrupted = deadline.poll()
+            if interrupted:
                 flag = False
+                errmsg = str(interrupted)
                 break
+            mark_first_step(test_batch)
+            steps[item] = [False, None]
+            result = None
+            try:
+                try:
+                    # 前置处理
+                    exec_py_script(item.pre_proc, None, case_ctx, suite_ctx, proj_ctx)
+                    # 参数预处理(对用户名、密码、token、redis的输入做统一处理，让输入框最终只有 uuid 的值)
+                    proc_apidef_params(item, case_ctx, suite_ctx, proj_ctx)
+                    # 第一段：执行
+                    # 判断协议类型 http\redis\mysql?
+                    if api.protocol == 'http':
+                        query_params = item.get_query_params(case_ctx, suite_ctx, proj_ctx)
+                        http_headers = item.get_http_headers(case_ctx, suite_ctx, proj_ctx)
+                        request_body = item.get_request_body(case_ctx, suite_ctx, proj_ctx)
+                        # 每次执行使用请求参数/请求头的副本（执行器会在请求头中加入认证信息，重复执行时可能并发）
+                        result = repeat.run(item, lambda save_log: http.perform_api(
+                            api, dict(query_params), dict(http_headers), request_body,
+                            item.auth_username, item.auth_password, item.bearer_token,
+                            user, case_log=case_log, timeout=deadline.clamp(timeouts.resolve(api, item)),
+                            save_log=save_log))
+                    elif api.protocol == 'redis':
+                        result = repeat.run(item, lambda save_log: redis_.perform_api(
+                            api, item.redis_key, user, case_log=case_log,
+                            timeout=deadline.clamp(timeouts.resolve(api, item)), save_log=save_log))
+                    steps[item] = [bool(result.get('success')), result.get('duration')]
+                    latency.observe(item, api, result)
+                    if not result.get('success') and item.abort_when_fail:  # 如果接口执行失败 且 用例勾选了'失败时终止'
+                        flag = False
+                        break
+                except SoftTimeLimitExceeded:
+                    # 超过 celery 任务的软时限：用例记为中止，随后中止整个批次
+                    interrupted = deadline.TaskTimeLimit()
+                    flag = False
+                    errmsg = str(interrupted)
+                    break
+                except Exception as e:
+                    errmsg = str(e)
+                    logger.info(f'{e}\n {traceback.format_exc()}')
+                    if item.abort_when_fail:
+                        flag = False
+                        break
+                # 第二段：始做校验
+                try:
+                    # 判断协议类型 http\redis\mysql?
+                    if api.protocol == 'http':
+                        resp.check_case_apidef_http(item, result)
+                    elif api.protocol == 'redis':
+                        resp.check_case_apidef_redis(item, result)
+                    logger.info(f"[{api}] 校验成功")
 
-    # 更新测试用例执行的履历：将 用例执行的结果 更新到 数据库的用例执行履历表 CaseRunLog
-    if not flag and case.abort_when_fail:
-        msg = f"{case.name} 执行失败，原因：有用例接口执行失败且要求用例执行中止，参考：{errmsg}"
-        push_case_run_log(case, case_run_log=case_log, passed=False, err_msg=msg)
-    else:
-        push_case_run_log(case, case_run_log=case_log, passed=True)
+                    # 后置处理？？？todo
+                    exec_py_script(item.post_proc, result, case_ctx, suite_ctx, proj_ctx)
+                    logger.info(f"case_ctx=【{case_ctx}】\nsuite_ctx=【{suite_ctx}】\nproj_ctx=【{proj_ctx}】\n")
+                except SoftTimeLimitExceeded:
+                    interrupted = deadline.TaskTimeLimit()
+                    steps[item][0] = False
+                    flag = False
+                    errmsg = str(interrupted)
+                    break
+                except Exception as e:
+                    if isinstance(e, RespCheckException):
+                        error_msg = f"接口[{api}] 校验失败，原因{e}"
+                    else:
+                        error_msg = traceback.format_exc()
+                    logger.info(error_msg)
+                    steps[item][0] = False
+                    if item.abort_when_fail:
+                        flag = False
+                        break
+            finally:
+                # 推送到批次页面（中途 break 时也会推送）
+                events.step(case_log, item, steps[item][0], result)
+
+        # 更新测试用例执行的履历：将 用例执行的结果 更新到 数据库的用例执行履历表 CaseRunLog
+        if interrupted:
+            msg = f"{case.name} 执行中止，原因：{errmsg}"
+            push_case_run_log(case, case_run_log=case_log, passed=False, err_msg=msg)
+            case_sp.set_error(msg)
+        elif not flag and case.abort_when_fail:
+            msg = f"{case.name} 执行失败，原因：有用例接口执行失败且要求用例执行中止，参考：{errmsg}"
+            push_case_run_log(case, case_run_log=case_log, passed=False, err_msg=msg)
+            case_sp.set_error(msg)
+        else:
+            push_case_run_log(case, case_run_log=case_log, passed=True)
+        events.case(case_log)
 
     logger.info(f'[{case.name}] 执行结束')
+    # 超过用例时限只算用例失败；批次被取消或超过批次时限时中止整个批次
+    if interrupted and interrupted.scope != deadline.SCOPE_CASE:
+        raise interrupted
+    # 中止的用例不计入统计
+    if not interrupted:
+        flaky.record(case, case_log.passed, case_log.duration, steps)
+    # 计入批次的错误预算，耗尽时整个批次在下一个接口前中止；已隔离的用例不计入
+    if test_batch is not None and not case.quarantined:
+        budget.record(test_batch, case_log.passed)
     return flag
 
 
+def mark_first_step(bat: TestBatch):
+    """
+    记录批次的第一个接口开始执行的时间（只有最早的一次更新成功，分片执行时也只记录一次），并记录排队时间指标
+    """
+    if bat is None or getattr(bat, '_first_step_marked', False):
+        return
+    bat._first_step_marked = True
+    now = timezone.now()
+    if TestBatch.objects.filter(id=bat.id, first_step_at__isnull=True).update(first_step_at=now):
+        bat.first_step_at = now
+        metrics.observe_first_step(bat)
+
+
 def push_case_run_log(case, case_suite=None, case_suite_log=None, test_batch=None, case_run_log=None, user=None, passed=True,
                       err_msg=None):
     """
@@ -119,17 +191,20 @@ def push_case_run_log(case, case_suite=None, case_suite_log=None, test_batch=Non
         case_run_log.duration = (now - case_run_log.temp_start_at) * 1000
         case_run_log.error_msg = err_msg
         case_run_log.passed = passed
-        case_run_log.save()
+        with metrics.observe_log_write('case_run_log'):
+            case_run_log.save()
+        metrics.CASE_DURATION.labels('passed' if passed else 'failed').observe(case_run_log.duration / 1000)
         return None
     else:
-        obj = CaseRunLog.objects.create(
-            start_at=timezone.make_aware(datetime.fromtimestamp(now)),
-            case=case,
-            case_suite=case_suite,
-            case_suite_run_log=case_suite_log,
-            created_by=user,
-            test_batch=test_batch
-        )
+        with metrics.observe_log_write('case_run_log'):
+            obj = CaseRunLog.objects.create(
+                start_at=timezone.make_aware(datetime.fromtimestamp(now)),
+                case=case,
+                case_suite=case_suite,
+                case_suite_run_log=case_suite_log,
+                created_by=user,
+                test_batch=test_batch
+            )
         obj.temp_start_at = now
         return obj
 
@@ -151,19 +226,75 @@ def push_case_suite_run_log(case_suite, suite_log=None, user=None, passed=True,
         suite_log.duration = (now - suite_log.temp_start_at) * 1000
         suite_log.error_msg = err_msg
         suite_log.passed = passed
-        suite_log.save()
+        with metrics.observe_log_write('case_suite_run_log'):
+            suite_log.save()
+        metrics.SUITE_DURATION.labels('passed' if passed else 'failed').observe(suite_log.duration / 1000)
         return None
     else:
-        obj = CaseSuiteRunLog.objects.create(
-            start_at=timezone.make_aware(datetime.fromtimestamp(now)),
-            case_suite=case_suite,
-            created_by=user,
-            test_batch=test_batch
-        )
+        with metrics.observe_log_write('case_suite_run_log'):
+            obj = CaseSuiteRunLog.objects.create(
+                start_at=timezone.make_aware(datetime.fromtimestamp(now)),
+                case_suite=case_suite,
+                created_by=user,
+                test_batch=test_batch
+            )
         obj.temp_start_at = now
         return obj
 
 
+def percentile(values, q):
+    """
+    计算百分位数（最近秩法）
+    :param values: 数值列表
+    :param q: 百分位，如 50、95、99
+    :return: 百分位数，列表为空时返回None
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    idx = max(int(math.ceil(q / 100 * len(ordered))) - 1, 0)
+    return ordered[idx]
+
+
+def _ms_stats(values, prefix):
+    """
+    平均值、P95、最大值（ms），没有数据时为 None
+    """
+    return {
+        f'{prefix}_avg': int(sum(values) / len(values)) if values else None,
+        f'{prefix}_p95': int(percentile(values, 95)) if values else None,
+        f'{prefix}_max': int(max(values)) if values else None,
+    }
+
+
+def queue_latency_report(since):
+    """
+    按项目汇总测试批次的排队耗时、启动耗时与执行耗时，用来区分"被测系统慢"和"worker不够"
+        排队：入队到被worker领取（TestBatch.queue_wait_ms）
+        启动：被worker领取到第一个接口开始执行（TestBatch.startup_ms，预检等准备工作）
+        执行：被worker领取到执行结束（TestBatch.run_ms）
+    :param since: 统计起始时间（按入队时间过滤）
+    :return: [{'project': 项目名称, 'count': 批次数, 'wait_avg': ..., 'wait_p95': ..., 'wait_max': ...,
+               'startup_avg': ..., 'startup_p95': ..., 'startup_max': ...,
+               'run_avg': ..., 'run_p95': ..., 'run_max': ...}, ...]，耗时单位ms
+    """
+    rows = TestBatch.objects.filter(enqueued_at__gte=since, picked_at__isnull=False) \
+        .values_list('project__name', 'enqueued_at', 'picked_at', 'first_step_at', 'finish_at')
+    groups = {}
+    for proj, enqueued_at, picked_at, first_step_at, finish_at in rows:
+        waits, startups, runs = groups.setdefault(proj, ([], [], []))
+        waits.append((picked_at - enqueued_at).total_seconds() * 1000)
+        if first_step_at:
+            startups.append(max((first_step_at - picked_at).total_seconds() * 1000, 0))
+        if finish_at:
+            runs.append((finish_at - picked_at).total_seconds() * 1000)
+    result = []
+    for proj, (waits, startups, runs) in sorted(groups.items()):
+        result.append({'project': proj, 'count': len(waits), **_ms_stats(waits, 'wait'),
+                       **_ms_stats(startups, 'startup'), **_ms_stats(runs, 'run')})
+    return result
+
+
 def fmt_cost_time(start_at, finish_at, duration=None, cal=True):
     if cal:
         delta = finish_at - start_at
@@ -0,0 +1,111 @@
+"""
+测试批次对比：按用例、用例中的接口（用例接口）对齐两个批次，列出新增失败、已修复的用例，以及各接口的耗时变化。
+
+两个批次各用一条 GROUP BY 查询在数据库中汇总（按用例执行履历/接口执行履历的外键索引过滤），
+Python 中只合并汇总后的行（行数为用例数/用例接口数，与接口执行次数无关）。
+"""
+from django.db.models import Avg, Count, Max, Q
+
+from test_plt.models import ApiRunLog, CaseRunLog, TestBatch
+
+# 可以对比的批次状态
+FINAL_STATUS = (TestBatch.STATUS_FINISHED, TestBatch.STATUS_FAILED)
+# 耗时变化最多列出的接口数（变慢、变快各）
+LATENCY_LIMIT = 50
+# 耗时变化小于该值（ms）的接口不列出
+LATENCY_MIN_DELTA = 1
+
+
+def previous(bat: TestBatch):
+    """
+    同一项目、同一定时任务（手动执行时为同一任务类型）的上一个已结束批次
+    """
+    return TestBatch.objects.filter(project_id=bat.project_id, obj_type=bat.obj_type,
+                                    periodic_task_id=bat.periodic_task_id, status__in=FINAL_STATUS,
+                                    id__lt=bat.id).order_by('-id').first()
+
+
+def case_digest(bat: TestBatch):
+    """
+    按用例汇总批次的执行结果（同一用例在多个套件中执行时合并）
+    :return: {用例ID: {'name': 用例名, 'runs': 执行次数, 'failed': 未通过次数, 'passed': 是否通过(未结束为 None), 'duration': 平均耗时}}
+    """
+    rows = CaseRunLog.objects.filter(test_batch=bat).values('case_id', 'case__name') \
+        .annotate(runs=Count('id'), failed=Count('id', filter=Q(passed=False)),
+                  succeeded=Count('id', filter=Q(passed=True)), duration=Avg('duration'))
+    digest = {}
+    for row in rows:
+        passed = False if row['failed'] else (True if row['succeeded'] == row['runs'] else None)
+        digest[row['case_id']] = {'name': row['case__name'], 'runs': row['runs'], 'failed': row['failed'],
+                                  'passed': passed, 'duration': row['duration']}
+    return digest
+
+
+def step_digest(bat: TestBatch):
+    """
+    按（用例, 用例接口）汇总批次的接口执行；没有记录用例接口的历史执行履历按（用例, 接口）汇总
+    :return: {(用例ID, 用例接口ID 或 'api-'接口ID): {'case_id', 'api', 'runs', 'failed', 'avg', 'max'}}
+    """
+    rows = ApiRunLog.objects.filter(case_run_log__test_batch=bat) \
+        .values('case_run_log__case_id', 'case_api_id', 'api_id', 'api__name') \
+        .annotate(runs=Count('id'), failed=Count('id', filter=Q(success=False)), avg=Avg('duration'),
+                  max=Max('duration'))
+    digest = {}
+    for row in rows:
+        case_id = row['case_run_log__case_id']
+        key = (case_id, row['case_api_id'] or f"api-{row['api_id']}")
+        digest[key] = {'case_id': case_id, 'api': row['api__name'], 'runs': row['runs'], 'failed': row['failed'],
+                       'avg': row['avg'], 'max': row['max']}
+    return digest
+
+
+def compare(base: TestBatch, bat: TestBatch):
+    """
+    以 base 为基准对比 bat
+    """
+    base_cases, cases = case_digest(base), case_digest(bat)
+    new_failures, still_failing, fixed = [], [], []
+    for case_id, case in cases.items():
+        old = base_cases.get(case_id)
+        if old is None:
+            continue
+        row = {'case_id': case_id, 'name': case['name'], 'base_duration': _round(old['duration']),
+               'duration': _round(case['duration'])}
+        if case['passed'] is False:
+            (still_failing if old['passed'] is False else new_failures).append(row)
+        elif case['passed'] and old['passed'] is False:
+            fixed.append(row)
+    added = [{'case_id': k, 'name': v['name'], 'passed': v['passed']} for k, v in cases.items() if k not in base_cases]
+    removed = [{'case_id': k, 'name': v['name']} for k, v in base_cases.items() if k not in cases]
+
+    base_steps, steps = step_digest(base), step_digest(bat)
+    step_failures, latency = [], []
+    for key, step in steps.items():
+        old = base_steps.get(key)
+        if old is None:
+            continue
+        name = cases.get(step['case_id'], {}).get('name')
+        if step['failed'] and not old['failed']:
+            step_failures.append({'case': name, 'api': step['api'], 'failed': step['failed'], 'runs': step['runs']})
+        if step['avg'] is None or old['avg'] is None:
+            continue
+        delta = step['avg'] - old['avg']
+        if abs(delta) < LATENCY_MIN_DELTA:
+            continue
+        latency.append({'case': name, 'api': step['api'], 'base': _round(old['avg']), 'avg': _round(step['avg']),
+                        'delta': _round(delta), 'ratio': round(delta * 100 / old['avg']) if old['avg'] else None,
+                        'max': step['max']})
+    latency.sort(key=lambda r: r['delta'], reverse=True)
+    return {
+        'cases': len(cases), 'base_cases': len(base_cases),
+        'steps': len(steps), 'base_steps': len(base_steps),
+        'new_failures': new_failures, 'still_failing': still_failing, 'fixed': fixed,
+        'added': added, 'removed': removed,
+        'step_failures': step_failures,
+        'slower': [r for r in latency if r['delta'] > 0][:LATENCY_LIMIT],
+        'faster': [r for r in reversed(latency) if r['delta'] < 0][:LATENCY_LIMIT],
+    }
+
+
+def _round(value):
+    return None if value is None else round(value)
@@ -0,0 +1,197 @@
+"""
+截止时间与协作式取消
+
+批次、用例可以设置时限（截止时间保存在上下文变量中，嵌套时取最早的一个）：
+    - perform_case 在每个接口执行前调用 poll() 检查是否超时或批次已被取消
+    - 每次请求的超时时间用 clamp() 缩短到不超过剩余时间，避免单个请求拖过截止时间
+取消批次：在 Redis 中设置取消标记（cancel()），执行中的 worker 在下一个接口前发现并中止批次。
+中止批次（abort()，如错误预算耗尽）与取消相同，但批次记为失败而不是已取消。
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import redis
+from django.conf import settings
+
+from test_plt.utils import store
+
+SCOPE_BATCH = 'batch'
+SCOPE_CASE = 'case'
+SCOPE_NAMES = {SCOPE_BATCH: '批次', SCOPE_CASE: '用例'}
+
+KEY_CANCEL = 'test_plt:cancel:%s'
+KEY_ABORT = 'test_plt:abort:%s'
+# 取消/中止标记的有效期（秒）
+CANCEL_TTL = 24 * 3600
+# 缩短后的请求超时时间下限（秒）
+MIN_TIMEOUT = 0.1
+
+_deadlines = ContextVar('test_plt_deadlines', default=())
+_batch_id = ContextVar('test_plt_deadline_batch_id', default=None)
+
+
+class Interrupted(Exception):
+    """
+    执行被中止（超时或被取消）
+    """
+    scope = SCOPE_BATCH
+
+
+class DeadlineExceeded(Interrupted):
+    def __init__(self, scope, limit):
+        self.scope = scope
+        self.limit = limit
+
+    def __str__(self):
+        return f"超过{SCOPE_NAMES[self.scope]}时限（{self.limit}秒），执行中止"
+
+
+class BatchCancelled(Interrupted):
+    def __init__(self, reason=None):
+        self.reason = reason
+
+    def __str__(self):
+        return f"批次已取消：{self.reason or '手动取消'}"
+
+
+class TaskTimeLimit(Interrupted):
+    """
+    超过 celery 任务的软时限（SoftTimeLimitExceeded），中止整个批次，批次记为失败
+    """
+    def __str__(self):
+        return f"超过任务时限（{settings.CELERY_TASK_SOFT_TIME_LIMIT}秒），执行中止"
+
+
+class BatchAborted(Interrupted):
+    """
+    批次因执行结果被提前中止（如错误预算耗尽），批次记为失败
+    """
+    def __init__(self, reason):
+        self.reason = reason
+
+    def __str__(self):
+        return self.reason
+
+
+@contextmanager
+def scope(kind, seconds):
+    """
+    在时限内执行
+    :param kind: SCOPE_BATCH / SCOPE_CASE
+    :param seconds: 时限（秒），为空或0表示不限
+    """
+    if not seconds:
+        yield
+        return
+    token = _deadlines.set(_deadlines.get() + ((kind, time.time() + seconds, seconds),))
+    try:
+        yield
+    finally:
+        _deadlines.reset(token)
+
+
+@contextmanager
+def batch(bat_id, seconds):
+    """
+    执行批次：设置批次时限，并使 poll() 检查该批次的取消标记
+    """
+    token = _batch_id.set(bat_id)
+    try:
+        with scope(SCOPE_BATCH, seconds):
+            yield
+    finally:
+        _batch_id.reset(token)
+
+
+def remaining():
+    """
+    距离最近的截止时间还剩多少秒；没有时限时返回 None
+    """
+    deadlines = _deadlines.get()
+    if not deadlines:
+        return None
+    return min(at for _, at, _ in deadlines) - time.time()
+
+
+def poll():
+    """
+    检查批次是否已被取消、是否已超过时限
+    :return: 需要中止时返回对应的异常（Interrupted），否则返回 None
+    """
+    bat_id = _batch_id.get()
+    if bat_id is not None:
+        interrupted = signal(bat_id)
+        if interrupted:
+            return interrupted
+    now = time.time()
+    # 外层（批次）优先：批次超时应中止整个批次，而不只是当前用例
+    for kind, at, seconds in _deadlines.get():
+        if now >= at:
+            return DeadlineExceeded(kind, seconds)
+    return None
+
+
+def check():
+    """
+    同 poll()，需要中止时直接抛出异常
+    """
+    interrupted = poll()
+    if interrupted:
+        raise interrupted
+
+
+def clamp(timeout):
+    """
+    将请求超时时间缩短到不超过剩余时间
+    :param timeout: (连接超时, 读超时)
+    """
+    left = remaining()
+    if left is None:
+        return timeout
+    left = max(left, MIN_TIMEOUT)
+    return tuple(min(t, left) for t in timeout)
+
+
+def cancel(bat_id, reason=None):
+    """
+    设置批次的取消标记，执行中的 worker 在下一个接口前中止
+    :param bat_id: 测试批次ID
+    :param reason: 取消原因
+    """
+    store.client().set(KEY_CANCEL % bat_id, reason or '', ex=CANCEL_TTL)
+
+
+def abort(bat_id, reason):
+    """
+    设置批次的中止标记，执行中的 worker 在下一个接口前中止，批次记为失败
+    :param bat_id: 测试批次ID
+    :param reason: 中止原因（作为批次的错误消息）
+    """
+    store.client().set(KEY_ABORT % bat_id, reason, ex=CANCEL_TTL)
+
+
+def signal(bat_id):
+    """
+    :return: 批次已被中止或取消时返回对应的异常（BatchAborted / BatchCancelled），否则返回 None；
+             平台 Redis 不可用时视为未取消
+    """
+    try:
+        cancelled, aborted = store.client().mget(KEY_CANCEL % bat_id, KEY_ABORT % bat_id)
+    except redis.RedisError:
+        return None
+    if aborted is not None:
+        return BatchAborted(aborted)
+    if cancelled is not None:
+        return BatchCancelled(cancelled)
+    return None
+
+
+def cancel_reason(bat_id):
+    """
+    :return: 批次已被取消时返回取消原因（可能为空字符串），否则返回 None；平台 Redis 不可用时视为未取消
+    """
+    try:
+        return store.client().get(KEY_CANCEL % bat_id)
+    except redis.RedisError:
+        return None
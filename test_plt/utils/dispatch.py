@@ -0,0 +1,250 @@
+"""
+按项目公平调度：页面上提交的批次先在 Redis 中按项目排队，再由调度器按
+    1. 项目并发配额（Project.max_concurrency，0 表示不限）
+    2. 全局执行槽位（settings.TEST_PLT_DISPATCH_SLOTS）
+    3. 加权公平（虚拟时间 = 已派发批次数 / Project.fair_share_weight，最小者优先）
+派发到 celery，避免某个项目的大批量回归占满所有 worker。
+
+Redis 数据结构：
+    test_plt:fs:waiting:<项目ID>  LIST   等待中的任务（JSON）
+    test_plt:fs:projects          SET    有等待任务的项目
+    test_plt:fs:running:<项目ID>  ZSET   已派发未结束的批次，score 为派发时间（超时视为泄漏并回收）
+    test_plt:fs:owner             HASH   批次ID -> 项目ID
+    test_plt:fs:vtime             HASH   项目ID -> 虚拟时间
+
+平台 Redis 不可用时，提交的批次不经排队直接发送到 celery。
+"""
+import json
+import logging
+import math
+import time
+from datetime import timedelta
+
+import redis
+from celery import current_app
+from django.conf import settings
+from django.utils import timezone
+
+from test_plt.models import Project, TestBatch
+from test_plt.utils import store
+
+KEY_WAITING = 'test_plt:fs:waiting:%s'
+KEY_PROJECTS = 'test_plt:fs:projects'
+KEY_RUNNING = 'test_plt:fs:running:%s'
+KEY_OWNER = 'test_plt:fs:owner'
+KEY_VTIME = 'test_plt:fs:vtime'
+KEY_LOCK = 'test_plt:fs:lock'
+
+# 没有历史数据时，单个批次的预估执行耗时（ms）
+DEFAULT_RUN_MS = 60 * 1000
+
+
+def submit(bat: TestBatch, task_name, args):
+    """
+    提交批次任务：进入所属项目的等待队列，然后尝试派发
+    :param bat: 测试批次
+    :param task_name: celery 任务名，如 test_plt.tasks.run_cases_queue
+    :param args: 任务参数
+    """
+    if not settings.TEST_PLT_FAIR_SHARE:
+        send(bat.id, task_name, args)
+        return
+    r = store.client()
+    proj_id = bat.project_id
+    job = json.dumps({'bat_id': bat.id, 'task': task_name, 'args': args, 'submitted_at': time.time()})
+    try:
+        with r.lock(KEY_LOCK, timeout=10, blocking_timeout=5):
+            # 重新变为活跃的项目，虚拟时间追平到当前活跃项目的最小值，避免闲置积累的"额度"一次性挤占其他项目
+            if not r.llen(KEY_WAITING % proj_id) and not r.zcard(KEY_RUNNING % proj_id):
+                active = _active_projects(r)
+                vtimes = [float(v) for v in r.hmget(KEY_VTIME, active) if v] if active else []
+                if vtimes:
+                    own = float(r.hget(KEY_VTIME, proj_id) or 0)
+                    r.hset(KEY_VTIME, proj_id, max(own, min(vtimes)))
+            r.rpush(KEY_WAITING % proj_id, job)
+            r.sadd(KEY_PROJECTS, proj_id)
+    except redis.RedisError as e:
+        logging.getLogger('test_plt').warning(f"公平调度不可用，批次[{bat.id}]直接派发：{e}")
+        send(bat.id, task_name, args)
+        return
+    _safe_pump()
+
+
+def release(bat_id):
+    """
+    批次执行结束后释放执行槽位，并派发下一个任务
+    """
+    if not settings.TEST_PLT_FAIR_SHARE:
+        return
+    try:
+        r = store.client()
+        proj_id = r.hget(KEY_OWNER, bat_id)
+        if proj_id is None:
+            return
+        r.zrem(KEY_RUNNING % proj_id, bat_id)
+        r.hdel(KEY_OWNER, bat_id)
+    except redis.RedisError as e:
+        # 槽位由 _reclaim_stale 超时回收
+        logging.getLogger('test_plt').warning(f"公平调度：释放批次[{bat_id}]的槽位失败：{e}")
+        return
+    _safe_pump()
+
+
+def pump():
+    """
+    在配额与槽位允许的范围内，按加权公平原则尽可能多地派发等待中的任务；
+    只在选取任务时持有调度锁，发送到 celery 时不持有。发送失败的任务放回队首，等下次派发
+    """
+    logger = logging.getLogger('test_plt')
+    r = store.client()
+    while True:
+        with r.lock(KEY_LOCK, timeout=10, blocking_timeout=5):
+            picked = _pick(r)
+        if picked is None:
+            return
+        pid, raw, weight = picked
+        job = json.loads(raw)
+        try:
+            # 入队时间取提交到调度器的时间，使批次的排队耗时包含在 Redis 中等待的时间
+            send(job['bat_id'], job['task'], job['args'], headers={'enqueued_at': job['submitted_at']})
+        except Exception as e:
+            logger.warning(f"公平调度：派发批次[{job['bat_id']}]失败，放回等待队列：{e}")
+            with r.lock(KEY_LOCK, timeout=10, blocking_timeout=5):
+                _requeue(r, pid, raw, weight)
+            return
+        logger.info(f"公平调度：派发批次[{job['bat_id']}]（项目{pid}）")
+
+
+def _safe_pump():
+    try:
+        pump()
+    except redis.RedisError as e:
+        # 等待中的任务留在队列中，下次提交或释放槽位时再派发
+        logging.getLogger('test_plt').warning(f"公平调度：派发失败：{e}")
+
+
+def _pick(r):
+    """
+    选出下一个可以派发的任务并占用槽位（调用方持有调度锁）
+    :return: (项目ID, 任务JSON, 项目权重)；没有可派发的任务时返回 None
+    """
+    projects = {p.id: p for p in Project.objects.filter(id__in=r.smembers(KEY_PROJECTS))}
+    _reclaim_stale(r, projects)
+    running_total = sum(r.zcard(KEY_RUNNING % pid) for pid in _active_projects(r))
+    if running_total >= settings.TEST_PLT_DISPATCH_SLOTS:
+        return None
+    candidates = []
+    for pid, proj in projects.items():
+        if not r.llen(KEY_WAITING % pid):
+            continue
+        running = r.zcard(KEY_RUNNING % pid)
+        if proj.max_concurrency and running >= proj.max_concurrency:
+            continue
+        # 虚拟时间相同时，正在执行批次少的项目优先
+        candidates.append((float(r.hget(KEY_VTIME, pid) or 0), running, pid))
+    if not candidates:
+        return None
+    _, _, pid = min(candidates)
+    raw = r.lpop(KEY_WAITING % pid)
+    bat_id = json.loads(raw)['bat_id']
+    if not r.llen(KEY_WAITING % pid):
+        r.srem(KEY_PROJECTS, pid)
+    weight = max(projects[pid].fair_share_weight, 1)
+    r.zadd(KEY_RUNNING % pid, {bat_id: time.time()})
+    r.hset(KEY_OWNER, bat_id, pid)
+    r.hincrbyfloat(KEY_VTIME, pid, 1 / weight)
+    return pid, raw, weight
+
+
+def _requeue(r, pid, raw, weight):
+    """
+    撤销 _pick 的槽位占用，任务放回项目等待队列的队首（调用方持有调度锁）
+    """
+    bat_id = json.loads(raw)['bat_id']
+    r.zrem(KEY_RUNNING % pid, bat_id)
+    r.hdel(KEY_OWNER, bat_id)
+    r.hincrbyfloat(KEY_VTIME, pid, -1 / weight)
+    r.lpush(KEY_WAITING % pid, raw)
+    r.sadd(KEY_PROJECTS, pid)
+
+
+def send(bat_id, task_name, args, headers=None):
+    """
+    发送任务到 celery，并记录任务ID（取消批次时用于撤销尚未被领取的任务）
+    """
+    res = current_app.send_task(task_name, args=args, headers=headers)
+    TestBatch.objects.filter(id=bat_id).update(task_id=res.id)
+
+
+def withdraw(bat: TestBatch):
+    """
+    从调度器的等待队列中撤回批次（尚未派发到 celery 时）
+    :return: 是否撤回成功
+    """
+    if not settings.TEST_PLT_FAIR_SHARE:
+        return False
+    r = store.client()
+    with r.lock(KEY_LOCK, timeout=10, blocking_timeout=5):
+        for job in r.lrange(KEY_WAITING % bat.project_id, 0, -1):
+            if json.loads(job)['bat_id'] == bat.id:
+                r.lrem(KEY_WAITING % bat.project_id, 1, job)
+                if not r.llen(KEY_WAITING % bat.project_id):
+                    r.srem(KEY_PROJECTS, bat.project_id)
+                return True
+    return False
+
+
+def _active_projects(r):
+    """
+    有等待任务或有正在执行批次的项目
+    """
+    pids = set(r.smembers(KEY_PROJECTS))
+    pids.update(r.hvals(KEY_OWNER))
+    return list(pids)
+
+
+def _reclaim_stale(r, projects):
+    """
+    回收超过任务时限仍未释放的槽位（worker 被杀死等情况）
+    """
+    expire_before = time.time() - settings.CELERY_TASK_TIME_LIMIT - 60
+    for pid in set(list(projects) + [int(i) for i in r.hvals(KEY_OWNER)]):
+        for bat_id in r.zrangebyscore(KEY_RUNNING % pid, 0, expire_before):
+            r.zrem(KEY_RUNNING % pid, bat_id)
+            r.hdel(KEY_OWNER, bat_id)
+
+
+def queue_position(bat: TestBatch):
+    """
+    批次在调度器中的排队位置及预计开始时间
+    :return: (在项目队列中的位置（从1开始）, 预计开始时间)；不在等待队列中时返回 (None, None)
+    """
+    if not settings.TEST_PLT_FAIR_SHARE or bat.status != TestBatch.STATUS_PENDING:
+        return None, None
+    r = store.client()
+    jobs = r.lrange(KEY_WAITING % bat.project_id, 0, -1)
+    pos = next((i + 1 for i, job in enumerate(jobs) if json.loads(job)['bat_id'] == bat.id), None)
+    if pos is None:
+        return None, None
+    # 按权重估算该项目能分到的并发槽位
+    active = _active_projects(r)
+    weights = dict(Project.objects.filter(id__in=active).values_list('id', 'fair_share_weight'))
+    total_weight = sum(max(w, 1) for w in weights.values()) or 1
+    share = settings.TEST_PLT_DISPATCH_SLOTS * max(bat.project.fair_share_weight, 1) / total_weight
+    if bat.project.max_concurrency:
+        share = min(share, bat.project.max_concurrency)
+    share = max(share, 1)
+    eta = timezone.now() + timedelta(milliseconds=math.ceil(pos / share) * recent_run_ms(bat.project_id))
+    return pos, eta
+
+
+def recent_run_ms(proj_id=None):
+    """
+    最近完成批次的平均执行耗时（ms），用于估算排队时间
+    :param proj_id: 项目ID，为空时统计所有项目
+    """
+    recent = TestBatch.objects.filter(picked_at__isnull=False, finish_at__isnull=False)
+    if proj_id:
+        recent = recent.filter(project_id=proj_id)
+    runs = [(f - p).total_seconds() * 1000 for p, f in recent.order_by('-id').values_list('picked_at', 'finish_at')[:20]]
+    return sum(runs) / len(runs) if runs else DEFAULT_RUN_MS
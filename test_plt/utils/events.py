@@ -0,0 +1,185 @@
+"""
+批次执行的实时事件：perform_case 每执行完一个接口、一个用例，批次结束时，向 Redis 频道发布事件；
+auto_test_platform/asgi.py 中的 SSE（Server-Sent Events）端点订阅频道并推送给批次页面，
+页面不再需要反复刷新（每次刷新都要重新查询嵌套的执行履历）。
+
+事件（JSON）：
+    {'type': 'step', 'case_run_log_id', 'case', 'api', 'passed', 'duration', 'status_code', 'runlog_id'}
+    {'type': 'case', 'id', 'case', 'passed', 'duration', 'error_msg'}
+    {'type': 'batch', 'id', 'status', 'status_display'}    批次结束，页面收到后刷新
+
+发布失败只记录日志，不影响执行；没有订阅者时 Redis 直接丢弃事件。
+批次可能在页面打开后、订阅之前结束（错过结束事件），SSE 端点订阅后会再检查一次批次状态。
+
+SSE 端点需要以 ASGI 方式部署（Dockerfile 中为 gunicorn + uvicorn worker），以 WSGI 方式部署时应关闭 TEST_PLT_LIVE_EVENTS。
+"""
+import asyncio
+import json
+import logging
+import re
+from http.cookies import SimpleCookie
+from importlib import import_module
+
+import redis.asyncio
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.http import HttpRequest
+
+from test_plt.models import TestBatch
+from test_plt.utils import store
+
+CHANNEL = 'test_plt:batch:%s:events'
+# SSE 端点路径：/admin/test_plt/testbatch/<批次ID>/events/
+PATH_RE = re.compile(r'^/admin/test_plt/testbatch/(\d+)/events/$')
+# 没有事件时发送注释行的间隔（秒），防止代理断开空闲连接
+HEARTBEAT = 15
+# 事件中错误消息的截断长度
+ERROR_LEN = 300
+
+
+def publish(bat_id, event):
+    if not settings.TEST_PLT_LIVE_EVENTS or bat_id is None:
+        return
+    try:
+        store.client().publish(CHANNEL % bat_id, json.dumps(event, ensure_ascii=False, default=str))
+    except Exception as e:
+        logging.getLogger('test_plt').warning(f"批次[{bat_id}]实时事件发布失败：{e}")
+
+
+def _ms(value):
+    return None if value is None else round(value)
+
+
+def step(case_log, item, passed, result):
+    """
+    用例接口执行完毕（含校验）
+    :param result: 执行器的返回值，执行出错时为 None
+    """
+    result = result or {}
+    publish(case_log.test_batch_id, {
+        'type': 'step', 'case_run_log_id': case_log.id, 'case': case_log.case.name, 'api': item.api.name,
+        'passed': passed, 'duration': _ms(result.get('duration')), 'status_code': result.get('status_code'),
+        'runlog_id': result.get('runlog_id'),
+    })
+
+
+def case(case_log):
+    """
+    用例执行完毕
+    """
+    publish(case_log.test_batch_id, {
+        'type': 'case', 'id': case_log.id, 'case': case_log.case.name, 'passed': case_log.passed,
+        'duration': _ms(case_log.duration), 'error_msg': (case_log.error_msg or '')[:ERROR_LEN],
+    })
+
+
+def _batch_event(bat):
+    return {'type': 'batch', 'id': bat.id, 'status': bat.status, 'status_display': bat.get_status_display()}
+
+
+def batch(bat):
+    """
+    批次结束
+    """
+    publish(bat.id, _batch_event(bat))
+
+
+@sync_to_async
+def _finished_event(bat_id):
+    """
+    批次已结束时返回批次结束事件，否则返回 None
+    """
+    bat = TestBatch.objects.filter(id=bat_id).first()
+    if bat is None or bat.status == TestBatch.STATUS_PENDING:
+        return None
+    return _batch_event(bat)
+
+
+def _session_key(scope):
+    cookies = SimpleCookie()
+    for name, value in scope.get('headers', []):
+        if name == b'cookie':
+            cookies.load(value.decode('latin-1'))
+    morsel = cookies.get(settings.SESSION_COOKIE_NAME)
+    return morsel.value if morsel else None
+
+
+@sync_to_async
+def _authorized(session_key):
+    """
+    会话对应的用户是否可以查看测试批次
+    """
+    if not session_key:
+        return False
+    request = HttpRequest()
+    request.session = import_module(settings.SESSION_ENGINE).SessionStore(session_key)
+    user = get_user(request)
+    return user.is_active and user.is_staff and user.has_perm('test_plt.view_testbatch')
+
+
+async def _send_text(send, status, text):
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'text/plain; charset=utf-8')]})
+    await send({'type': 'http.response.body', 'body': text.encode('utf-8')})
+
+
+def _event_body(event_type, data):
+    return f"event: {event_type}\ndata: {data}\n\n".encode('utf-8')
+
+
+async def _disconnected(receive):
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+
+
+async def sse_app(scope, receive, send):
+    """
+    SSE 端点（原生 ASGI 应用，每个连接只占用一个协程和一个 Redis 订阅）
+    """
+    bat_id = int(PATH_RE.match(scope['path']).group(1))
+    if not await _authorized(_session_key(scope)):
+        return await _send_text(send, 403, '没有查看测试批次的权限')
+    client = redis.asyncio.Redis.from_url(settings.TEST_PLT_REDIS_URL, decode_responses=True)
+    pubsub = client.pubsub()
+    await pubsub.subscribe(CHANNEL % bat_id)
+    await send({'type': 'http.response.start', 'status': 200, 'headers': [
+        (b'content-type', b'text/event-stream; charset=utf-8'),
+        (b'cache-control', b'no-cache'),
+        # 关闭 nginx 的响应缓冲
+        (b'x-accel-buffering', b'no'),
+    ]})
+    disconnected = asyncio.ensure_future(_disconnected(receive))
+    try:
+        await send({'type': 'http.response.body', 'body': b'retry: 3000\n\n', 'more_body': True})
+        # 订阅之前批次已经结束时，不会再收到结束事件
+        finished = await _finished_event(bat_id)
+        if finished:
+            data = json.dumps(finished, ensure_ascii=False, default=str)
+            await send({'type': 'http.response.body', 'body': _event_body('batch', data)})
+            return
+        while True:
+            getter = asyncio.ensure_future(pubsub.get_message(ignore_subscribe_messages=True, timeout=HEARTBEAT))
+            await asyncio.wait((getter, disconnected), return_when=asyncio.FIRST_COMPLETED)
+            if disconnected.done():
+                # 浏览器关闭了页面
+                getter.cancel()
+                return
+            message = getter.result()
+            if message is None:
+                await send({'type': 'http.response.body', 'body': b': ping\n\n', 'more_body': True})
+                continue
+            event = json.loads(message['data'])
+            await send({'type': 'http.response.body', 'body': _event_body(event['type'], message['data']),
+                        'more_body': True})
+            if event['type'] == 'batch':
+                # 批次已结束
+                await send({'type': 'http.response.body', 'body': b''})
+                return
+    finally:
+        disconnected.cancel()
+        await pubsub.unsubscribe()
+        await pubsub.close()
+        await client.close()
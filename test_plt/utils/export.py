@@ -0,0 +1,239 @@
+"""
+测试批次结果导出（JUnit XML / JSON Lines / 静态 HTML），供 CI 看板等外部系统使用。
+
+用例执行履历与接口执行履历各自按主键顺序分页读取，再按用例执行履历ID归并，
+边读边输出（StreamingHttpResponse），内存占用与批次大小无关。
+"""
+import json
+from xml.sax.saxutils import escape, quoteattr
+
+from django.db.models import Count, Q, Sum
+from django.utils import html
+
+from test_plt.models import ApiRunLog, CaseRunLog, CaseSuiteRunLog, TestBatch
+from test_plt.utils.common import fmt_local_datetime
+
+# 每次从数据库读取的行数
+CHUNK_SIZE = 2000
+# 输出缓冲区大小（字节），避免逐行写出
+BUFFER_SIZE = 64 * 1024
+
+CASE_FIELDS = ('id', 'case_id', 'case__name', 'case_suite_run_log_id', 'start_at', 'duration', 'passed', 'error_msg')
+STEP_FIELDS = ('id', 'case_run_log_id', 'api_id', 'api__name', 'start_at', 'duration', 'status_code', 'success',
+               'error_msg', 'final_url')
+
+FORMATS = {
+    # 格式: (content_type, 文件扩展名)
+    'junit': ('application/xml; charset=utf-8', 'xml'),
+    'jsonl': ('application/x-ndjson; charset=utf-8', 'jsonl'),
+    'html': ('text/html; charset=utf-8', 'html'),
+}
+
+
+def _case_rows(bat: TestBatch):
+    """
+    按ID分页读取用例执行履历（MySQL 驱动会把 .iterator() 的整个结果集读入内存，这里按主键分页）
+    """
+    qs = CaseRunLog.objects.filter(test_batch=bat).order_by('id').values(*CASE_FIELDS)
+    last_id = 0
+    while True:
+        rows = list(qs.filter(id__gt=last_id)[:CHUNK_SIZE])
+        yield from rows
+        if len(rows) < CHUNK_SIZE:
+            return
+        last_id = rows[-1]['id']
+
+
+def _step_rows(bat: TestBatch):
+    """
+    按 (用例执行履历ID, ID) 分页读取接口执行履历
+    """
+    qs = ApiRunLog.objects.filter(case_run_log__test_batch=bat).order_by('case_run_log_id', 'id').values(*STEP_FIELDS)
+    page = qs
+    while True:
+        rows = list(page[:CHUNK_SIZE])
+        yield from rows
+        if len(rows) < CHUNK_SIZE:
+            return
+        last = rows[-1]
+        page = qs.filter(Q(case_run_log_id__gt=last['case_run_log_id']) |
+                         Q(case_run_log_id=last['case_run_log_id'], id__gt=last['id']))
+
+
+def iter_cases(bat: TestBatch):
+    """
+    按执行顺序依次返回 (用例执行履历, 该用例的接口执行履历迭代器)，均为字段名 -> 值 的字典；
+    接口执行履历边读边返回（单个用例下有大量接口执行也不会占用内存），需在取下一个用例前读完
+    """
+    cases = _case_rows(bat)
+    steps = _step_rows(bat)
+    current = [next(steps, None)]
+
+    def case_steps(case_id):
+        while current[0] is not None and current[0]['case_run_log_id'] == case_id:
+            yield current[0]
+            current[0] = next(steps, None)
+
+    for case in cases:
+        # 两个查询都按用例执行履历ID排序，归并即可
+        while current[0] is not None and current[0]['case_run_log_id'] < case['id']:
+            current[0] = next(steps, None)
+        group = case_steps(case['id'])
+        yield case, group
+        # 调用方没有读完的接口执行履历直接跳过
+        for _ in group:
+            pass
+
+
+def buffered(chunks, size=BUFFER_SIZE):
+    """
+    合并小块输出，达到 size 字节后再写出
+    """
+    buf, length = [], 0
+    for chunk in chunks:
+        data = chunk.encode('utf-8')
+        buf.append(data)
+        length += len(data)
+        if length >= size:
+            yield b''.join(buf)
+            buf, length = [], 0
+    if buf:
+        yield b''.join(buf)
+
+
+def _suite_names(bat: TestBatch):
+    return dict(CaseSuiteRunLog.objects.filter(test_batch=bat).values_list('id', 'case_suite__name'))
+
+
+def _seconds(ms):
+    return f"{(ms or 0) / 1000:.3f}"
+
+
+def junit(bat: TestBatch):
+    """
+    JUnit XML：每个套件执行履历（按用例执行的批次为整个批次）一个 testsuite，每个用例一个 testcase，
+    用例失败时输出 failure，各接口的执行情况写在 system-out 中，执行失败的接口写在 system-err 中
+    """
+    names = _suite_names(bat)
+    # testsuite 的属性需要先输出，按套件汇总用例数
+    totals = {row['case_suite_run_log_id']: row for row in
+              CaseRunLog.objects.filter(test_batch=bat).values('case_suite_run_log_id')
+              .annotate(tests=Count('id'), failures=Count('id', filter=Q(passed=False)), time=Sum('duration'))}
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield f'<testsuites name={quoteattr(f"测试批次{bat.id}")}>\n'
+    current = ()
+    for case, steps in iter_cases(bat):
+        suite_log_id = case['case_suite_run_log_id']
+        if suite_log_id != current:
+            if current != ():
+                yield '</testsuite>\n'
+            current = suite_log_id
+            total = totals.get(suite_log_id, {})
+            name = names.get(suite_log_id, f"测试批次{bat.id}")
+            yield f'<testsuite name={quoteattr(name)} tests="{total.get("tests", 0)}" ' \
+                  f'failures="{total.get("failures", 0)}" time="{_seconds(total.get("time"))}">\n'
+        classname = names.get(suite_log_id, f"测试批次{bat.id}")
+        yield f'<testcase classname={quoteattr(classname)} name={quoteattr(case["case__name"])} ' \
+              f'time="{_seconds(case["duration"])}">\n'
+        if case['passed'] is False:
+            message = (case['error_msg'] or '').splitlines()[0] if case['error_msg'] else ''
+            yield f'<failure message={quoteattr(message)}>{escape(case["error_msg"] or "")}</failure>\n'
+        failed_steps = []
+        yield '<system-out>'
+        for s in steps:
+            if not s['success']:
+                failed_steps.append(f"{s['api__name']}: {s['error_msg'] or ''}\n")
+            yield escape(f"[{'OK' if s['success'] else 'FAIL'}] {s['api__name']} "
+                         f"status={s['status_code']} {s['duration']}ms\n")
+        yield '</system-out>\n'
+        if failed_steps:
+            yield f'<system-err>{escape("".join(failed_steps))}</system-err>\n'
+        yield '</testcase>\n'
+    if current != ():
+        yield '</testsuite>\n'
+    yield '</testsuites>\n'
+
+
+def _json_default(value):
+    return value.isoformat()
+
+
+def jsonl(bat: TestBatch):
+    """
+    JSON Lines：第一行为批次，之后每个用例一行（type=case），随后是该用例的各接口执行（type=step）
+    """
+    names = _suite_names(bat)
+    head = {'type': 'batch', 'id': bat.id, 'project': str(bat.project), 'status': bat.get_status_display(),
+            'start_at': bat.start_at, 'finish_at': bat.finish_at, 'run_ms': bat.run_ms}
+    yield json.dumps(head, ensure_ascii=False, default=_json_default) + '\n'
+    for case, steps in iter_cases(bat):
+        row = {'type': 'case', 'id': case['id'], 'case_id': case['case_id'], 'name': case['case__name'],
+               'suite': names.get(case['case_suite_run_log_id']), 'start_at': case['start_at'],
+               'duration': case['duration'], 'passed': case['passed'], 'error_msg': case['error_msg']}
+        yield json.dumps(row, ensure_ascii=False, default=_json_default) + '\n'
+        for s in steps:
+            row = {'type': 'step', 'id': s['id'], 'case_run_log_id': s['case_run_log_id'], 'api_id': s['api_id'],
+                   'api': s['api__name'], 'start_at': s['start_at'], 'duration': s['duration'],
+                   'status_code': s['status_code'], 'success': s['success'], 'error_msg': s['error_msg'],
+                   'url': s['final_url']}
+            yield json.dumps(row, ensure_ascii=False, default=_json_default) + '\n'
+
+
+HTML_HEAD = """<!DOCTYPE html>
+<html lang="zh-CN">
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+body {{ font-family: sans-serif; font-size: 13px; }}
+table {{ border-collapse: collapse; width: 100%; }}
+th, td {{ border: 1px solid #ddd; padding: 4px 6px; text-align: left; vertical-align: top; }}
+tr.fail td {{ background: #fdecea; }}
+tr.step td {{ color: #666; }}
+pre {{ margin: 0; white-space: pre-wrap; }}
+</style>
+</head>
+<body>
+<h2>{title}</h2>
+<p>{meta}</p>
+<table>
+<tr><th>用例 / 接口</th><th>套件</th><th>结果</th><th>耗时(ms)</th><th>状态码</th><th>错误消息</th></tr>
+"""
+
+
+def html_report(bat: TestBatch):
+    """
+    静态 HTML 报告（单个文件，不依赖平台页面）
+    """
+    names = _suite_names(bat)
+    meta = f"项目：{bat.project} | 状态：{bat.get_status_display()} | 开始：{fmt_local_datetime(bat.start_at)} | " \
+           f"用例通过率：{bat.stat_case_success_rto}% | 接口成功率：{bat.stat_api_success_rto}%"
+    yield HTML_HEAD.format(title=html.escape(f"测试批次{bat.id}报告"), meta=html.escape(meta))
+    for case, steps in iter_cases(bat):
+        cls = ' class="fail"' if case['passed'] is False else ''
+        result = {True: '通过', False: '失败'}.get(case['passed'], '-')
+        yield f"<tr{cls}><td><b>{html.escape(case['case__name'])}</b></td>" \
+              f"<td>{html.escape(names.get(case['case_suite_run_log_id']) or '')}</td><td>{result}</td>" \
+              f"<td>{case['duration'] if case['duration'] is not None else '-'}</td><td></td>" \
+              f"<td><pre>{html.escape(case['error_msg'] or '')}</pre></td></tr>\n"
+        for s in steps:
+            cls = 'step fail' if not s['success'] else 'step'
+            yield f"<tr class=\"{cls}\"><td>&nbsp;&nbsp;└ {html.escape(s['api__name'])}</td><td></td>" \
+                  f"<td>{'成功' if s['success'] else '失败'}</td><td>{s['duration']}</td>" \
+                  f"<td>{s['status_code'] if s['status_code'] is not None else '-'}</td>" \
+                  f"<td><pre>{html.escape(s['error_msg'] or '')}</pre></td></tr>\n"
+    yield '</table>\n</body>\n</html>\n'
+
+
+EXPORTERS = {
+    'junit': junit,
+    'jsonl': jsonl,
+    'html': html_report,
+}
+
+
+def stream(bat: TestBatch, fmt):
+    """
+    :return: 导出内容（bytes 的迭代器）
+    """
+    return buffered(EXPORTERS[fmt](bat))
@@ -0,0 +1,44 @@
+"""
+不稳定用例统计：每个用例、用例接口执行结束时增量更新 CaseStat / CaseApiDefStat（通过率、翻转率、耗时均值与方差），
+不需要扫描执行履历；不稳定度见 RunStat.add
+"""
+import logging
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from test_plt.models import Case, CaseApiDefStat, CaseStat
+
+
+def _add(model, key, obj, passed, duration):
+    try:
+        with transaction.atomic():
+            stat, _ = model.objects.select_for_update().get_or_create(**{key: obj})
+    except IntegrityError:
+        # 并发创建时，另一个执行单元已经创建了统计记录
+        stat = model.objects.select_for_update().get(**{key: obj})
+    stat.add(passed, duration, settings.TEST_PLT_FLAKY_ALPHA, settings.TEST_PLT_FLAKY_MIN_RUNS)
+    stat.save()
+
+
+def record(case: Case, passed, duration, steps):
+    """
+    记录一次用例执行结果
+    :param case: 用例
+    :param passed: 用例是否通过
+    :param duration: 用例耗时（ms）
+    :param steps: {用例接口: [是否通过, 耗时(ms)]}，只包含实际执行到的接口
+    """
+    try:
+        with transaction.atomic():
+            _add(CaseStat, 'case', case, passed, duration)
+            # 按主键顺序加锁，避免并发更新同一批用例接口时死锁
+            for item, (step_passed, step_duration) in sorted(steps.items(), key=lambda kv: kv[0].id):
+                _add(CaseApiDefStat, 'case_api', item, step_passed, step_duration)
+    except Exception as e:
+        # 统计失败不影响用例执行
+        logging.getLogger('test_plt').warning(f"用例[{case.id}]执行统计更新失败：{e}")
+
+
+def is_flaky(stat):
+    return stat is not None and stat.flakiness >= settings.TEST_PLT_FLAKY_THRESHOLD
@@ -6,14 +6,15 @@ import traceback
 from datetime import datetime
 
 import requests
-from django.conf import settings
+from celery.exceptions import SoftTimeLimitExceeded
 from django.utils import timezone
 
 from test_plt.models import ApiRunLog, ApiDef
+from test_plt.utils import breaker, metrics, throttle, timeouts, trace
 
 
 def perform_api(api: ApiDef, query_params, http_headers, request_body, auth_username, auth_password, bearer_token, user,
-                case_log=None):
+                case_log=None, timeout=None, save_log=True):
     """
     执行接口
     :param api: 要执行的接口
@@ -25,6 +26,8 @@ def perform_api(api: ApiDef, query_params, http_headers, request_body, auth_user
     :param bearer_token: token值
     :param user: 接口创建人
     :param case_log: 关联测试用例日志
+    :param timeout: (连接超时, 读超时)，缺省时见 timeouts.resolve
+    :param save_log: 是否保存接口执行履历
     :return:
     """
     logger = logging.getLogger('test_plt')
@@ -61,14 +64,23 @@ def perform_api(api: ApiDef, query_params, http_headers, request_body, auth_user
             "params": query_params,
             "headers": http_headers,
             'auth': (auth_username, auth_password) if api.auth_type == 'basic' else None,
-            'timeout': settings.TEST_PLT_API_TIMEOUT,
+            'timeout': timeout or timeouts.resolve(api),
             'verify': False
         }
         # 根据请求体类型决定存入request的参数
         options.update({
             "json" if api.body_type == "raw-json" else "data": parse_request_body(api, request_body)
         })
-        res = requests.request(api.http_method, api.to_url(), **options)
+        # 部署环境已熔断时直接失败；否则先取得执行许可（限流/并发上限），等待时间单独记录
+        with breaker.guard(api.deploy_env, options['timeout']), \
+                throttle.permit(api.deploy_env, options['timeout']) as waited, \
+                trace.span('http', api_id=api.id, api_name=api.name, method=api.http_method,
+                           deploy_env_id=api.deploy_env_id) as sp, metrics.connection_in_use('http'):
+            runlog.wait_duration = waited
+            # 向被测系统传递 traceparent，使后端链路与测试批次的链路对齐（只加在发送的请求头上，执行履历保留填写的请求头）
+            options['headers'] = {**http_headers, 'traceparent': sp.traceparent()}
+            res = requests.request(api.http_method, api.to_url(), **options)
+            sp.set_attribute('status_code', res.status_code)
         # 8 获取并解析目标服务器的响应
         runlog.success = True
         runlog.response_body = res.text
@@ -77,10 +89,16 @@ def perform_api(api: ApiDef, query_params, http_headers, request_body, auth_user
         runlog.reason = res.reason
         runlog.final_url = res.url
         logger.info(f"[{runlog.api}] 执行成功")
+    except SoftTimeLimitExceeded:
+        # 超过 celery 任务的软时限：记录后继续抛出，由用例/批次中止执行
+        runlog.success = False
+        runlog.error_msg = '超过任务时限，执行中止'
+        raise
     except Exception as e:
         trace_msg = traceback.format_exc()
         runlog.success = False
         runlog.error_msg = f"{e}\n{trace_msg}"  # __str__
+        runlog.error_kind = breaker.error_kind(e)
         logger.info(f"[{runlog.api}] 执行失败： {runlog.error_msg}")  # 当成业务消息输出
     finally:
         # 记录接口执行的结束时间戳
@@ -88,9 +106,14 @@ def perform_api(api: ApiDef, query_params, http_headers, request_body, auth_user
         # 记录接口执行的耗时（耗时的单位？s、ms）
         duration = finish_at - start_at
         runlog.finish_at = timezone.make_aware(datetime.fromtimestamp(finish_at))
-        runlog.duration = duration * 1000
+        # 接口耗时不含等待执行许可的时间
+        runlog.duration = duration * 1000 - (runlog.wait_duration or 0)
         # 这里做的是一些收尾工作
-        runlog.save()
+        # 重复执行时只保存一条完整的执行履历，其余只记录耗时（见 repeat.run）
+        if save_log:
+            with metrics.observe_log_write('api_run_log'):
+                runlog.save()
+        metrics.observe_step(api, runlog)
     return {
         "runlog_id": runlog.id,
         "status_code": runlog.status_code,
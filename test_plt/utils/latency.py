@@ -0,0 +1,107 @@
+"""
+耗时退化检测：按（用例接口, 部署环境）维护耗时基线（指数加权均值与方差），每次执行成功后增量更新，不扫描执行履历。
+
+执行耗时同时满足以下条件时记为性能退化（ApiRunLog.latency_regressed）：
+    1. 基线样本数不少于 settings.TEST_PLT_LATENCY_MIN_SAMPLES
+    2. 超过基线均值 settings.TEST_PLT_LATENCY_Z 个标准差
+    3. 不低于基线均值的 settings.TEST_PLT_LATENCY_MIN_RATIO 倍（避免耗时很稳定的接口因微小波动被标记）
+基线的加权系数 settings.TEST_PLT_LATENCY_ALPHA 取得较小，缓慢的变慢也会在一段时间内持续偏离基线。
+"""
+import logging
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from test_plt.models import ApiDef, ApiRunLog, CaseApiDef, LatencyBaseline, TestBatch
+
+# 标准差下限（基线均值的比例），避免耗时极稳定时任何波动都超过阈值
+STD_FLOOR_RATIO = 0.05
+# 批次报告/通知中最多列出的退化接口数
+REPORT_LIMIT = 20
+
+
+def _update(case_api_id, deploy_env_id, duration):
+    """
+    判断本次耗时是否退化，并计入基线
+    :return: (执行前的基线均值（样本不足时为 None）, 是否退化)
+    """
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                bl, _ = LatencyBaseline.objects.select_for_update() \
+                    .get_or_create(case_api_id=case_api_id, deploy_env_id=deploy_env_id)
+        except IntegrityError:
+            bl = LatencyBaseline.objects.select_for_update().get(case_api_id=case_api_id, deploy_env_id=deploy_env_id)
+        baseline, regressed = None, False
+        if bl.samples >= settings.TEST_PLT_LATENCY_MIN_SAMPLES:
+            baseline = bl.mean
+            std = max(bl.std, bl.mean * STD_FLOOR_RATIO)
+            regressed = duration - bl.mean > settings.TEST_PLT_LATENCY_Z * std \
+                and duration >= bl.mean * settings.TEST_PLT_LATENCY_MIN_RATIO
+        if bl.samples == 0:
+            bl.mean, bl.var = float(duration), 0
+        else:
+            alpha = settings.TEST_PLT_LATENCY_ALPHA
+            diff = duration - bl.mean
+            bl.mean += alpha * diff
+            bl.var = (1 - alpha) * (bl.var + alpha * diff * diff)
+        bl.samples += 1
+        bl.save()
+    return baseline, regressed
+
+
+def observe(item: CaseApiDef, api: ApiDef, result):
+    """
+    记录用例接口的执行结果：接口执行履历关联到用例接口，执行成功时对照基线判断是否退化
+    :param item: 用例接口
+    :param api: 接口定义
+    :param result: 执行器返回的结果（含 runlog_id、success、duration）
+    :return: 是否退化
+    """
+    runlog_id = result.get('runlog_id')
+    if not runlog_id:
+        return False
+    fields = {'case_api': item}
+    try:
+        if result.get('success') and result.get('duration') is not None and api.deploy_env_id:
+            baseline, regressed = _update(item.id, api.deploy_env_id, result['duration'])
+            fields.update(latency_baseline=baseline, latency_regressed=regressed)
+        ApiRunLog.objects.filter(id=runlog_id).update(**fields)
+    except Exception as e:
+        # 基线更新失败不影响用例执行
+        logging.getLogger('test_plt').warning(f"接口执行履历[{runlog_id}]耗时基线更新失败：{e}")
+        return False
+    return fields.get('latency_regressed', False)
+
+
+def regressions(bat: TestBatch):
+    """
+    批次中耗时退化的接口执行履历，按超出基线的比例从高到低
+    :return: (总数, [{'case': 用例名, 'api': 接口名, 'duration': 耗时, 'baseline': 基线, 'ratio': 超出比例(%)}])
+    """
+    qs = ApiRunLog.objects.filter(case_run_log__test_batch=bat, latency_regressed=True)
+    total = qs.count()
+    if not total:
+        return 0, []
+    top = qs.annotate(ratio=F('duration') / F('latency_baseline')).order_by('-ratio') \
+        .values_list('case_run_log__case__name', 'api__name', 'duration', 'latency_baseline')[:REPORT_LIMIT]
+    rows = [{'case': case_name, 'api': api_name, 'duration': duration, 'baseline': round(baseline),
+             'ratio': round((duration - baseline) * 100 / baseline)}
+            for case_name, api_name, duration, baseline in top]
+    return total, rows
+
+
+def report_text(bat: TestBatch):
+    """
+    钉钉通知中的"性能退化"部分，没有退化时返回空字符串
+    """
+    total, rows = regressions(bat)
+    if not total:
+        return ''
+    lines = [f"性能退化：{total}个接口执行耗时明显高于基线； "]
+    for row in rows[:5]:
+        lines.append(f"  [{row['case']}] {row['api']}：{row['duration']}ms（基线{row['baseline']}ms，+{row['ratio']}%）")
+    if total > 5:
+        lines.append(f"  ……共{total}个，详见批次报告")
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,95 @@
+"""
+Prometheus 指标：执行吞吐量与延迟
+
+多进程（gunicorn / celery prefork）部署时，需要在启动前设置环境变量 PROMETHEUS_MULTIPROC_DIR
+指向一个空目录，各进程的指标写入该目录，由 registry() 聚合输出。
+"""
+import os
+from contextlib import contextmanager
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, multiprocess
+
+from test_plt.models import TestBatch
+
+# 接口耗时的桶（秒）
+STEP_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# 用例/套件/批次耗时的桶（秒）
+RUN_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+STEPS = Counter('test_plt_steps_total', '接口执行次数', ['protocol', 'outcome'])
+STEP_LATENCY = Histogram('test_plt_step_duration_seconds', '接口执行耗时',
+                         ['protocol', 'deploy_env'], buckets=STEP_BUCKETS)
+CASE_DURATION = Histogram('test_plt_case_duration_seconds', '用例执行耗时', ['outcome'], buckets=RUN_BUCKETS)
+SUITE_DURATION = Histogram('test_plt_suite_duration_seconds', '用例套件执行耗时', ['outcome'], buckets=RUN_BUCKETS)
+BATCH_DURATION = Histogram('test_plt_batch_duration_seconds', '测试批次执行耗时（不含排队）',
+                           ['obj_type', 'run_type', 'status'], buckets=RUN_BUCKETS)
+QUEUE_WAIT = Histogram('test_plt_batch_queue_wait_seconds', '测试批次排队等待时间（提交到第一个接口开始执行）',
+                       ['run_type'], buckets=RUN_BUCKETS)
+PERMIT_WAIT = Histogram('test_plt_permit_wait_seconds', '等待部署环境执行许可（限流/并发上限）的时间',
+                        ['deploy_env'], buckets=STEP_BUCKETS)
+LOG_WRITE = Histogram('test_plt_log_write_duration_seconds', '执行履历写库耗时', ['model'],
+                      buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1))
+CONNECTIONS_IN_USE = Gauge('test_plt_executor_connections_in_use', '执行器正在使用的被测系统连接数',
+                           ['protocol'], multiprocess_mode='livesum')
+
+
+def registry():
+    """
+    /metrics 输出使用的 registry：多进程模式下聚合 PROMETHEUS_MULTIPROC_DIR 中所有进程的指标
+    """
+    if 'PROMETHEUS_MULTIPROC_DIR' not in os.environ:
+        return REGISTRY
+    reg = CollectorRegistry()
+    multiprocess.MultiProcessCollector(reg)
+    return reg
+
+
+@contextmanager
+def connection_in_use(protocol):
+    gauge = CONNECTIONS_IN_USE.labels(protocol)
+    gauge.inc()
+    try:
+        yield
+    finally:
+        gauge.dec()
+
+
+def observe_step(api, runlog):
+    """
+    记录一次接口执行
+    :param api: ApiDef
+    :param runlog: 已完成的 ApiRunLog
+    """
+    STEPS.labels(api.protocol, 'success' if runlog.success else 'error').inc()
+    STEP_LATENCY.labels(api.protocol, api.deploy_env.name).observe(runlog.duration / 1000)
+
+
+def observe_log_write(model_name):
+    return LOG_WRITE.labels(model_name).time()
+
+
+def _batch_labels(bat: TestBatch):
+    obj_type = 'suite' if bat.obj_type == TestBatch.OBJ_TYPE_SUITE else 'case'
+    run_type = 'periodic' if bat.run_type == TestBatch.RUN_TYPE_PERIODIC else 'queue'
+    return obj_type, run_type
+
+
+def observe_first_step(bat: TestBatch):
+    """
+    批次的第一个接口开始执行时，记录从提交（start_at）开始的排队时间，
+    包括公平调度队列、celery 队列中的等待和执行前的预检
+    """
+    _, run_type = _batch_labels(bat)
+    QUEUE_WAIT.labels(run_type).observe(max((bat.first_step_at - bat.start_at).total_seconds(), 0))
+
+
+def observe_batch_finish(bat: TestBatch):
+    """
+    记录批次的执行耗时（不含排队时间）
+    """
+    obj_type, run_type = _batch_labels(bat)
+    status = 'finished' if bat.status == TestBatch.STATUS_FINISHED else 'failed'
+    run_ms = bat.run_ms
+    if run_ms is None:
+        run_ms = (bat.finish_at - bat.start_at).total_seconds() * 1000
+    BATCH_DURATION.labels(obj_type, run_type, status).observe(run_ms / 1000)
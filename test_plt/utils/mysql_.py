@@ -4,11 +4,13 @@ import time
 import traceback
 from datetime import datetime
 import pymysql
+from celery.exceptions import SoftTimeLimitExceeded
 from django.utils import timezone
 from test_plt.models import ApiDef, ApiRunLog
+from test_plt.utils import breaker, metrics, throttle, timeouts, trace
 
 
-def perform_api(api: ApiDef, mysql_key, user, case_log=None):
+def perform_api(api: ApiDef, mysql_key, user, case_log=None, timeout=None, save_log=True):
     logger = logging.getLogger('test_plt')
     start_at = time.time()
     runlog = ApiRunLog()
@@ -17,36 +19,50 @@ def perform_api(api: ApiDef, mysql_key, user, case_log=None):
     runlog.mysql_key = mysql_key
     runlog.created_by = user
     runlog.case_run_log = case_log
+    connect_timeout, read_timeout = timeout or timeouts.resolve(api)
     try:
-        connect = pymysql.connect(
-            host=api.deploy_env.hostname,
-            port=api.deploy_env.port,
-            user=api.db_username,
-            password=api.db_password,
-            db=api.db_name,
-            # charset='utf8'
-        )
-        cur = connect.cursor()  # 打开游标
+        with breaker.guard(api.deploy_env, (connect_timeout, read_timeout)), \
+                throttle.permit(api.deploy_env, (connect_timeout, read_timeout)) as waited, \
+                trace.span('mysql', api_id=api.id, api_name=api.name, deploy_env_id=api.deploy_env_id), \
+                metrics.connection_in_use('mysql'):
+            runlog.wait_duration = waited
+            connect = pymysql.connect(
+                host=api.deploy_env.hostname,
+                port=api.deploy_env.port,
+                user=api.db_username,
+                password=api.db_password,
+                db=api.db_name,
+                connect_timeout=connect_timeout,
+                read_timeout=read_timeout,
+                # charset='utf8'
+            )
+            cur = connect.cursor()  # 打开游标
 
-        # # 查询
-        # error_list = ['delete', 'insert', 'create', 'update', '*']
-        # if mysql_key in error_list:
-        #     ValidationError("请输入正确的查询语句（仅支持查询）")
-        # sql_queue = mysql_key
+            # # 查询
+            # error_list = ['delete', 'insert', 'create', 'update', '*']
+            # if mysql_key in error_list:
+            #     ValidationError("请输入正确的查询语句（仅支持查询）")
+            # sql_queue = mysql_key
 
-        cur.execute(mysql_key)  # 执行sql
-        connect.commit()
-        response_body = [i for i in cur.fetchall()]
-        runlog.response_body = response_body  # 获取执行结果
-        cur.close()  # 关闭游标、连接
-        connect.close()
+            cur.execute(mysql_key)  # 执行sql
+            connect.commit()
+            response_body = [i for i in cur.fetchall()]
+            runlog.response_body = response_body  # 获取执行结果
+            cur.close()  # 关闭游标、连接
+            connect.close()
         runlog.success = True
         logger.info(f'{runlog.api}执行成功')
 
+    except SoftTimeLimitExceeded:
+        # 超过 celery 任务的软时限：记录后继续抛出，由用例/批次中止执行
+        runlog.success = False
+        runlog.error_msg = '超过任务时限，执行中止'
+        raise
     except Exception as e:
         trace_msg = traceback.format_exc()
         runlog.success = False
         runlog.error_msg = f"{e}\n{trace_msg}"  # __str__
+        runlog.error_kind = breaker.error_kind(e)
         logger.info(f'{runlog.api}执行失败：{runlog.error_msg}')
 
     finally:
@@ -55,8 +71,12 @@ def perform_api(api: ApiDef, mysql_key, user, case_log=None):
         # 履历 -4记录接口执行的耗时(单位是什么？秒/毫秒/微妙/纳秒？)
         duration = (finish_at - start_at)
         runlog.finish_at = timezone.make_aware(datetime.fromtimestamp(finish_at))
-        runlog.duration = duration * 1000
-        runlog.save()
+        runlog.duration = duration * 1000 - (runlog.wait_duration or 0)
+        # 重复执行时只保存一条完整的执行履历，其余只记录耗时（见 repeat.run）
+        if save_log:
+            with metrics.observe_log_write('api_run_log'):
+                runlog.save()
+        metrics.observe_step(api, runlog)
 
     return {
         'runlog_id': runlog.id,
@@ -0,0 +1,114 @@
+"""
+用例执行顺序：失败优先模式下，可独立执行的用例（Case.independent）按历史执行情况重新排序
+
+    1. 最近一次执行失败的用例
+    2. 不稳定的用例（最近几次执行结果来回变化）、失败率高的用例
+    3. 其余用例按耗时从短到长
+
+不可独立执行的用例保持原来的位置，可独立执行的用例在它们原来占据的位置之间重新排列。
+各用例的得分由最近的 CaseRunLog 计算，缓存在 Redis 中（settings.TEST_PLT_ORDER_CACHE_TTL 秒后重新计算）。
+"""
+import json
+from datetime import timedelta
+
+import redis
+from django.conf import settings
+from django.utils import timezone
+
+from test_plt.models import Case, CaseRunLog, TestBatch
+from test_plt.utils import store
+
+KEY_SCORES = 'test_plt:order:scores'
+KEY_SCORES_AT = 'test_plt:order:scores_at'
+
+# 每个用例参与计算的最近执行次数
+HISTORY_RUNS = 20
+# 统计窗口（天）
+HISTORY_DAYS = 30
+# 最近一次失败的权重（大于失败率与不稳定度之和的上限，保证最近失败的用例排在最前）
+LAST_FAILED_WEIGHT = 3
+
+
+def compute_scores(case_ids):
+    """
+    根据最近的执行履历计算用例得分
+    :return: {用例ID: {'score': 得分（越大越先执行）, 'duration': 平均耗时(ms)}}，没有履历的用例不在结果中
+    """
+    since = timezone.now() - timedelta(days=HISTORY_DAYS)
+    history = {}
+    rows = CaseRunLog.objects.filter(case_id__in=case_ids, start_at__gte=since, passed__isnull=False) \
+        .order_by('case_id', '-id').values_list('case_id', 'passed', 'duration')
+    for case_id, passed, duration in rows.iterator():
+        runs = history.setdefault(case_id, [])
+        if len(runs) < HISTORY_RUNS:
+            runs.append((passed, duration))
+    scores = {}
+    for case_id, runs in history.items():
+        results = [passed for passed, _ in runs]
+        fail_rate = results.count(False) / len(results)
+        # 不稳定度：相邻两次执行结果不同的比例
+        flip_rate = sum(a != b for a, b in zip(results, results[1:])) / max(len(results) - 1, 1)
+        durations = [d for _, d in runs if d is not None]
+        scores[case_id] = {
+            'score': LAST_FAILED_WEIGHT * (not results[0]) + fail_rate + flip_rate,
+            'duration': sum(durations) / len(durations) if durations else None,
+        }
+    return scores
+
+
+def scores(case_ids):
+    """
+    用例得分（优先读缓存，缓存过期后重新计算）
+    """
+    r = store.client()
+    try:
+        if r.exists(KEY_SCORES_AT):
+            cached = r.hmget(KEY_SCORES, case_ids)
+            result = {case_id: json.loads(v) for case_id, v in zip(case_ids, cached) if v}
+            missing = [case_id for case_id, v in zip(case_ids, cached) if v is None]
+        else:
+            r.delete(KEY_SCORES)
+            result, missing = {}, list(case_ids)
+        if missing:
+            fresh = compute_scores(missing)
+            # 没有履历的用例也写入缓存，避免每次重新查询
+            values = {case_id: json.dumps(fresh.get(case_id, {'score': 0, 'duration': None})) for case_id in missing}
+            with r.pipeline() as pipe:
+                pipe.hset(KEY_SCORES, mapping=values)
+                pipe.set(KEY_SCORES_AT, timezone.now().isoformat(), ex=settings.TEST_PLT_ORDER_CACHE_TTL, nx=True)
+                pipe.execute()
+            result.update(fresh)
+        return result
+    except redis.RedisError:
+        return compute_scores(case_ids)
+
+
+def failure_first(case_ids):
+    """
+    失败优先排序
+    :param case_ids: 按 reorder 排好的用例ID
+    :return: 重新排序后的用例ID
+    """
+    independent = set(Case.objects.filter(id__in=case_ids, independent=True).values_list('id', flat=True))
+    if len(independent) < 2:
+        return list(case_ids)
+    movable = [case_id for case_id in case_ids if case_id in independent]
+    table = scores(movable)
+    # 没有耗时数据的用例排在同分用例的最后
+    default = {'score': 0, 'duration': None}
+
+    def key(case_id):
+        s = table.get(case_id) or default
+        return -s['score'], s['duration'] is None, s['duration'] or 0
+
+    ordered = iter(sorted(movable, key=key))
+    return [next(ordered) if case_id in independent else case_id for case_id in case_ids]
+
+
+def arrange(case_ids, order_mode):
+    """
+    按批次的排序方式排列用例
+    """
+    if order_mode == TestBatch.ORDER_FAILURE_FIRST:
+        return failure_first(case_ids)
+    return list(case_ids)
@@ -0,0 +1,124 @@
+"""
+批次耗时预估：提交批次前根据各用例的历史耗时与当前排队情况，预估排队耗时与执行耗时
+
+    - 执行耗时：按分片数用 LPT 算法分配（见 sharding.balance），取最慢分片的预计耗时；不分片时为各用例耗时之和
+    - 排队耗时：排在前面的批次（含执行中的）超出执行槽位的部分，按最近批次的平均执行耗时估算
+
+预估结果记录在 TestBatch.estimated_wait_ms / estimated_ms 上，可以与实际的排队耗时、执行耗时对比。
+"""
+import math
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from test_plt.models import CaseSuite, Project, TestBatch
+from test_plt.utils import dispatch, sharding
+
+# 统计排在前面的批次的时间范围（更早仍处于排队中的批次视为已失效）
+QUEUE_WINDOW = timedelta(days=1)
+
+
+def suite_case_ids(suite_ids):
+    """
+    套件批次中依次执行的用例ID（套件按顺序执行）
+    """
+    case_ids = []
+    for suite in CaseSuite.objects.filter(id__in=suite_ids).prefetch_related('cases'):
+        case_ids.extend(case.id for case in sorted(suite.cases.all(), key=lambda c: c.reorder))
+    return case_ids
+
+
+def default_shards(case_ids):
+    """
+    按 settings.TEST_PLT_SHARDS / settings.TEST_PLT_SHARD_MIN_CASES 的默认分片数
+    """
+    if len(case_ids) < settings.TEST_PLT_SHARD_MIN_CASES:
+        return 1
+    return max(min(settings.TEST_PLT_SHARDS, len(case_ids)), 1)
+
+
+def run_ms(case_ids, estimates, shards, dependent_ids=()):
+    """
+    预计执行耗时（ms）
+    :param case_ids: 用例ID列表
+    :param estimates: {用例ID: 预估耗时(ms)}，见 sharding.estimate
+    :param shards: 分片数
+    :param dependent_ids: 不可独立执行的用例ID，见 sharding.dependent
+    """
+    if shards <= 1:
+        return sum(estimates[case_id] for case_id in case_ids)
+    return max(load for _, load in sharding.balance(case_ids, estimates, shards, dependent_ids))
+
+
+def wait_ms(project: Project):
+    """
+    预计排队耗时（ms）：新提交的批次需要等待几轮执行槽位
+    """
+    slots = max(settings.TEST_PLT_DISPATCH_SLOTS, 1)
+    since = timezone.now() - QUEUE_WINDOW
+    ahead = TestBatch.objects.filter(run_type=TestBatch.RUN_TYPE_QUEUE, status=TestBatch.STATUS_PENDING,
+                                     start_at__gte=since)
+    rounds = ahead.count() // slots
+    if project.max_concurrency:
+        rounds = max(rounds, ahead.filter(project=project).count() // project.max_concurrency)
+    return int(rounds * dispatch.recent_run_ms(project.id)) if rounds else 0
+
+
+def estimate(case_ids, project: Project, shards=None):
+    """
+    预估批次耗时
+    :param case_ids: 批次中依次执行的用例ID
+    :param project: 测试项目
+    :param shards: 分片数，为空时按配置的默认分片数
+    :return: {'cases': 用例数, 'shards': 分片数, 'total_ms': 各用例耗时之和,
+              'run_ms': 预计执行耗时, 'wait_ms': 预计排队耗时, 'finish_at': 预计完成时间}
+    """
+    shards = min(shards or default_shards(case_ids), max(len(case_ids), 1))
+    estimates = sharding.estimate(case_ids)
+    run = int(run_ms(case_ids, estimates, shards, sharding.dependent(case_ids)))
+    wait = wait_ms(project)
+    return {
+        'cases': len(case_ids),
+        'shards': shards,
+        'total_ms': int(sum(estimates.values())),
+        'run_ms': run,
+        'wait_ms': wait,
+        'finish_at': timezone.now() + timedelta(milliseconds=wait + run),
+    }
+
+
+def options(case_ids, project: Project, max_shards=None):
+    """
+    不同分片数下的预估执行耗时，供提交前选择
+    :param max_shards: 最大分片数，为空时取 interactive 通道的 worker 并发数
+    :return: [(分片数, 预计执行耗时(ms))]
+    """
+    max_shards = min(max_shards or max(settings.TEST_PLT_WORKER_LANES['interactive'], settings.TEST_PLT_SHARDS),
+                     max(len(case_ids), 1))
+    estimates = sharding.estimate(case_ids)
+    dependent_ids = sharding.dependent(case_ids)
+    return [(shards, int(run_ms(case_ids, estimates, shards, dependent_ids))) for shards in range(1, max_shards + 1)]
+
+
+def deviation(bat: TestBatch):
+    """
+    实际执行耗时相对预估的偏差（%），没有预估或尚未结束时返回 None
+    """
+    if not bat.estimated_ms or bat.run_ms is None:
+        return None
+    return round((bat.run_ms - bat.estimated_ms) * 100 / bat.estimated_ms, 1)
+
+
+def fmt_ms(ms):
+    """
+    将毫秒格式化为 x时x分x秒
+    """
+    seconds = math.ceil(ms / 1000)
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    if hours:
+        return f"{hours}时{minutes}分{seconds}秒"
+    if minutes:
+        return f"{minutes}分{seconds}秒"
+    return f"{seconds}秒"
@@ -0,0 +1,86 @@
+"""
+批次执行前的环境预检：并发探测批次用到的所有部署环境，有不可达的环境时批次直接失败，不再逐个接口等待超时
+"""
+import logging
+import socket
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+
+from test_plt.models import DeployEnv
+from test_plt.utils import trace
+
+# 最多同时探测的环境数
+MAX_WORKERS = 16
+
+
+class PreflightFailed(Exception):
+    def __init__(self, unreachable):
+        self.unreachable = unreachable
+
+    def __str__(self):
+        hosts = '；'.join(f"{env}({env.hostname}:{env.port})：{reason}" for env, reason in self.unreachable)
+        return f"环境预检失败，以下部署环境不可达：{hosts}"
+
+
+def batch_deploy_envs(case_ids=None, suite_ids=None):
+    """
+    批次中所有用例接口用到的部署环境（去重）
+    :param case_ids: 用例ID列表
+    :param suite_ids: 用例套件ID列表
+    """
+    qs = DeployEnv.objects.all()
+    if suite_ids is not None:
+        qs = qs.filter(apidef__caseapidef__case__case_belong_to__id__in=suite_ids)
+    else:
+        qs = qs.filter(apidef__caseapidef__case__id__in=case_ids)
+    return list(qs.distinct())
+
+
+def probe(env: DeployEnv, timeout):
+    """
+    探测部署环境：配置了健康检查地址时请求该地址（5xx 视为不可用），否则尝试建立 TCP 连接
+    :return: 不可达的原因；可达时返回 None
+    """
+    try:
+        if env.health_url:
+            res = requests.get(env.health_url, timeout=timeout, verify=False)
+            if res.status_code >= 500:
+                return f"健康检查返回 {res.status_code}"
+        else:
+            socket.create_connection((env.hostname, env.port), timeout=timeout).close()
+    except Exception as e:
+        return str(e) or e.__class__.__name__
+    return None
+
+
+def check(envs):
+    """
+    并发探测部署环境
+    :param envs: 部署环境列表
+    :return: 不可达的环境列表 [(环境, 原因)]
+    """
+    if not envs:
+        return []
+    timeout = settings.TEST_PLT_PREFLIGHT_TIMEOUT
+    with ThreadPoolExecutor(max_workers=min(len(envs), MAX_WORKERS)) as pool:
+        reasons = list(pool.map(lambda env: probe(env, timeout), envs))
+    return [(env, reason) for env, reason in zip(envs, reasons) if reason]
+
+
+def ensure(case_ids=None, suite_ids=None):
+    """
+    批次开始前的环境预检（settings.TEST_PLT_PREFLIGHT 开启时）
+    :raise PreflightFailed: 有不可达的部署环境
+    """
+    if not settings.TEST_PLT_PREFLIGHT:
+        return
+    envs = batch_deploy_envs(case_ids, suite_ids)
+    with trace.span('preflight', env_count=len(envs)) as sp:
+        unreachable = check(envs)
+        if unreachable:
+            e = PreflightFailed(unreachable)
+            sp.set_error(e)
+            logging.getLogger('test_plt').info(str(e))
+            raise e
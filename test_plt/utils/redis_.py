@@ -3,11 +3,13 @@ import time
 import traceback
 from datetime import datetime
 import redis
+from celery.exceptions import SoftTimeLimitExceeded
 from django.utils import timezone
 from test_plt.models import ApiRunLog, ApiDef
+from test_plt.utils import breaker, metrics, throttle, timeouts, trace
 
 
-def perform_api(api: ApiDef, redis_key, user, case_log=None):
+def perform_api(api: ApiDef, redis_key, user, case_log=None, timeout=None, save_log=True):
     logger = logging.getLogger('test_plt')
     start_at = time.time()
     runlog = ApiRunLog()
@@ -16,29 +18,47 @@ def perform_api(api: ApiDef, redis_key, user, case_log=None):
     runlog.redis_key = redis_key
     runlog.created_by = user
     runlog.case_run_log = case_log
+    connect_timeout, read_timeout = timeout or timeouts.resolve(api)
     # 7 连接redis，获取响应的内容
     try:
-        conn = redis.Redis(host=api.deploy_env.hostname,
-                           port=api.deploy_env.port,
-                           db=api.db_name,
-                           password=api.db_password,
-                           decode_responses=True)
-        runlog.success = True
-        runlog.response_body = conn.get(redis_key)
+        with breaker.guard(api.deploy_env, (connect_timeout, read_timeout)), \
+                throttle.permit(api.deploy_env, (connect_timeout, read_timeout)) as waited, \
+                trace.span('redis', api_id=api.id, api_name=api.name, deploy_env_id=api.deploy_env_id), \
+                metrics.connection_in_use('redis'):
+            runlog.wait_duration = waited
+            conn = redis.Redis(host=api.deploy_env.hostname,
+                               port=api.deploy_env.port,
+                               db=api.db_name,
+                               password=api.db_password,
+                               socket_connect_timeout=connect_timeout,
+                               socket_timeout=read_timeout,
+                               decode_responses=True)
+            runlog.success = True
+            runlog.response_body = conn.get(redis_key)
         logger.info(f'{runlog.api}执行成功')
+    except SoftTimeLimitExceeded:
+        # 超过 celery 任务的软时限：记录后继续抛出，由用例/批次中止执行
+        runlog.success = False
+        runlog.error_msg = '超过任务时限，执行中止'
+        raise
     except Exception as e:
         trace_msg = traceback.format_exc()
         runlog.success = False
         runlog.error_msg = f"{e}\n{trace_msg}"  # __str__
+        runlog.error_kind = breaker.error_kind(e)
         logger.info(f"[{runlog.api}] 执行失败： {runlog.error_msg}")  # 当成业务消息输出
     finally:
         # 记录接口执行的结束时间戳
         finish_at = time.time()
         runlog.finish_at = timezone.make_aware(datetime.fromtimestamp(finish_at))
         # 记录接口执行的耗时（耗时的单位？s、ms）
-        runlog.duration = (finish_at - start_at) * 1000
+        runlog.duration = (finish_at - start_at) * 1000 - (runlog.wait_duration or 0)
         # 存入数据库
-        runlog.save()
+        # 重复执行时只保存一条完整的执行履历，其余只记录耗时（见 repeat.run）
+        if save_log:
+            with metrics.observe_log_write('api_run_log'):
+                runlog.save()
+        metrics.observe_step(api, runlog)
     return {
         "runlog_id": runlog.id,
         "values": runlog.response_body,
@@ -0,0 +1,97 @@
+"""
+重复执行用例接口：先执行 CaseApiDef.warmup 次预热（不计入），再执行 CaseApiDef.repeat 次，
+响应时间校验使用各次耗时的百分位（CaseApiDef.latency_percentile），避免单次耗时的偶然波动导致误报。
+
+只有第一次计入的执行保存完整的接口执行履历，各次耗时以 float32 紧凑地保存在该履历的 samples 字段中。
+"""
+import array
+import contextvars
+import math
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connection
+
+from test_plt.models import ApiRunLog, CaseApiDef
+from test_plt.utils import deadline
+
+
+def percentile(values, p):
+    """
+    百分位（最近秩法）
+    :param values: 样本
+    :param p: 百分位（0~100）
+    """
+    ordered = sorted(values)
+    return ordered[max(math.ceil(p / 100 * len(ordered)) - 1, 0)]
+
+
+def pack(values):
+    """
+    将耗时打包为 float32 小端序字节串（见 ApiRunLog.sample_values）
+    """
+    packed = array.array('f', values)
+    if sys.byteorder != 'little':
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def _sample(execute):
+    """
+    在线程池中执行一次（不保存执行履历）
+    :return: (耗时, 是否成功)；批次已取消或超过时限时不再执行，返回 None
+    """
+    if deadline.poll():
+        return None
+    try:
+        result = execute(False)
+        return result.get('duration'), bool(result.get('success'))
+    finally:
+        # 执行器在线程中可能用到数据库连接，用完关闭
+        connection.close()
+
+
+def run(item: CaseApiDef, execute):
+    """
+    按用例接口的重复执行配置执行接口
+    :param item: 用例接口
+    :param execute: 执行一次接口的函数 execute(save_log) -> 执行器返回的结果
+    :return: 保存了执行履历的那一次的结果；重复执行时附加
+             samples（各次耗时）、sample_failures（失败次数）、duration_percentile（耗时百分位）
+    """
+    if item.repeat <= 1 and not item.warmup:
+        return execute(True)
+    for _ in range(item.warmup):
+        execute(False)
+    result = execute(True)
+    samples = [result.get('duration')]
+    failures = 0 if result.get('success') else 1
+    rest = item.repeat - 1
+    if item.repeat_concurrency > 1 and rest > 1:
+        with ThreadPoolExecutor(max_workers=min(item.repeat_concurrency, rest)) as pool:
+            # 每次执行使用当前上下文的副本，使链路追踪、截止时间在线程中同样生效
+            futures = [pool.submit(contextvars.copy_context().run, _sample, execute) for _ in range(rest)]
+            try:
+                outcomes = [o for o in (f.result() for f in futures) if o is not None]
+            except BaseException:
+                # 等待中被中止（如超过任务软时限）时，取消尚未开始的执行，不等它们执行完
+                for f in futures:
+                    f.cancel()
+                raise
+    else:
+        outcomes = []
+        for _ in range(rest):
+            # 批次已取消或超过时限时不再继续重复
+            if deadline.poll():
+                break
+            res = execute(False)
+            outcomes.append((res.get('duration'), bool(res.get('success'))))
+    for duration, success in outcomes:
+        samples.append(duration)
+        failures += not success
+    samples = [d for d in samples if d is not None]
+    if result.get('runlog_id'):
+        ApiRunLog.objects.filter(id=result['runlog_id']).update(samples=pack(samples), sample_failures=failures)
+    result.update(samples=samples, sample_failures=failures,
+                  duration_percentile=percentile(samples, item.latency_percentile) if samples else None)
+    return result
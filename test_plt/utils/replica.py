@@ -0,0 +1,105 @@
+"""
+只读副本（从库）读取
+
+报表、执行履历浏览等只读请求通过 reads() 标记（上下文变量），标记范围内的查询由
+auto_test_platform.routers.ReplicaRouter 路由到 settings.DATABASES 中的 'replica'；
+写入、以及未标记的读取（用例执行、批次统计 stat() 等需要读到最新数据的场景）始终使用主库。
+
+从库复制延迟超过 settings.TEST_PLT_REPLICA_MAX_LAG 秒、复制中断或无法查询延迟时，读取回退到主库；
+延迟每 settings.TEST_PLT_REPLICA_LAG_CHECK_INTERVAL 秒检查一次（每个进程单独缓存）。
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+
+ALIAS = 'replica'
+
+_reads = ContextVar('test_plt_replica_reads', default=False)
+_lock = threading.Lock()
+# (检查时间, 延迟是否在阈值内)
+_lag_state = [0.0, False]
+
+
+def configured():
+    return ALIAS in settings.DATABASES
+
+
+@contextmanager
+def reads(enabled=True):
+    """
+    在范围内从从库读取；reads(False) 可在从库读取的范围内强制使用主库
+    """
+    token = _reads.set(enabled)
+    try:
+        yield
+    finally:
+        _reads.reset(token)
+
+
+def wrap(iterable):
+    """
+    流式响应的内容在视图返回后才读取，每次取值时都在 reads() 范围内
+    """
+    it = iter(iterable)
+    done = object()
+    while True:
+        with reads():
+            chunk = next(it, done)
+        if chunk is done:
+            return
+        yield chunk
+
+
+def lag():
+    """
+    从库的复制延迟（秒），复制中断时为 None；非 MySQL 的数据库无法查询，视为0
+    """
+    conn = connections[ALIAS]
+    if conn.vendor != 'mysql':
+        return 0
+    with conn.cursor() as cursor:
+        try:
+            cursor.execute('SHOW REPLICA STATUS')
+        except Exception:
+            # MySQL 8.0.22 之前的版本
+            cursor.execute('SHOW SLAVE STATUS')
+        row = cursor.fetchone()
+        if row is None:
+            # 不是从库（例如指向主库本身）
+            return 0
+        status = dict(zip((col[0] for col in cursor.description), row))
+    return status.get('Seconds_Behind_Source', status.get('Seconds_Behind_Master'))
+
+
+def lag_ok():
+    """
+    从库延迟是否在阈值内（缓存 TEST_PLT_REPLICA_LAG_CHECK_INTERVAL 秒）
+    """
+    now = time.monotonic()
+    if now - _lag_state[0] < settings.TEST_PLT_REPLICA_LAG_CHECK_INTERVAL:
+        return _lag_state[1]
+    with _lock:
+        if now - _lag_state[0] < settings.TEST_PLT_REPLICA_LAG_CHECK_INTERVAL:
+            return _lag_state[1]
+        try:
+            seconds = lag()
+            ok = seconds is not None and seconds <= settings.TEST_PLT_REPLICA_MAX_LAG
+            if not ok:
+                logging.getLogger('test_plt').warning(f"从库复制延迟{seconds}秒，读取回退到主库")
+        except Exception as e:
+            ok = False
+            logging.getLogger('test_plt').warning(f"查询从库复制延迟失败，读取回退到主库：{e}")
+        _lag_state[:] = [time.monotonic(), ok]
+        return ok
+
+
+def active():
+    """
+    当前是否从从库读取
+    """
+    return _reads.get() and configured() and lag_ok()
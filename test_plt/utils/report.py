@@ -0,0 +1,124 @@
+"""
+报表统计：接口执行履历按列分块读取（values_list）到 NumPy 数组中，再向量化计算
+各接口的耗时百分位、错误率、状态码分布与最慢的接口执行，不逐条实例化 ORM 对象。
+"""
+import numpy as np
+
+from test_plt.models import ApiDef, ApiRunLog, TestBatch
+
+# 每次从数据库读取的行数
+CHUNK_SIZE = 20000
+# 统计的耗时百分位
+PERCENTILES = (50, 90, 95, 99)
+# 没有状态码（非 HTTP 接口或执行失败）时的占位值
+NO_STATUS = -1
+
+
+def load_steps(qs):
+    """
+    按列读取接口执行履历
+    :param qs: ApiRunLog 查询集
+    :return: {'id', 'api_id', 'duration', 'success', 'status_code'} -> NumPy 数组；
+             duration 为 float64（空值为 nan），status_code 的空值为 NO_STATUS
+    """
+    fields = ('id', 'api_id', 'duration', 'success', 'status_code')
+    chunks = {f: [] for f in fields}
+    rows = []
+    for row in qs.order_by().values_list(*fields).iterator(chunk_size=CHUNK_SIZE):
+        rows.append(row)
+        if len(rows) >= CHUNK_SIZE:
+            _append(chunks, fields, rows)
+            rows = []
+    if rows:
+        _append(chunks, fields, rows)
+    dtypes = {'id': np.int64, 'api_id': np.int64, 'duration': np.float64, 'success': bool, 'status_code': np.int64}
+    return {f: np.concatenate(chunks[f]) if chunks[f] else np.empty(0, dtype=dtypes[f]) for f in fields}
+
+
+def _append(chunks, fields, rows):
+    ids, api_ids, durations, success, status_codes = zip(*rows)
+    chunks['id'].append(np.fromiter(ids, dtype=np.int64, count=len(rows)))
+    chunks['api_id'].append(np.fromiter(api_ids, dtype=np.int64, count=len(rows)))
+    # None 转换为 nan
+    chunks['duration'].append(np.array(durations, dtype=np.float64))
+    chunks['success'].append(np.fromiter(success, dtype=bool, count=len(rows)))
+    chunks['status_code'].append(np.fromiter((NO_STATUS if s is None else s for s in status_codes),
+                                             dtype=np.int64, count=len(rows)))
+
+
+def summarize(steps, slowest=10):
+    """
+    汇总接口执行数据
+    :param steps: load_steps 的结果
+    :param slowest: 列出最慢的接口执行条数
+    :return: {'total', 'failed', 'error_rate', 'percentiles', 'apis', 'status_codes', 'slowest'}，耗时单位ms
+    """
+    total = len(steps['id'])
+    if not total:
+        return {'total': 0, 'failed': 0, 'error_rate': 0, 'percentiles': {}, 'apis': [], 'status_codes': [],
+                'slowest': []}
+    duration, success = steps['duration'], steps['success']
+    failed = int(total - np.count_nonzero(success))
+    result = {
+        'total': total,
+        'failed': failed,
+        'error_rate': round(failed * 100 / total, 2),
+        'percentiles': _percentiles(duration),
+    }
+
+    # 按接口分组：排序后每个接口占一段连续区间
+    order = np.argsort(steps['api_id'], kind='stable')
+    api_ids, starts, counts = np.unique(steps['api_id'][order], return_index=True, return_counts=True)
+    sorted_duration = duration[order]
+    fails = np.add.reduceat((~success[order]).astype(np.int64), starts)
+    names = dict(ApiDef.objects.filter(id__in=api_ids.tolist()).values_list('id', 'name'))
+    apis = []
+    for api_id, start, count, fail in zip(api_ids.tolist(), starts.tolist(), counts.tolist(), fails.tolist()):
+        values = sorted_duration[start:start + count]
+        apis.append({
+            'api_id': api_id,
+            'name': names.get(api_id, api_id),
+            'count': count,
+            'failed': fail,
+            'error_rate': round(fail * 100 / count, 2),
+            'mean': _round(np.nanmean(values)) if np.any(~np.isnan(values)) else None,
+            'percentiles': _percentiles(values),
+            'max': _round(np.nanmax(values)) if np.any(~np.isnan(values)) else None,
+        })
+    apis.sort(key=lambda a: -(a['percentiles'].get(95) or 0))
+    result['apis'] = apis
+
+    codes, code_counts = np.unique(steps['status_code'], return_counts=True)
+    result['status_codes'] = [(None if code == NO_STATUS else code, cnt)
+                              for code, cnt in zip(codes.tolist(), code_counts.tolist())]
+
+    # 最慢的 N 条：argpartition 只做部分排序
+    valid = np.flatnonzero(~np.isnan(duration))
+    n = min(slowest, len(valid))
+    if n:
+        top = valid[np.argpartition(duration[valid], -n)[-n:]]
+        top = top[np.argsort(-duration[top])]
+        result['slowest'] = [{'id': int(steps['id'][i]), 'api_id': int(steps['api_id'][i]),
+                              'name': names.get(int(steps['api_id'][i])), 'duration': _round(duration[i]),
+                              'success': bool(success[i])} for i in top]
+    else:
+        result['slowest'] = []
+    return result
+
+
+def _percentiles(values):
+    values = values[~np.isnan(values)]
+    if not len(values):
+        return {}
+    return dict(zip(PERCENTILES, (_round(v) for v in np.percentile(values, PERCENTILES))))
+
+
+def _round(value):
+    return round(float(value), 1)
+
+
+def batch_summary(bat: TestBatch, slowest=10):
+    """
+    测试批次的接口执行统计
+    """
+    return summarize(load_steps(ApiRunLog.objects.filter(case_run_log__test_batch=bat)), slowest)
@@ -1,6 +1,7 @@
 import json
 import re
 
+from celery.exceptions import SoftTimeLimitExceeded
 from jsonschema.exceptions import SchemaError, ValidationError
 from jsonschema.validators import validate
 
@@ -25,8 +26,9 @@ def check_case_apidef_http(item: CaseApiDef, result: dict):
     if item.status_code and item.status_code != result.get('status_code'):
         raise RespCheckException("状态码", f"预期[{item.status_code}], 实际[{result.get('status_code')}]")
 
-    # 响应时间校验
-    check_duration(item, result.get("duration"))
+    # 重复执行的失败次数、响应时间校验（重复执行时使用耗时百分位）
+    check_repeat(item, result)
+    check_duration(item, result.get("duration_percentile") or result.get("duration"))
 
     # HTTP 响应头校验 可以将响应头转为json字符串，使用正则表达式校验
     if item.header_verify and not re.search(item.header_verify, str(result.get("headers"))):
@@ -47,8 +49,9 @@ def check_case_apidef_redis(item: CaseApiDef, result: dict):
     # 是否校验总开关
     if not item.verify:
         return True
-    # 响应时间校验
-    check_duration(item, result.get("duration"))
+    # 重复执行的失败次数、响应时间校验（重复执行时使用耗时百分位）
+    check_repeat(item, result)
+    check_duration(item, result.get("duration_percentile") or result.get("duration"))
 
     # 应答体JSON Schema校验，使用json-schema包来做校验
     check_json_schema(item, result.get('values'))
@@ -61,6 +64,18 @@ def check_case_apidef_redis(item: CaseApiDef, result: dict):
     return True
 
 
+def check_repeat(item: CaseApiDef, result: dict):
+    """
+    重复执行时，任何一次执行失败都视为校验失败
+    :param item:
+    :param result: 执行结果（见 repeat.run）
+    :return:
+    """
+    failures = result.get('sample_failures')
+    if failures:
+        raise RespCheckException("重复执行", f"{len(result.get('samples'))}次中有{failures}次执行失败")
+
+
 def check_duration(item: CaseApiDef, duration):
     """
     响应时间校验
@@ -70,7 +85,8 @@ def check_duration(item: CaseApiDef, duration):
     """
     duration = duration / 1000
     if item.response_time and item.response_time <= duration:  # 界面上输入的时间 正常应该是大于 接口的实际运行时间
-        raise RespCheckException("响应时间", f"预期[{item.response_time}], 实际[{duration}]")
+        actual = f"P{item.latency_percentile} " if item.repeat > 1 else ''
+        raise RespCheckException("响应时间", f"预期[{item.response_time}], 实际[{actual}{duration}]")
 
 
 def check_json_schema(item: CaseApiDef, text):
@@ -87,6 +103,8 @@ def check_json_schema(item: CaseApiDef, text):
             raise RespCheckException('JSON Schema', f"您输入的JSON Schema包含错误，参考{e}")
         except ValidationError as e:
             raise RespCheckException('JSON Schema', f"接口返回的应答体内容不符合指定的Json Schema要求，参考{e}")
+        except SoftTimeLimitExceeded:
+            raise
         except Exception as e:
             raise RespCheckException('JSON Schema', f"发生了非预期的错误，参考{e}")
 
@@ -131,5 +149,8 @@ def check_expression(item: CaseApiDef, result):
             eval_ = eval(exp[2:-1], {}, local_params)
             if not eval_:
                 raise RespCheckException('应答体python脚本', f"表达式执行结果为：[{eval_}]")
+        except SoftTimeLimitExceeded:
+            # 超过 celery 任务的软时限不是校验失败，继续抛出
+            raise
         except Exception as e:
             raise RespCheckException('应答体python脚本', f"表达式执行失败，请先修正再重新执行用例，参考：[{e}]")
\ No newline at end of file
@@ -0,0 +1,87 @@
+"""
+增量选择用例：根据用例内容指纹，只执行有变化、上次失败或太久没有执行的用例
+
+指纹覆盖用例本身、各用例接口（含查询参数/请求头/请求体）以及执行时用到的接口定义、部署环境字段，
+任何一项变化都会使指纹改变。每次执行用例时指纹记录在 CaseRunLog.fingerprint 上。
+"""
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from test_plt.models import Case, CaseRunLog
+
+CASE_FIELDS = ('abort_when_fail', 'time_limit')
+CASE_API_FIELDS = ('api_id', 'reorder', 'abort_when_fail', 'auth_username', 'auth_password', 'bearer_token',
+                   'redis_key', 'mysql_key', 'verify', 'status_code', 'response_time', 'timeout', 'header_verify',
+                   'json_verify', 'regex_verify', 'python_verify', 'pre_proc', 'post_proc')
+API_FIELDS = ('protocol', 'http_schema', 'http_method', 'uri', 'auth_type', 'body_type', 'timeout',
+              'db_name', 'db_username', 'db_password', 'deploy_env_id')
+DEPLOY_ENV_FIELDS = ('hostname', 'port')
+
+
+def _values(obj, fields):
+    return [getattr(obj, f) for f in fields]
+
+
+def case_fingerprint(case: Case):
+    """
+    用例内容指纹（sha256）；用例接口等关联数据使用 prefetch 的结果（见 fingerprints）
+    """
+    items = []
+    for item in sorted(case.case_apidefs.all(), key=lambda i: (i.reorder, i.id)):
+        api = item.api
+        items.append({
+            'case_api': _values(item, CASE_API_FIELDS),
+            'query_params': sorted([p.param_name, p.param_value] for p in item.query_params.all()),
+            'http_headers': sorted([h.header_name, h.header_value] for h in item.http_headers.all()),
+            'request_body': sorted([b.param_name or '', b.param_value or '', b.raw_value or '']
+                                   for b in item.request_body.all()),
+            'api': _values(api, API_FIELDS),
+            'deploy_env': _values(api.deploy_env, DEPLOY_ENV_FIELDS),
+        })
+    content = json.dumps({'case': _values(case, CASE_FIELDS), 'items': items}, sort_keys=True, default=str)
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def prefetch(qs):
+    return qs.prefetch_related('case_apidefs__api__deploy_env', 'case_apidefs__query_params',
+                               'case_apidefs__http_headers', 'case_apidefs__request_body')
+
+
+def fingerprints(case_ids):
+    """
+    :return: {用例ID: 指纹}
+    """
+    return {case.id: case_fingerprint(case) for case in prefetch(Case.objects.filter(id__in=case_ids))}
+
+
+def select_changed(case_ids, only_independent=False, current=None):
+    """
+    增量选择：有变化、上次执行失败、超过 settings.TEST_PLT_SELECT_FRESHNESS_HOURS 没有执行过的用例
+    :param case_ids: 用例ID列表（执行顺序）
+    :param only_independent: 只跳过可独立执行的用例（其余用例可能依赖前面用例设置的上下文）
+    :param current: 已计算的用例指纹 {用例ID: 指纹}（见 fingerprints），为空时计算
+    :return: 选中的用例ID列表（保持原顺序）
+    """
+    since = timezone.now() - timedelta(hours=settings.TEST_PLT_SELECT_FRESHNESS_HOURS)
+    last = {}
+    rows = CaseRunLog.objects.filter(case_id__in=case_ids, start_at__gte=since, passed__isnull=False) \
+        .order_by('case_id', '-id').values_list('case_id', 'passed', 'fingerprint')
+    for case_id, passed, fp in rows.iterator():
+        last.setdefault(case_id, (passed, fp))
+    if current is None:
+        current = fingerprints(case_ids)
+    skippable = None
+    if only_independent:
+        skippable = set(Case.objects.filter(id__in=case_ids, independent=True).values_list('id', flat=True))
+    selected = []
+    for case_id in case_ids:
+        passed, fp = last.get(case_id, (False, None))
+        unchanged = passed and fp == current.get(case_id)
+        if unchanged and (skippable is None or case_id in skippable):
+            continue
+        selected.append(case_id)
+    return selected
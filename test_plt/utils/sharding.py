@@ -0,0 +1,90 @@
+"""
+按历史耗时均衡分片：大批量的用例批次拆分为多个 celery 子任务并行执行，
+用"最长处理时间优先"（LPT）算法分配，使各分片的预计耗时尽量接近，避免最慢的分片拖长整个批次
+
+只有可独立执行的用例（Case.independent）会被分散到各分片；其余用例可能依赖前面用例设置的上下文，
+作为一个整体按原顺序放在同一个分片中执行（失败时终止的效果也保持不变）
+"""
+import heapq
+import statistics
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Avg
+from django.utils import timezone
+
+from test_plt.models import Case, CaseRunLog
+
+# 统计用例历史耗时的时间窗口（天）
+HISTORY_DAYS = 14
+
+
+def estimate(case_ids):
+    """
+    预估各用例的执行耗时：最近一段时间的平均耗时；没有历史记录的用例取已知用例耗时的中位数（都没有时取默认值）
+    :param case_ids: 用例ID列表
+    :return: {用例ID: 预估耗时(ms)}
+    """
+    since = timezone.now() - timedelta(days=HISTORY_DAYS)
+    rows = CaseRunLog.objects.filter(case_id__in=case_ids, start_at__gte=since, duration__isnull=False) \
+        .values('case_id').annotate(avg=Avg('duration'))
+    known = {row['case_id']: row['avg'] for row in rows}
+    default = statistics.median(known.values()) if known else settings.TEST_PLT_SHARD_DEFAULT_MS
+    return {case_id: known.get(case_id, default) for case_id in case_ids}
+
+
+def dependent(case_ids):
+    """
+    不可独立执行的用例ID集合
+    """
+    independent = set(Case.objects.filter(id__in=case_ids, independent=True).values_list('id', flat=True))
+    return {case_id for case_id in case_ids if case_id not in independent}
+
+
+def units(case_ids, dependent_ids=()):
+    """
+    分配单元：每个可独立执行的用例单独一个单元，其余用例按原顺序合为一个单元
+    :return: [用例ID列表]
+    """
+    block = [case_id for case_id in case_ids if case_id in dependent_ids]
+    result = [[case_id] for case_id in case_ids if case_id not in dependent_ids]
+    if block:
+        result.append(block)
+    return result
+
+
+def balance(case_ids, estimates, shards, dependent_ids=()):
+    """
+    LPT 分配：按预估耗时从大到小，依次把分配单元分给当前预计耗时最小的分片
+    :param case_ids: 用例ID列表（执行顺序）
+    :param estimates: {用例ID: 预估耗时(ms)}
+    :param shards: 分片数
+    :param dependent_ids: 不可独立执行的用例ID，这些用例分在同一个分片中（见 dependent）
+    :return: [(用例ID列表, 预计耗时(ms))]，分片内保持用例原来的相对顺序
+    """
+    order = {case_id: i for i, case_id in enumerate(case_ids)}
+    heap = [(0, i, []) for i in range(shards)]
+    loads = [(sum(estimates[c] for c in unit), unit) for unit in units(case_ids, dependent_ids)]
+    for cost, unit in sorted(loads, key=lambda x: (-x[0], order[x[1][0]])):
+        load, i, ids = heapq.heappop(heap)
+        ids.extend(unit)
+        heapq.heappush(heap, (load + cost, i, ids))
+    result = [(sorted(ids, key=order.get), load) for load, i, ids in sorted(heap, key=lambda x: x[1]) if ids]
+    return result
+
+
+def plan(case_ids, shards=None):
+    """
+    批次的分片方案（settings.TEST_PLT_SHARDS 大于1且用例数不少于 settings.TEST_PLT_SHARD_MIN_CASES 时分片）
+    :param shards: 提交时指定的分片数，指定时不受 settings.TEST_PLT_SHARD_MIN_CASES 限制
+    :return: [(用例ID列表, 预计耗时(ms))]；不需要分片时（含可拆分的单元不足两个）返回空列表
+    """
+    if shards is None:
+        if len(case_ids) < settings.TEST_PLT_SHARD_MIN_CASES:
+            return []
+        shards = settings.TEST_PLT_SHARDS
+    dependent_ids = dependent(case_ids)
+    shards = min(shards, len(units(case_ids, dependent_ids)))
+    if shards <= 1:
+        return []
+    return balance(case_ids, estimate(case_ids), shards, dependent_ids)
@@ -0,0 +1,108 @@
+"""
+测试批次报告快照：批次执行完毕/执行失败后，把报告数据（统计、套件/用例结果、失败的接口执行）汇总为 JSON 并渲染为 HTML，
+保存在 TestBatchReport 中。查看批次时直接展示快照，不再逐层查询套件 -> 用例 -> 接口的执行履历。
+
+为控制快照大小，只列出失败用例的接口执行和执行失败的接口（最多 MAX_STEP_ROWS 条），其余用例只记录接口数。
+"""
+import logging
+
+from django.db.models import Count, Q
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from test_plt.models import ApiRunLog, CaseRunLog, CaseSuiteRunLog, TestBatch, TestBatchReport
+from test_plt.utils import latency, replica, report
+from test_plt.utils.common import trunc_text
+
+# 生成快照的批次状态
+FINAL_STATUS = (TestBatch.STATUS_FINISHED, TestBatch.STATUS_FAILED)
+# 快照中最多列出的接口执行条数
+MAX_STEP_ROWS = 2000
+# 错误消息截断长度
+ERROR_LEN = 500
+
+
+def collect(bat: TestBatch):
+    """
+    汇总批次的报告数据
+    """
+    step_counts = {row['case_run_log_id']: row for row in
+                   ApiRunLog.objects.filter(case_run_log__test_batch=bat).values('case_run_log_id')
+                   .annotate(total=Count('id'), failed=Count('id', filter=Q(success=False)))}
+    steps = {}
+    step_qs = ApiRunLog.objects.filter(case_run_log__test_batch=bat) \
+        .filter(Q(success=False) | Q(case_run_log__passed=False)).order_by('id') \
+        .values_list('id', 'case_run_log_id', 'api__name', 'status_code', 'duration', 'success', 'error_msg')
+    for log_id, clog_id, api_name, status_code, duration, success, error_msg in step_qs[:MAX_STEP_ROWS]:
+        steps.setdefault(clog_id, []).append({
+            'id': log_id, 'api': api_name, 'status_code': status_code, 'duration': duration, 'success': success,
+            'error_msg': trunc_text(error_msg, ERROR_LEN),
+        })
+
+    cases_by_suite = {}
+    case_qs = CaseRunLog.objects.filter(test_batch=bat).order_by('id') \
+        .values_list('id', 'case_id', 'case__name', 'case_suite_run_log_id', 'passed', 'duration', 'error_msg')
+    for clog_id, case_id, name, slog_id, passed, duration, error_msg in case_qs.iterator():
+        counts = step_counts.get(clog_id, {})
+        cases_by_suite.setdefault(slog_id, []).append({
+            'id': clog_id, 'case_id': case_id, 'name': name, 'passed': passed, 'duration': duration,
+            'error_msg': trunc_text(error_msg, ERROR_LEN),
+            'steps': counts.get('total', 0), 'failed_steps': counts.get('failed', 0),
+            'step_logs': steps.get(clog_id, []),
+        })
+
+    suites = []
+    suite_qs = CaseSuiteRunLog.objects.filter(test_batch=bat).order_by('id') \
+        .values_list('id', 'case_suite__name', 'passed', 'duration', 'error_msg')
+    for slog_id, name, passed, duration, error_msg in suite_qs:
+        suites.append({
+            'id': slog_id, 'name': name, 'passed': passed, 'duration': duration,
+            'error_msg': trunc_text(error_msg, ERROR_LEN),
+            'cases': cases_by_suite.pop(slog_id, []),
+        })
+    _, regressions = latency.regressions(bat)
+    return {
+        'generated_at': timezone.now().isoformat(),
+        'summary': report.batch_summary(bat),
+        'regressions': regressions,
+        'suites': suites,
+        # 不属于套件的用例（按用例执行的批次）
+        'cases': [case for cases in cases_by_suite.values() for case in cases],
+        'truncated': step_qs.count() > MAX_STEP_ROWS,
+    }
+
+
+def build(bat: TestBatch):
+    """
+    生成（或重新生成）批次的报告快照
+    """
+    data = collect(bat)
+    html = render_to_string('admin/test_plt/testbatch/report_snapshot.html', {'bat': bat, 'data': data})
+    obj, _ = TestBatchReport.objects.update_or_create(test_batch=bat, defaults={'data': data, 'html': html})
+    return obj
+
+
+# 从库延迟时可能读不到快照或刚写入的执行履历，快照的读取与生成都使用主库
+@replica.reads(False)
+def get(bat: TestBatch):
+    """
+    批次的报告快照：已结束的批次没有快照（或快照已作废）时即时生成；未结束的批次返回 None
+    """
+    if bat.status not in FINAL_STATUS:
+        return None
+    try:
+        return TestBatchReport.objects.get(test_batch=bat)
+    except TestBatchReport.DoesNotExist:
+        return build(bat)
+
+
+def build_quietly(bat: TestBatch):
+    """
+    批次结束时生成快照，失败时只记录日志（查看批次时会再次生成）
+    """
+    if bat.status not in FINAL_STATUS:
+        return
+    try:
+        build(bat)
+    except Exception as e:
+        logging.getLogger('test_plt').warning(f"批次[{bat.id}]报告快照生成失败：{e}")
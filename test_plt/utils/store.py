@@ -0,0 +1,15 @@
+"""
+平台自身使用的 Redis（调度队列、限流、熔断等需要在多个 worker 之间共享的状态）
+注意与 redis_ 区分：redis_ 是执行被测系统 Redis 接口的执行器
+"""
+import redis
+from django.conf import settings
+
+_client = None
+
+
+def client() -> redis.Redis:
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(settings.TEST_PLT_REDIS_URL, decode_responses=True)
+    return _client
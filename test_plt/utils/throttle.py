@@ -0,0 +1,102 @@
+"""
+按部署环境限流：多个 worker 共享的令牌桶（每秒请求数）与并发信号量（同时在途的请求数）
+
+执行器在每次请求被测系统之前调用 permit()，等待许可的时间单独记录，不计入接口耗时。
+"""
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from test_plt.models import DeployEnv
+from test_plt.utils import metrics, store, timeouts
+
+KEY_BUCKET = 'test_plt:throttle:bucket:%s'
+KEY_SEMAPHORE = 'test_plt:throttle:sem:%s'
+
+# 令牌桶：允许预约未来的令牌（令牌数可为负），返回需要等待的秒数；等待超过上限时不预约，返回 -1
+TOKEN_BUCKET_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local max_wait = tonumber(ARGV[3])
+local data = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(data[1]) or burst
+local ts = tonumber(data[2]) or now
+tokens = math.min(burst, tokens + (now - ts) * rate)
+local wait = 0
+if tokens < 1 then
+    wait = (1 - tokens) / rate
+end
+if wait > max_wait then
+    return '-1'
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens - 1), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 60)
+return tostring(wait)
+"""
+
+# 信号量：持有者为 ZSET 成员，score 为租约到期时间，过期的租约自动回收（防止 worker 异常退出后永久占用）
+SEMAPHORE_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+if redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[1]) then
+    redis.call('ZADD', KEYS[1], now + tonumber(ARGV[2]), ARGV[3])
+    redis.call('EXPIRE', KEYS[1], math.ceil(tonumber(ARGV[2])) + 60)
+    return 1
+end
+return 0
+"""
+
+# 信号量轮询间隔（秒）
+POLL_INTERVAL = 0.05
+
+
+class PermitTimeout(Exception):
+    def __init__(self, deploy_env, reason):
+        self.deploy_env = deploy_env
+        self.reason = reason
+
+    def __str__(self):
+        return f"等待部署环境[{self.deploy_env}]的执行许可超时：{self.reason}"
+
+
+@contextmanager
+def permit(deploy_env: DeployEnv, timeout=None):
+    """
+    获取部署环境的执行许可（限流令牌 + 并发槽位）
+    :param deploy_env: 部署环境
+    :param timeout: 本次请求的 (连接超时, 读超时)，决定并发槽位的租约时长
+    :return: 上下文变量为等待许可的耗时（ms）
+    """
+    if not deploy_env.rate_limit and not deploy_env.max_concurrency:
+        yield 0
+        return
+    start = time.time()
+    deadline = start + settings.TEST_PLT_PERMIT_TIMEOUT
+    r = store.client()
+    if deploy_env.rate_limit:
+        burst = max(deploy_env.rate_burst or deploy_env.rate_limit, 1)
+        wait = float(r.eval(TOKEN_BUCKET_LUA, 1, KEY_BUCKET % deploy_env.id,
+                            deploy_env.rate_limit, burst, settings.TEST_PLT_PERMIT_TIMEOUT))
+        if wait < 0:
+            raise PermitTimeout(deploy_env, f"超过限流 {deploy_env.rate_limit}次/秒")
+        time.sleep(wait)
+    holder = None
+    if deploy_env.max_concurrency:
+        holder = uuid.uuid4().hex
+        lease = timeouts.longest(timeout) + 30
+        while not r.eval(SEMAPHORE_LUA, 1, KEY_SEMAPHORE % deploy_env.id, deploy_env.max_concurrency, lease, holder):
+            if time.time() >= deadline:
+                raise PermitTimeout(deploy_env, f"超过并发上限 {deploy_env.max_concurrency}")
+            time.sleep(POLL_INTERVAL)
+    waited = (time.time() - start) * 1000
+    metrics.PERMIT_WAIT.labels(deploy_env.name).observe(waited / 1000)
+    try:
+        yield waited
+    finally:
+        if holder:
+            r.zrem(KEY_SEMAPHORE % deploy_env.id, holder)
@@ -0,0 +1,91 @@
+"""
+按接口自适应的超时时间：根据接口最近的执行耗时计算 p99 × 系数，限制在上下限之间，
+由周期任务刷新后缓存在 Redis 中；接口定义/用例接口上配置的超时时间优先
+
+取值顺序：用例接口.timeout > 接口定义.timeout > 自适应超时 > settings.TEST_PLT_API_TIMEOUT
+"""
+import logging
+from datetime import timedelta
+
+import redis
+from django.conf import settings
+from django.utils import timezone
+
+from test_plt.models import ApiDef, ApiRunLog, CaseApiDef
+from test_plt.utils import common, store
+
+KEY_TIMEOUTS = 'test_plt:timeouts'
+
+
+def connect_timeout():
+    return settings.TEST_PLT_API_TIMEOUT[0]
+
+
+def longest(timeout=None):
+    """
+    单次请求可能的最长耗时（秒），用于各类租约的时长
+    :param timeout: 本次请求使用的 (连接超时, 读超时)（见 resolve）；为空时取未配置超时的接口可能的最长耗时，
+                    接口定义/用例接口上配置的超时可能更长，知道本次请求的超时时应当传入
+    """
+    if timeout:
+        return sum(timeout)
+    return max(sum(settings.TEST_PLT_API_TIMEOUT), connect_timeout() + settings.TEST_PLT_TIMEOUT_CEILING)
+
+
+def compute(api_id):
+    """
+    根据接口最近成功执行的耗时计算读超时（秒）
+    :return: 样本不足时返回 None
+    """
+    since = timezone.now() - timedelta(days=settings.TEST_PLT_TIMEOUT_WINDOW_DAYS)
+    durations = list(ApiRunLog.objects.filter(api_id=api_id, success=True, start_at__gte=since,
+                                              duration__isnull=False)
+                     .order_by('-id').values_list('duration', flat=True)[:settings.TEST_PLT_TIMEOUT_SAMPLES])
+    if len(durations) < settings.TEST_PLT_TIMEOUT_MIN_SAMPLES:
+        return None
+    p99 = common.percentile(durations, 99) / 1000
+    return min(max(p99 * settings.TEST_PLT_TIMEOUT_FACTOR, settings.TEST_PLT_TIMEOUT_FLOOR),
+               settings.TEST_PLT_TIMEOUT_CEILING)
+
+
+def refresh():
+    """
+    重新计算最近有执行记录的接口的自适应超时，写入 Redis
+    :return: 刷新的接口数量
+    """
+    since = timezone.now() - timedelta(days=settings.TEST_PLT_TIMEOUT_WINDOW_DAYS)
+    api_ids = ApiRunLog.objects.filter(start_at__gte=since).values_list('api_id', flat=True).distinct()
+    timeouts = {}
+    for api_id in api_ids:
+        value = compute(api_id)
+        if value is not None:
+            timeouts[api_id] = round(value, 3)
+    r = store.client()
+    with r.pipeline() as pipe:
+        pipe.delete(KEY_TIMEOUTS)
+        if timeouts:
+            pipe.hset(KEY_TIMEOUTS, mapping=timeouts)
+        pipe.execute()
+    logging.getLogger('test_plt').info(f"自适应超时已刷新：{len(timeouts)}个接口")
+    return len(timeouts)
+
+
+def resolve(api: ApiDef, case_api: CaseApiDef = None):
+    """
+    接口本次执行使用的超时时间
+    :param api: 接口定义
+    :param case_api: 用例接口（在用例中执行时）
+    :return: (连接超时, 读超时)，单位秒
+    """
+    if case_api is not None and case_api.timeout:
+        return connect_timeout(), case_api.timeout
+    if api.timeout:
+        return connect_timeout(), api.timeout
+    if settings.TEST_PLT_ADAPTIVE_TIMEOUT:
+        try:
+            value = store.client().hget(KEY_TIMEOUTS, api.id)
+        except redis.RedisError:
+            value = None
+        if value:
+            return connect_timeout(), float(value)
+    return settings.TEST_PLT_API_TIMEOUT
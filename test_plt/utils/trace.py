@@ -0,0 +1,243 @@
+"""
+轻量级链路追踪：测试批次 → 套件 → 用例 → 接口 的层级 span
+
+span 的父子关系通过 contextvars 自动传递；跨 celery 任务时（如批次拆分为分片子任务），
+由提交方把 Span.context() 作为任务参数传递，子任务以 span(parent=...) 接续，提交方的 span 由汇总任务 close() 结束。
+导出方式由 settings.TEST_PLT_TRACE_EXPORTER 决定：
+    none -- 不导出（仍然会向被测系统传递 traceparent）
+    file -- 每个 span 结束时以 JSON Lines 追加写入 settings.TEST_PLT_TRACE_FILE
+    otlp -- 根 span（或父 span 在其他进程中的 span）结束时将本进程中的这部分链路以 OTLP/HTTP JSON 格式推送到 settings.TEST_PLT_TRACE_OTLP_ENDPOINT
+"""
+import contextvars
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+from django.conf import settings
+
+_current_span = contextvars.ContextVar('test_plt_current_span', default=None)
+_file_lock = threading.Lock()
+_otlp_lock = threading.Lock()
+_otlp_buffer = {}  # trace_id -> [span dict, ...]
+
+
+class Span:
+    def __init__(self, name, trace_id, parent_id=None, attributes=None, remote_parent=False):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        # 父 span 在其他进程（任务）中
+        self.remote_parent = remote_parent
+        self.attributes = dict(attributes or {})
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error_msg = None
+
+    def context(self):
+        """
+        跨任务传递的 span 上下文（可 JSON 序列化）
+        """
+        return {'name': self.name, 'trace_id': self.trace_id, 'span_id': self.span_id, 'start_ns': self.start_ns,
+                'attributes': self.attributes}
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def set_error(self, msg):
+        self.error_msg = str(msg)
+
+    def traceparent(self):
+        """
+        W3C Trace Context 格式的 traceparent 头，传递给被测系统以便后端链路对齐
+        """
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'start_ns': self.start_ns,
+            'end_ns': self.end_ns,
+            'error_msg': self.error_msg,
+            'attributes': self.attributes,
+        }
+
+
+def new_trace_id():
+    return secrets.token_hex(16)
+
+
+def current_span():
+    return _current_span.get()
+
+
+def start(name, **attributes):
+    """
+    创建一个新链路的根 span，不进入当前上下文；用于在一个任务中开始、由后续任务 close() 结束的 span
+    """
+    return Span(name, new_trace_id(), attributes=attributes)
+
+
+def close(context, error_msg=None):
+    """
+    结束并导出 start() 创建的 span
+    :param context: Span.context() 的返回值
+    :param error_msg: 错误消息
+    """
+    s = Span(context['name'], context['trace_id'], attributes=context['attributes'])
+    s.span_id = context['span_id']
+    s.start_ns = context['start_ns']
+    s.end_ns = time.time_ns()
+    if error_msg:
+        s.set_error(error_msg)
+    export(s)
+
+
+@contextmanager
+def span(name, trace_id=None, parent=None, **attributes):
+    """
+    开启一个子 span（没有父 span 时为根 span）
+    :param name: span 名称，如 test_batch / case / http
+    :param trace_id: 指定链路ID，缺省沿用父 span 的链路
+    :param parent: 其他任务中的父 span 上下文（Span.context() 的返回值），指定时忽略 trace_id
+    :param attributes: span 属性
+    """
+    if parent:
+        s = Span(name, parent['trace_id'], parent['span_id'], attributes, remote_parent=True)
+    else:
+        current = _current_span.get()
+        if not trace_id:
+            trace_id = current.trace_id if current else new_trace_id()
+        parent_id = current.span_id if current and current.trace_id == trace_id else None
+        s = Span(name, trace_id, parent_id, attributes)
+    token = _current_span.set(s)
+    try:
+        yield s
+    except Exception as e:
+        s.set_error(e)
+        raise
+    finally:
+        s.end_ns = time.time_ns()
+        _current_span.reset(token)
+        export(s)
+
+
+def export(s: Span):
+    exporter = settings.TEST_PLT_TRACE_EXPORTER
+    try:
+        if exporter == 'file':
+            _export_file(s)
+        elif exporter == 'otlp':
+            _export_otlp(s)
+    except Exception as e:
+        # 追踪数据导出失败不能影响用例执行
+        logging.getLogger('test_plt').warning(f"span 导出失败：{e}")
+
+
+def _export_file(s: Span):
+    line = json.dumps(s.to_dict(), ensure_ascii=False, default=str)
+    with _file_lock:
+        with open(settings.TEST_PLT_TRACE_FILE, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+
+
+def _export_otlp(s: Span):
+    with _otlp_lock:
+        _otlp_buffer.setdefault(s.trace_id, []).append(s)
+        if s.parent_id and not s.remote_parent:
+            return
+        spans = _otlp_buffer.pop(s.trace_id)
+    payload = {
+        'resourceSpans': [{
+            'resource': {'attributes': [_otlp_attr('service.name', 'auto_test_platform'),
+                                        _otlp_attr('process.pid', os.getpid())]},
+            'scopeSpans': [{
+                'scope': {'name': 'test_plt'},
+                'spans': [_otlp_span(i) for i in spans],
+            }],
+        }]
+    }
+    requests.post(settings.TEST_PLT_TRACE_OTLP_ENDPOINT, json=payload, timeout=5)
+
+
+def _otlp_attr(key, value):
+    if isinstance(value, bool):
+        return {'key': key, 'value': {'boolValue': value}}
+    if isinstance(value, int):
+        return {'key': key, 'value': {'intValue': str(value)}}
+    return {'key': key, 'value': {'stringValue': str(value)}}
+
+
+def _otlp_span(s: Span):
+    data = {
+        'traceId': s.trace_id,
+        'spanId': s.span_id,
+        'name': s.name,
+        'kind': 1,
+        'startTimeUnixNano': str(s.start_ns),
+        'endTimeUnixNano': str(s.end_ns),
+        'attributes': [_otlp_attr(k, v) for k, v in s.attributes.items()],
+        'status': {'code': 2, 'message': s.error_msg} if s.error_msg else {'code': 1},
+    }
+    if s.parent_id:
+        data['parentSpanId'] = s.parent_id
+    return data
+
+
+def load_spans(path, trace_id):
+    """
+    从 file 导出器写入的 JSON Lines 文件中读取一条链路的全部 span
+    """
+    result = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if trace_id not in line:
+                continue
+            item = json.loads(line)
+            if item.get('trace_id') == trace_id:
+                result.append(item)
+    return result
+
+
+def critical_path(spans):
+    """
+    关键路径分析：从根 span 的结束时刻往前回溯，每次选取在当前时刻之前最晚结束的子 span，
+    得到决定整体耗时的 span 链
+    :param spans: 同一条链路的 span 字典列表（见 Span.to_dict）
+    :return: [(span, 自身耗时ns), ...]，按开始时间排序
+    """
+    children = {}
+    root = None
+    for s in spans:
+        if s.get('parent_id'):
+            children.setdefault(s['parent_id'], []).append(s)
+        else:
+            root = s
+    if not root:
+        return []
+
+    path = []
+
+    def walk(node):
+        cursor = node['end_ns']
+        own = 0
+        kids = sorted(children.get(node['span_id'], []), key=lambda x: x['end_ns'], reverse=True)
+        for kid in kids:
+            if kid['end_ns'] > cursor:
+                continue
+            own += cursor - kid['end_ns']
+            walk(kid)
+            cursor = kid['start_ns']
+        own += max(cursor - node['start_ns'], 0)
+        path.append((node, own))
+
+    walk(root)
+    return sorted(path, key=lambda x: x[0]['start_ns'])
@@ -1,8 +1,18 @@
-from django.http import HttpResponseRedirect
+from django.http import HttpResponse, HttpResponseRedirect
 from django.shortcuts import render
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+from test_plt.utils import metrics as metrics_
 
 # Create your views here.
 
 
 def index(request):
-    return HttpResponseRedirect('/admin')
\ No newline at end of file
+    return HttpResponseRedirect('/admin')
+
+
+def metrics(request):
+    """
+    Prometheus 指标采集入口
+    """
+    return HttpResponse(generate_latest(metrics_.registry()), content_type=CONTENT_TYPE_LATEST)